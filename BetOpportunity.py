@@ -1,28 +1,44 @@
 from datetime import datetime, timezone, timedelta
 from BettingPlatform import BinaryMarket
+from bet_opportunity_returns import calculate_absolute_returns, calculate_annualized_returns
 from constants import *
+import numpy as np
 import logging
 
 
 class BetOpportunity:
 
-    def __init__(self, question : str, market_1 : BinaryMarket, market_2 : BinaryMarket, last_update : datetime, id :str):
+    def __init__(self, question : str, market_1 : BinaryMarket, market_2 : BinaryMarket, last_update : datetime, id :str,
+                 absolute_return : list[float] | None = None, annualized_return : list[float | None] | None = None):
         self.question = question
         self.id = id
         self.market_1 = market_1
         self.market_2 = market_2
         self.last_update = last_update
-        self.refresh_return_calculations()
+        # returns are calculated lazily (or in bulk by refresh_return_calculations) rather than on construction
+        self._absolute_return = absolute_return
+        self._annualized_return = annualized_return
 
     def __str__(self) -> str:
         return (f"Bet Opportunity on Question: {self.question}\n"
                 f"BettingPlatform 1:\n{self.market_1}\n\n"
                 f"BettingPlatform 2:\n{self.market_2}\n\n")
-    
+
+    @property
+    def absolute_return(self) -> list[float]:
+        if self._absolute_return is None:
+            self.refresh_return_calculations()
+        return self._absolute_return #type: ignore
+
+    @property
+    def annualized_return(self) -> list[float | None]:
+        if self._annualized_return is None:
+            self.refresh_return_calculations()
+        return self._annualized_return #type: ignore
+
     def refresh_return_calculations(self):
-        self.absolute_return  : list[float] = self.calculate_absolute_return(1,1)
-        self.annualized_return : list[float | None] = self.calculate_annualized_return(1,1)
-    
+        refresh_return_calculations([self])
+
     def calculate_absolute_return(self, yes_contracts : int, no_contracts : int) -> list[float]:
         """calculates the absolute return for the binary market bet opportunity
 
@@ -30,38 +46,18 @@ class BetOpportunity:
             yes_contracts (int): number of yes contracts to purchase
             no_contracts (int): number of no contracts to purchase
 
-        Raises:
-            ValueError: if incomplete data
-
         Returns:
-            List[float, float]: absolute return if market resolves to yes, absolute return if market resolves to no   
+            List[float, float]: absolute return if market resolves to yes, absolute return if market resolves to no
         """
-        market_1_yes_ask = self.market_1.yes_ask
-        market_2_yes_ask = self.market_2.yes_ask
-        market_1_no_ask = self.market_1.no_ask
-        market_2_no_ask = self.market_2.no_ask
-        best_yes_price = min(market_1_yes_ask, market_2_yes_ask)
-        best_no_price = min(market_1_no_ask, market_2_no_ask)
-        investment = best_yes_price*yes_contracts + best_no_price*no_contracts
-        return  [yes_contracts / investment - 1, no_contracts / investment - 1]  
-    
+        yes_asks, no_asks = get_ask_arrays([self])
+        return calculate_absolute_returns(yes_asks[0], no_asks[0], yes_asks[1], no_asks[1], yes_contracts, no_contracts)[0].tolist()
+
     def calculate_annualized_return(self, yes_contracts : int, no_contracts : int) -> list[float | None]:
-        yes_return, no_return = self.calculate_absolute_return(yes_contracts, no_contracts)
-        latest_close_time = min(self.market_1.end_date, self.market_2.end_date)  #optimistically uses the earlier of the two markets
-        now = datetime.now().astimezone(timezone.utc)
-        
-        difference = latest_close_time.timestamp() - now.timestamp()
-        result = MS_IN_ONE_YEAR / difference
-        try:
-            yes_return_annualized = (1+yes_return)**result - 1
-            no_return_annualized = (1+no_return)**result - 1
-        except OverflowError:
-            logging.info(f"Overflow error for yes / no return: {yes_return}/{no_return} and annualization exponent of {result}")
-            return [None, None]
-        if isinstance(yes_return_annualized, complex) or isinstance(yes_return_annualized, complex):
-            return [None, None]
-        return [yes_return_annualized, no_return_annualized]
-    
+        yes_asks, no_asks = get_ask_arrays([self])
+        absolute_returns = calculate_absolute_returns(yes_asks[0], no_asks[0], yes_asks[1], no_asks[1], yes_contracts, no_contracts)
+        annualized_returns = calculate_annualized_returns(absolute_returns, get_close_times([self]))
+        return to_optional_floats(annualized_returns[0])
+
     def to_json(self):
         return {
             'question': self.question,
@@ -84,5 +80,40 @@ class BetOpportunity:
             market_1=market_1,
             market_2=market_2,
             last_update=last_update,
-            id = data["id"]
-        )
\ No newline at end of file
+            id = data["id"],
+            absolute_return = data.get("absolute_return"),
+            annualized_return = data.get("annualized_return")
+        )
+
+def get_ask_arrays(bet_opportunities : list[BetOpportunity]) -> tuple[np.ndarray, np.ndarray]:
+    """Gets the yes and no asks of each market of a list of bet opportunities as 2 x n arrays (market 1 row, market 2 row)"""
+    yes_asks = np.array([[bo.market_1.yes_ask for bo in bet_opportunities], [bo.market_2.yes_ask for bo in bet_opportunities]], dtype = np.float64)
+    no_asks = np.array([[bo.market_1.no_ask for bo in bet_opportunities], [bo.market_2.no_ask for bo in bet_opportunities]], dtype = np.float64)
+    return yes_asks, no_asks
+
+def get_close_times(bet_opportunities : list[BetOpportunity]) -> np.ndarray:
+    """Gets the close time of each bet opportunity as epoch seconds, optimistically using the earlier of the two markets"""
+    return np.array([min(bo.market_1.end_date, bo.market_2.end_date).timestamp() for bo in bet_opportunities], dtype = np.float64)
+
+def to_optional_floats(values : np.ndarray) -> list[float | None]:
+    return [None if np.isnan(v) else v for v in values.tolist()]
+
+def refresh_return_calculations(bet_opportunities : list[BetOpportunity], now : datetime | None = None) -> None:
+    """Recalculates the absolute and annualized returns of many bet opportunities in a single vectorized pass
+
+    Args:
+        bet_opportunities (list[BetOpportunity]): bet opportunities to update
+        now (datetime | None, optional): time to annualize returns from, shared by every bet opportunity. Defaults to the current time.
+    """
+    if not bet_opportunities:
+        return
+    now = now or datetime.now(timezone.utc)
+    yes_asks, no_asks = get_ask_arrays(bet_opportunities)
+    absolute_returns = calculate_absolute_returns(yes_asks[0], no_asks[0], yes_asks[1], no_asks[1])
+    annualized_returns = calculate_annualized_returns(absolute_returns, get_close_times(bet_opportunities), now.timestamp())
+    invalid = np.isnan(annualized_returns[:, 0])
+    if invalid.any():
+        logging.info(f"Could not annualize returns for {int(invalid.sum())} bet opportunities")
+    for bo, absolute_return, annualized_return in zip(bet_opportunities, absolute_returns.tolist(), annualized_returns):
+        bo._absolute_return = absolute_return
+        bo._annualized_return = to_optional_floats(annualized_return)
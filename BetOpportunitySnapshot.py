@@ -0,0 +1,268 @@
+import json
+import base64
+import numpy as np
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Sequence, TypedDict
+from BetOpportunityStore import get_parity_returns
+from utils import parse_timestamp
+from constants import *
+
+def resolve_sort_key(sort : str | BetOpportunitySortKey | None) -> BetOpportunitySortKey | None:
+    """Gets the sort key named by a request, accepting either the enum value (e.g. "parity return") or its name (e.g. "parity_return")
+
+    Raises:
+        ValueError: if sort is not a BetOpportunitySortKey value or name
+    """
+    if sort is None or isinstance(sort, BetOpportunitySortKey):
+        return sort
+    try:
+        return BetOpportunitySortKey(sort)
+    except ValueError:
+        pass
+    if sort in BetOpportunitySortKey.__members__:
+        return BetOpportunitySortKey[sort]
+    raise ValueError(f"Unknown sort {sort}, expected one of {[key.value for key in BetOpportunitySortKey]}")
+
+# fields of BetOpportunity.to_json and of the BinaryMarket.to_json of each market, which can be projected as market_1.<field>
+BET_OPPORTUNITY_FIELDS = ["question", "id", "market_1", "market_2", "absolute_return", "annualized_return", "last_update"]
+
+BINARY_MARKET_FIELDS = ["platform", "question", "id", "yes_id", "no_id", "yes_ask", "no_ask", "yes_bid", "no_bid", "end_date",
+                        "description", "can_close_early"]
+
+# distinct field projections a snapshot keeps serialized json for
+SNAPSHOT_MAX_PROJECTIONS = 32
+
+def parse_fields(fields : str) -> tuple[str, ...]:
+    """Parses a comma separated projection such as "id,absolute_return,market_1.yes_ask"
+
+    Raises:
+        ValueError: if a field is not a bet opportunity or market field
+    """
+    parsed = tuple(field.strip() for field in fields.split(",") if field.strip())
+    for field in parsed:
+        market, _, market_field = field.partition(".")
+        if field not in BET_OPPORTUNITY_FIELDS and not (market in ("market_1", "market_2") and market_field in BINARY_MARKET_FIELDS):
+            raise ValueError(f"Unknown field {field}")
+    if not parsed:
+        raise ValueError("fields must name at least one field")
+    return parsed
+
+def project_document(document : dict, fields : Sequence[str]) -> dict:
+    """Keeps only the given fields of a bet opportunity document, where market_1.<field> keeps one field of a market"""
+    projected : dict = {}
+    for field in fields:
+        market, _, market_field = field.partition(".")
+        if not market_field:
+            projected[field] = document[field]
+        elif market not in fields:
+            # a market asked for whole is kept whole rather than narrowed to some of its fields
+            projected.setdefault(market, {})[market_field] = document[market][market_field]
+    return projected
+
+class BetOpportunityFilters(TypedDict, total = False):
+    min_return : float # minimum summed absolute return
+    min_annualized_return : float # minimum summed annualized return, bet opportunities that can't be annualized never match
+    platforms : tuple[str, str] # platforms of the two markets, in either order
+    end_date_after : datetime # earliest close, where a bet opportunity closes when the first of its markets does
+    end_date_before : datetime # latest close
+    max_staleness : float # maximum seconds since last_update
+
+class ExpiredCursorError(ValueError):
+    """Raised for a cursor made on a snapshot that is no longer kept"""
+
+def encode_cursor(version : int, sort : BetOpportunitySortKey | None, value : float, id : str) -> str:
+    """Encodes the position after the bet opportunity with the given sort value and id in the snapshot at version as an opaque
+    url safe string"""
+    payload = json.dumps([version, None if sort is None else sort.value, value, id], separators = (",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor : str) -> tuple[int, BetOpportunitySortKey | None, float, str]:
+    """Decodes a cursor made by encode_cursor into its snapshot version, sort, sort value and id
+
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    try:
+        version, sort, value, id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(version), resolve_sort_key(sort), float(value), str(id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor {cursor}") from e
+
+class BetOpportunitySnapshot:
+    """Immutable in-memory copy of the stored bet opportunity documents at one store version.
+
+    Each document is serialized to json once, the returns, platforms, close time and last update of every bet opportunity
+    are kept as arrays that filters are evaluated against, and every sort in BET_OPPORTUNITIES_SORT is precomputed as an
+    array of positions, so reading a page is a mask and a slice rather than a parse and a sort.
+
+    Sorted orders put the highest return first and break ties by id, so (sort value, id) is a total order that cursors
+    resume from. Cursors also carry the snapshot version and are only followed on the snapshot they were made on, since a
+    refresh can move a return across a cursor, which would skip or repeat bet opportunities.
+    """
+
+    def __init__(self, version : int, documents : Sequence[dict]):
+        self.version = version
+        self.documents = list(documents)
+        self.serialized = [json.dumps(bo) for bo in self.documents]
+        self.projections : dict[tuple[str, ...], dict[int, str]] = {}
+        self.positions = {bo["id"] : i for i, bo in enumerate(self.documents)}
+        self.ids = np.array([bo["id"] for bo in self.documents], dtype = str)
+        self.market_1_platforms = np.array([bo["market_1"]["platform"] for bo in self.documents], dtype = str)
+        self.market_2_platforms = np.array([bo["market_2"]["platform"] for bo in self.documents], dtype = str)
+        self.close_times = np.array([min(parse_timestamp(bo["market_1"]["end_date"]), parse_timestamp(bo["market_2"]["end_date"])).timestamp()
+                                     for bo in self.documents], dtype = np.float64)
+        self.last_updates = np.array([parse_timestamp(bo["last_update"]).timestamp() for bo in self.documents], dtype = np.float64)
+        parity_returns = [get_parity_returns(bo) for bo in self.documents]
+        self.returns : dict[BetOpportunitySortKey, np.ndarray] = {}
+        for i, sort_key in enumerate([BetOpportunitySortKey.parity_return, BetOpportunitySortKey.parity_return_annualized]):
+            self.returns[sort_key] = np.array([np.nan if returns[i] is None else returns[i] for returns in parity_returns], dtype = np.float64)
+
+        # cursor pages without a sort go by id
+        self.sort_values : dict[BetOpportunitySortKey | None, np.ndarray] = {None : np.zeros(len(self.documents))}
+        for sort_key, values in self.returns.items():
+            # bet opportunities without a return sort as -1
+            self.sort_values[sort_key] = np.where(np.isnan(values), -1, values)
+        self.cursor_orders = {sort_key : np.lexsort((self.ids, -values)) for sort_key, values in self.sort_values.items()}
+        # (-value, id) of each position of the cursor orders, both ascending, to binary search for where a cursor resumes
+        self.cursor_keys = {sort_key : (-self.sort_values[sort_key][order], self.ids[order]) for sort_key, order in self.cursor_orders.items()}
+        self.orders = {**self.cursor_orders, None : np.arange(len(self.documents))}
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def get_order(self, sort : BetOpportunitySortKey | None) -> np.ndarray:
+        """Gets the positions of the bet opportunities in sorted order. Sorts that need orderbooks keep the saved order"""
+        return self.orders[sort if sort in BET_OPPORTUNITIES_SORT else None]
+
+    def get_mask(self, filters : BetOpportunityFilters | None, now : datetime | None = None) -> np.ndarray | None:
+        """Gets which bet opportunities match every filter, None if there are no filters"""
+        if not filters:
+            return None
+        mask = np.ones(len(self.documents), dtype = bool)
+        if "min_return" in filters:
+            mask &= self.returns[BetOpportunitySortKey.parity_return] >= filters["min_return"]
+        if "min_annualized_return" in filters:
+            mask &= self.returns[BetOpportunitySortKey.parity_return_annualized] >= filters["min_annualized_return"]
+        if "platforms" in filters:
+            platform_1, platform_2 = filters["platforms"]
+            mask &= (((self.market_1_platforms == platform_1) & (self.market_2_platforms == platform_2)) |
+                     ((self.market_1_platforms == platform_2) & (self.market_2_platforms == platform_1)))
+        if "end_date_after" in filters:
+            mask &= self.close_times >= filters["end_date_after"].timestamp()
+        if "end_date_before" in filters:
+            mask &= self.close_times <= filters["end_date_before"].timestamp()
+        if "max_staleness" in filters:
+            now = now or datetime.now(timezone.utc)
+            mask &= self.last_updates >= now.timestamp() - filters["max_staleness"]
+        return mask
+
+    def query(self, sort : BetOpportunitySortKey | None = None, filters : BetOpportunityFilters | None = None, start : int = 0,
+              stop : int | None = None, now : datetime | None = None) -> tuple[list[int], int]:
+        """Gets a page of the bet opportunities matching the filters by offset
+
+        Args:
+            sort (BetOpportunitySortKey | None, optional): order of the bet opportunities, saved order if None
+            filters (BetOpportunityFilters, optional): filters every bet opportunity on the page matches
+            start (int, optional): offset of the first bet opportunity of the page among the matching ones
+            stop (int | None, optional): offset after the last bet opportunity of the page, the end if None
+            now (datetime | None, optional): time max_staleness is measured from. Defaults to the current time.
+
+        Returns:
+            tuple[list[int], int]: positions of the bet opportunities on the page and the number of matching bet opportunities
+        """
+        order = self.get_order(sort)
+        mask = self.get_mask(filters, now)
+        if mask is not None:
+            order = order[mask[order]]
+        return order[start:stop].tolist(), len(order)
+
+    def query_after(self, sort : BetOpportunitySortKey | None = None, filters : BetOpportunityFilters | None = None, cursor : str | None = None,
+                    limit : int = 10, now : datetime | None = None) -> tuple[list[int], str | None]:
+        """Gets a page of the bet opportunities matching the filters that come after a cursor
+
+        Args:
+            sort (BetOpportunitySortKey | None, optional): order of the bet opportunities, by id if None or a sort that needs orderbooks
+            filters (BetOpportunityFilters, optional): filters every bet opportunity on the page matches
+            cursor (str | None, optional): cursor returned with the previous page, the first page if None
+            limit (int, optional): maximum bet opportunities on the page
+            now (datetime | None, optional): time max_staleness is measured from. Defaults to the current time.
+
+        Raises:
+            ValueError: if the cursor is malformed or was made for a different sort or snapshot version
+
+        Returns:
+            tuple[list[int], str | None]: positions of the bet opportunities on the page and the cursor of the next page, None on the last page
+        """
+        sort = sort if sort in BET_OPPORTUNITIES_SORT else None
+        order = self.cursor_orders[sort]
+        start = 0
+        if cursor is not None:
+            version, cursor_sort, value, id = decode_cursor(cursor)
+            if version != self.version:
+                raise ValueError(f"Cursor was made for snapshot version {version}, not {self.version}")
+            if (cursor_sort if cursor_sort in BET_OPPORTUNITIES_SORT else None) != sort:
+                raise ValueError(f"Cursor was made for sort {cursor_sort}, not {sort}")
+            # the page starts after every position at or before (-value, id), whether or not the cursor's bet opportunity still exists
+            sorted_values, sorted_ids = self.cursor_keys[sort]
+            lo, hi = np.searchsorted(sorted_values, -value, side = "left"), np.searchsorted(sorted_values, -value, side = "right")
+            start = int(lo + np.searchsorted(sorted_ids[lo:hi], id, side = "right"))
+        order = order[start:]
+        mask = self.get_mask(filters, now)
+        if mask is not None:
+            order = order[mask[order]]
+        page = order[:limit].tolist()
+        if len(order) <= limit or not page:
+            return page, None
+        last = page[-1]
+        return page, encode_cursor(self.version, sort, float(self.sort_values[sort][last]), str(self.ids[last]))
+
+    def get_documents(self, sort : BetOpportunitySortKey | None = None, start : int = 0, stop : int | None = None) -> list[dict]:
+        return [self.documents[i] for i in self.get_order(sort)[start:stop].tolist()]
+
+    def get_serialized(self, positions : Sequence[int], fields : tuple[str, ...] | None = None) -> list[str]:
+        """Gets the json of the bet opportunities at the given positions, each serialized once per projection
+
+        Args:
+            positions (Sequence[int]): positions of the bet opportunities
+            fields (tuple[str, ...] | None, optional): fields to keep, as parsed by parse_fields. Keeps every field if None.
+        """
+        if fields is None:
+            return [self.serialized[i] for i in positions]
+        if fields not in self.projections and len(self.projections) >= SNAPSHOT_MAX_PROJECTIONS:
+            self.projections.clear()
+        serialized = self.projections.setdefault(fields, {})
+        for i in positions:
+            if i not in serialized:
+                serialized[i] = json.dumps(project_document(self.documents[i], fields))
+        return [serialized[i] for i in positions]
+
+class SnapshotHistory:
+    """The most recent snapshots by version, so cursor scrolls page through the snapshot they started on"""
+
+    def __init__(self, max_versions : int = SNAPSHOT_CURSOR_VERSIONS):
+        self.max_versions = max_versions
+        self.snapshots : OrderedDict[int, BetOpportunitySnapshot] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, snapshot : BetOpportunitySnapshot) -> None:
+        with self.lock:
+            self.snapshots[snapshot.version] = snapshot
+            while len(self.snapshots) > self.max_versions:
+                self.snapshots.popitem(last = False)
+
+    def get_for_cursor(self, cursor : str) -> BetOpportunitySnapshot:
+        """Gets the snapshot a cursor was made on
+
+        Raises:
+            ExpiredCursorError: if the snapshot is no longer kept
+            ValueError: if the cursor is malformed
+        """
+        version = decode_cursor(cursor)[0]
+        with self.lock:
+            snapshot = self.snapshots.get(version)
+        if snapshot is None:
+            raise ExpiredCursorError(f"Cursor is for bet opportunities at version {version}, which are no longer kept after later "
+                                     f"refreshes. Start the scroll again without a cursor")
+        return snapshot
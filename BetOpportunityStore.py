@@ -0,0 +1,171 @@
+import sqlite3
+import json
+import os
+import logging
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+from constants import *
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bet_opportunities (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    market_1_id TEXT NOT NULL,
+    market_2_id TEXT NOT NULL,
+    parity_return REAL,
+    parity_return_annualized REAL,
+    last_update TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bet_opportunities_position ON bet_opportunities (position);
+CREATE INDEX IF NOT EXISTS bet_opportunities_parity_return ON bet_opportunities (parity_return);
+CREATE INDEX IF NOT EXISTS bet_opportunities_parity_return_annualized ON bet_opportunities (parity_return_annualized);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0');
+"""
+
+# rows are only rewritten when their document or position changed
+UPSERT = """
+INSERT INTO bet_opportunities (id, position, question, market_1_id, market_2_id, parity_return, parity_return_annualized, last_update, data)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    position = excluded.position,
+    question = excluded.question,
+    market_1_id = excluded.market_1_id,
+    market_2_id = excluded.market_2_id,
+    parity_return = excluded.parity_return,
+    parity_return_annualized = excluded.parity_return_annualized,
+    last_update = excluded.last_update,
+    data = excluded.data
+WHERE excluded.data != bet_opportunities.data OR excluded.position != bet_opportunities.position
+"""
+
+def get_parity_returns(bet_opportunity : dict) -> tuple[float | None, float | None]:
+    """Gets the summed absolute and annualized returns of a bet opportunity document, None where a return is missing"""
+    absolute_return = bet_opportunity.get("absolute_return")
+    annualized_return = bet_opportunity.get("annualized_return")
+    parity_return = sum(absolute_return) if absolute_return and all(isinstance(x, (int, float)) for x in absolute_return) else None
+    parity_return_annualized = sum(annualized_return) if annualized_return and all(isinstance(x, (int, float)) for x in annualized_return) else None
+    return parity_return, parity_return_annualized
+
+class BetOpportunityStore:
+    """SQLite store of bet opportunity documents (BetOpportunity.to_json) keyed by id.
+
+    Returns are also kept in indexed columns so the store can be queried by them, and a version number is bumped on every
+    write that changes a row so readers can tell when their copy is stale.
+    """
+
+    def __init__(self, filepath : str = BET_OPPORTUNITIES_DB_PATH):
+        self.filepath = filepath
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        """Opens a connection whose changes are committed as one transaction, or rolled back on error, and closed afterwards.
+        A connection per operation keeps the store safe to share across request threads."""
+        conn = sqlite3.connect(self.filepath, timeout = 30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_version(self) -> int:
+        with self.connect() as conn:
+            return int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+    def bump_version(self, conn : sqlite3.Connection) -> None:
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+    def __len__(self) -> int:
+        with self.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM bet_opportunities").fetchone()[0]
+
+    def get_all(self) -> list[dict]:
+        """Gets every bet opportunity document in the order they were saved"""
+        with self.connect() as conn:
+            return [json.loads(data) for (data,) in conn.execute("SELECT data FROM bet_opportunities ORDER BY position")]
+
+    def get_all_with_version(self) -> tuple[int, list[dict]]:
+        """Gets the version and every bet opportunity document, read in one transaction so the documents are exactly that version"""
+        with self.connect() as conn:
+            conn.execute("BEGIN")
+            version = int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+            return version, [json.loads(data) for (data,) in conn.execute("SELECT data FROM bet_opportunities ORDER BY position")]
+
+    def get(self, id : str) -> dict | None:
+        """Gets one bet opportunity document by id, None if there is no such bet opportunity"""
+        with self.connect() as conn:
+            row = conn.execute("SELECT data FROM bet_opportunities WHERE id = ?", (id,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def save_all(self, bet_opportunities : Iterable[dict]) -> int:
+        """Replaces the stored bet opportunities in a single transaction, only writing rows that were added or changed
+
+        Args:
+            bet_opportunities (Iterable[dict]): every current bet opportunity document, in order
+
+        Returns:
+            int: number of rows added, changed or deleted
+        """
+        rows = []
+        for position, bo in enumerate(bet_opportunities):
+            parity_return, parity_return_annualized = get_parity_returns(bo)
+            rows.append((bo["id"], position, bo["question"], bo["market_1"]["id"], bo["market_2"]["id"],
+                         parity_return, parity_return_annualized, bo["last_update"], json.dumps(bo)))
+        with self.connect() as conn:
+            conn.execute("CREATE TEMP TABLE current_ids (id TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO current_ids (id) VALUES (?)", [(row[0],) for row in rows])
+            deleted = conn.execute("DELETE FROM bet_opportunities WHERE id NOT IN (SELECT id FROM current_ids)").rowcount
+            before = conn.total_changes
+            conn.executemany(UPSERT, rows)
+            changed = deleted + conn.total_changes - before
+            conn.execute("DROP TABLE current_ids")
+            if changed:
+                self.bump_version(conn)
+        logging.info(f"Saved {len(rows)} bet opportunities to {self.filepath}, {changed} rows changed")
+        return changed
+
+    def delete(self, id : str) -> bool:
+        """Deletes a bet opportunity by id, returning whether it existed"""
+        with self.connect() as conn:
+            found = conn.execute("DELETE FROM bet_opportunities WHERE id = ?", (id,)).rowcount > 0
+            if found:
+                self.bump_version(conn)
+        return found
+
+    def migrate_from_json(self, json_filepath : str) -> bool:
+        """Imports bet opportunities saved as a json list by earlier versions. Runs once per store and only into an empty store
+
+        Args:
+            json_filepath (str): json file of bet opportunity documents
+
+        Returns:
+            bool: whether anything was imported
+        """
+        with self.connect() as conn:
+            migrated = conn.execute("SELECT value FROM meta WHERE key = 'migrated_from_json'").fetchone()
+        if migrated or not os.path.exists(json_filepath):
+            return False
+        with open(json_filepath, "r") as f:
+            bet_opportunities = json.load(f)
+        imported = len(self) == 0
+        if imported:
+            self.save_all(bet_opportunities)
+            logging.info(f"Migrated {len(bet_opportunities)} bet opportunities from {json_filepath}")
+        with self.connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', ?)", (json_filepath,))
+        return imported
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    BetOpportunityStore().migrate_from_json(BET_OPPORTUNITIES_JSON_PATH + ACTIVE_BET_OPPORTUNITIES_JSON_FILENAME)
@@ -1,9 +1,12 @@
 import requests #type: ignore
 import json
-from typing import TypedDict, Tuple, List, Any
-from dateutil import parser #type: ignore
+from typing import TypedDict, Tuple, List, Any, Callable
 from datetime import datetime, timezone
-from OrderBook import OrderBook, Order, OrderbookData
+from OrderBook import OrderBook, Order, OrderbookData, PriceLevels, get_complementary_orderbooks
+from utils import parse_timestamp, parse_platform_timestamp, CANONICAL_TIMESTAMP_FORMAT
+from MarketStream import MarketFeed, KalshiFeed, PolymarketFeed
+from BinaryMarketMetadata import BinaryMarketMetadata
+from MarketSnapshot import MarketSnapshot, get_snapshot_path, to_epoch_microseconds, from_epoch_microseconds, SNAPSHOT_STRING_COLUMNS
 from constants import *
 from external_apis.kalshi import KalshiAPI
 from dotenv import load_dotenv
@@ -37,48 +40,6 @@ def valid_prices(yes_ask : float,
             break
     return valid_prices
 
-class BinaryMarketMetadata:
-    def __init__(self,
-        platform : str,
-        question : str,
-        id : str,
-        yes_id : str | None,
-        no_id : str | None,
-        description : str,
-        end_date : datetime
-    ): 
-        self.platform = platform
-        self.question = question
-        self.id = id
-        self.yes_id = yes_id
-        self.no_id = no_id
-        self.description = description
-        self.end_date = end_date
-    # Method to convert the object to a JSON-compatible dictionary
-    def to_json(self) -> dict:
-        return {
-            'platform': self.platform,
-            'question': self.question,
-            'id': self.id,
-            'yes_id': self.yes_id,
-            'no_id': self.no_id,
-            'description' : self.description,
-            'end_date' : self.end_date.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-        }
-
-    # Method to instantiate a BinaryMarket object from a dictionary
-    @classmethod
-    def from_json(cls, data):
-        return cls(
-            platform=data['platform'],
-            question=data['question'],
-            id=data['id'],
-            yes_id=data.get('yes_id'),
-            no_id=data.get('no_id'),
-            description = data.get('description'),
-            end_date = parser.parse(data.get("end_date")).astimezone(timezone.utc)
-        )
-
 class BinaryMarket:
     def __init__(
             self,
@@ -126,7 +87,7 @@ class BinaryMarket:
             'no_ask': self.no_ask,
             'yes_bid': self.yes_bid,
             'no_bid': self.no_bid,
-            'end_date' : self.end_date.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            'end_date' : self.end_date.strftime(CANONICAL_TIMESTAMP_FORMAT),
             'description' : self.description,
             'can_close_early' : self.can_close_early
         }
@@ -144,17 +105,20 @@ class BinaryMarket:
             no_ask=data.get('no_ask'),
             yes_bid=data.get('yes_bid'),
             no_bid=data.get('no_bid'),
-            end_date = parser.parse(data.get("end_date")).astimezone(timezone.utc),
+            end_date = parse_timestamp(data["end_date"]),
             description = data.get('description'),
             can_close_early = data.get('can_close_early')
         )
         
 class BettingPlatform:
-    def get_batch_market_data(self, data : (List[BinaryMarketMetadata] | List[BinaryMarket]) ) -> List[BinaryMarket]:
+    def get_batch_market_data(self, data : (List[BinaryMarketMetadata] | List[BinaryMarket]),
+                              progress : Callable[[int, int], None] | None = None) -> List[BinaryMarket]:
         """Given a list of binary market metadata objects, returns a list of binary market data objects containing the metadata plus latest market data
 
         Args:
             data (List[BinaryMarketMetadata]): array of metadata binary markets
+            progress (Callable[[int, int], None] | None, optional): called after each request with the number of items
+                fetched so far and the total number of items to fetch
 
         Returns:
             List[BinaryMarket]: array of binary market data containing latest market data
@@ -182,11 +146,36 @@ class BettingPlatform:
             tuple[OrderBook, OrderBook]: yes orderbook, no orderbook
         """
         raise NotImplementedError("Subclasses must implement this method")
+
+    def get_market_feed(self) -> MarketFeed:
+        """Gets the websocket feed that streams this platform's orderbooks"""
+        raise NotImplementedError("Subclasses must implement this method")
     
-    def save_active_markets(self, filename:str, n: int | None) -> None:
+    def save_active_markets(self, filename:str, n: int | None, export_json : bool = False) -> None:
+        """Saves the active markets as a columnar snapshot next to filename (see get_snapshot_path)
+
+        Args:
+            filename (str): question data json filepath
+            n (int | None): optional limit for testing purposes
+            export_json (bool, optional): also write the markets to filename as json. Defaults to False.
+        """
         all_markets = self.get_active_markets(n)
-        with open(filename, 'w') as json_file:
-            json.dump([a.to_json() for a in all_markets], json_file, indent = 4)
+        save_market_snapshot(all_markets, get_snapshot_path(filename))
+        if export_json:
+            with open(filename, 'w') as json_file:
+                json.dump([a.to_json() for a in all_markets], json_file, indent = 4)
+
+def save_market_snapshot(markets : List[BinaryMarketMetadata], snapshot_path : str) -> None:
+    columns = {name : [getattr(m, name) for m in markets] for name in SNAPSHOT_STRING_COLUMNS}
+    MarketSnapshot.write(snapshot_path, columns, [to_epoch_microseconds(m.end_date) for m in markets])
+
+def read_market_snapshot(snapshot_path : str) -> List[BinaryMarketMetadata]:
+    """Reads every market of a columnar snapshot written by save_market_snapshot"""
+    snapshot = MarketSnapshot(snapshot_path)
+    columns = [snapshot.column(name).to_list() for name in SNAPSHOT_STRING_COLUMNS]
+    end_dates = [from_epoch_microseconds(x) for x in snapshot.end_dates.tolist()]
+    return [BinaryMarketMetadata(platform, question, id, yes_id, no_id, description, end_date) #type: ignore
+            for platform, question, id, yes_id, no_id, description, end_date in zip(*columns, end_dates)]
 
 class BookParams(TypedDict):
     token_id : str
@@ -204,25 +193,25 @@ class Polymarket(BettingPlatform):
                 out.append({"token_id" : t, "side" : side})
         return out
     
+    def get_book(self, token_id : str) -> OrderbookData:
+        params = {
+            "token_id" : token_id
+        }
+        response = requests.get(POLYMARKET_ENDPOINT + "book", params = params)
+        response_dict = json.loads(response.text)
+        bids : list[Order] = [{"price" : float(x["price"]), "size" : float(x["size"])} for x in response_dict["bids"]]
+        asks  : list[Order] = [{"price" : float(x["price"]), "size" : float(x["size"])} for x in response_dict["asks"]]
+        return {
+            "bids" : bids,
+            "asks" : asks
+        }
+
     def get_orderbooks(self, data : (BinaryMarketMetadata | BinaryMarket)) -> list[OrderBook]:
         #TBU
-        
-        out = []
-        for id in [data.yes_id, data.no_id]:
-            params = {
-                "token_id" : id
-            }
-            response = requests.get(POLYMARKET_ENDPOINT + "book", params = params)
-            response_dict = json.loads(response.text)
-            bids : list[Order] = [{"price" : float(x["price"]), "size" : float(x["size"])} for x in response_dict["bids"]]
-            asks  : list[Order] = [{"price" : float(x["price"]), "size" : float(x["size"])} for x in response_dict["asks"]]
-            orderbook_data : OrderbookData = {
-                "bids" : bids,
-                "asks" : asks
-            }
-            out.append(OrderBook(orderbook_data))
+        return [OrderBook(self.get_book(id)) for id in [data.yes_id, data.no_id]] #type: ignore
 
-        return out
+    def get_market_feed(self) -> MarketFeed:
+        return PolymarketFeed(self.get_book)
 
 
     def get_prices(self, token_ids : List[str]) -> List[Tuple[float | None,float | None]]:
@@ -240,18 +229,22 @@ class Polymarket(BettingPlatform):
                     out.append((None, None))
         return out
 
-    def get_batch_market_data(self, data : List[BinaryMarketMetadata]) -> List[BinaryMarket]:
+    def get_batch_market_data(self, data : List[BinaryMarketMetadata], progress : Callable[[int, int], None] | None = None) -> List[BinaryMarket]:
         yes_ids : List[str] = [x.yes_id for x in data] #type: ignore 
         no_ids : List[str] = [x.no_id for x in data] #type: ignore
         yes_prices = []
         for i in range(0,len(yes_ids), POLYMARKET_REQUEST_LIMIT):
             ids = yes_ids[i:i+POLYMARKET_REQUEST_LIMIT]
             yes_prices.extend(self.get_prices(ids))
+            if progress:
+                progress(len(yes_prices), len(yes_ids) + len(no_ids))
 
         no_prices = []
         for i in range(0,len(no_ids), POLYMARKET_REQUEST_LIMIT):
             ids = no_ids[i:i+POLYMARKET_REQUEST_LIMIT]
             no_prices.extend(self.get_prices(ids))
+            if progress:
+                progress(len(yes_prices) + len(no_prices), len(yes_ids) + len(no_ids))
         
         out : List[BinaryMarket] = []
         for i in range(len(data)):
@@ -296,7 +289,7 @@ class Polymarket(BettingPlatform):
                 for market in response["data"]:
                     end_date = market["end_date_iso"]
                     if end_date != None:
-                        end_date = parser.parse(market["end_date_iso"]).astimezone(timezone.utc)
+                        end_date = parse_platform_timestamp(market["end_date_iso"])
                         if question_count == n:
                             return questions
                         #check if end date is after now
@@ -331,26 +324,20 @@ class Kalshi(BettingPlatform):
         try:
             response = self.api.get_market_orderbook(ticker = data.id)
             
-            yes_bids_response = response["orderbook"]["yes"]
-            no_asks_response = response["orderbook"]["no"]
-
-            yes_orderbook : OrderbookData = {
-                "asks" : [{"price" : (100-float(x[0]))/100, "size" : float(x[1])} for x in no_asks_response],
-                "bids" : [{"price" : float(x[0])/100, "size" : float(x[1])} for x in yes_bids_response]
-            }
-
-            no_orderbook : OrderbookData = {
-                "asks" : [{"price" : (100-float(x[0]))/100, "size" : float(x[1])} for x in yes_bids_response],
-                "bids" : [{"price" : float(x[0])/100, "size" : float(x[1])} for x in no_asks_response]
-            }
-            return [OrderBook(yes_orderbook), OrderBook(no_orderbook)]
+            # kalshi only quotes bids, the asks of each outcome are a view of the other outcome's bids
+            yes_bids = PriceLevels(((float(x[0]), float(x[1])) for x in response["orderbook"]["yes"]), descending = True, units = 100)
+            no_bids = PriceLevels(((float(x[0]), float(x[1])) for x in response["orderbook"]["no"]), descending = True, units = 100)
+            return get_complementary_orderbooks(yes_bids, no_bids)
         except Exception as e:
             logging.info(f"error retrieving orderbook data for {data.platform} {data.id}")
             logging.error(f"Full error: {e}")
             return [OrderBook(), OrderBook()] #returns empty orderbook data
+
+    def get_market_feed(self) -> MarketFeed:
+        return KalshiFeed(lambda ticker: self.api.get_market_orderbook(ticker)["orderbook"], get_headers = self.api.get_websocket_headers) #type: ignore
         
 
-    def get_batch_market_data(self, data : List[BinaryMarketMetadata]) -> List[BinaryMarket]:
+    def get_batch_market_data(self, data : List[BinaryMarketMetadata], progress : Callable[[int, int], None] | None = None) -> List[BinaryMarket]:
         
         out : List[BinaryMarket] = []
         ids = [x.id for x in data]
@@ -358,6 +345,8 @@ class Kalshi(BettingPlatform):
             batch = ids[i:i+KALSHI_REQUEST_LIMIT]
             response = self.api.get_batch_markets(limit = KALSHI_REQUEST_LIMIT, tickers = batch) 
             markets = response["markets"] 
+            if progress:
+                progress(i + len(batch), len(ids))
             for m in markets:
                 if valid_prices(m["yes_ask"], m["no_ask"], m["yes_bid"], m["no_bid"]):
                     out.append(
@@ -371,7 +360,7 @@ class Kalshi(BettingPlatform):
                             float(m["no_ask"])/100,
                             float(m["yes_bid"])/100,
                             float(m["no_bid"])/100,
-                            parser.parse(m["expiration_time"]).astimezone(timezone.utc),
+                            parse_platform_timestamp(m["expiration_time"]),
                             m["rules_primary"]
                         )
                     )
@@ -403,7 +392,7 @@ class Kalshi(BettingPlatform):
                     None,
                     None,
                     market["rules_primary"],
-                    parser.parse(market["expiration_time"]).astimezone(timezone.utc)
+                    parse_platform_timestamp(market["expiration_time"])
                 )
                 questions.append(q)
                 question_count += 1
@@ -0,0 +1,44 @@
+from datetime import datetime
+from utils import parse_timestamp, CANONICAL_TIMESTAMP_FORMAT
+
+class BinaryMarketMetadata:
+    def __init__(self,
+        platform : str,
+        question : str,
+        id : str,
+        yes_id : str | None,
+        no_id : str | None,
+        description : str,
+        end_date : datetime
+    ): 
+        self.platform = platform
+        self.question = question
+        self.id = id
+        self.yes_id = yes_id
+        self.no_id = no_id
+        self.description = description
+        self.end_date = end_date
+    # Method to convert the object to a JSON-compatible dictionary
+    def to_json(self) -> dict:
+        return {
+            'platform': self.platform,
+            'question': self.question,
+            'id': self.id,
+            'yes_id': self.yes_id,
+            'no_id': self.no_id,
+            'description' : self.description,
+            'end_date' : self.end_date.strftime(CANONICAL_TIMESTAMP_FORMAT),
+        }
+
+    # Method to instantiate a BinaryMarket object from a dictionary
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            platform=data['platform'],
+            question=data['question'],
+            id=data['id'],
+            yes_id=data.get('yes_id'),
+            no_id=data.get('no_id'),
+            description = data.get('description'),
+            end_date = parse_timestamp(data["end_date"])
+        )
@@ -0,0 +1,70 @@
+from sentence_transformers import CrossEncoder # type: ignore
+from typing import Mapping, Sequence
+from llm_batches import trim_text
+from constants import *
+import numpy as np
+import logging
+
+def split_by_confidence(scores : np.ndarray, accept_score : float, reject_score : float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Splits pair scores into confident matches, confident non-matches and the uncertain band between them
+
+    Args:
+        scores (np.ndarray): probability that each pair is semantically equivalent
+        accept_score (float): scores at or above this are accepted
+        reject_score (float): scores at or below this are rejected
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: positions of the accepted, rejected and uncertain pairs
+    """
+    accepted = scores >= accept_score
+    rejected = (scores <= reject_score) & ~accepted
+    uncertain = ~accepted & ~rejected
+    return np.flatnonzero(accepted), np.flatnonzero(rejected), np.flatnonzero(uncertain)
+
+class CrossEncoderReranker:
+    """Scores candidate market pairs with a local cross-encoder so only pairs it is unsure about need an LLM verdict.
+
+    Unlike the bi-encoder used to build the question map, a cross-encoder reads both markets together, so it catches pairs
+    built from the same template with a different team, date or threshold.
+    """
+
+    def __init__(self, model : CrossEncoder | None = None,
+                 accept_score : float = CROSS_ENCODER_ACCEPT_SCORE,
+                 reject_score : float = CROSS_ENCODER_REJECT_SCORE,
+                 batch_size : int = CROSS_ENCODER_BATCH_SIZE):
+        self.model = model if model is not None else CrossEncoder(CROSS_ENCODER_MODEL_NAME, device="cpu")
+        self.accept_score = accept_score
+        self.reject_score = reject_score
+        self.batch_size = batch_size
+
+    def get_pair_text(self, question : str, description : str) -> str:
+        return f"{question} {trim_text(description, CROSS_ENCODER_MAX_DESCRIPTION_CHARS)}"
+
+    def score(self, bet_opportunities : Sequence[Mapping[str, str]]) -> np.ndarray:
+        """Scores each bet opportunity's (question + description, question + description) pair
+
+        Args:
+            bet_opportunities (Sequence[Mapping[str, str]]): bet opportunity titles
+
+        Returns:
+            np.ndarray: probability that each pair is semantically equivalent
+        """
+        if not bet_opportunities:
+            return np.empty(0, dtype = np.float32)
+        pairs = [(self.get_pair_text(bo["market_1_question"], bo["market_1_description"]),
+                  self.get_pair_text(bo["market_2_question"], bo["market_2_description"])) for bo in bet_opportunities]
+        return np.asarray(self.model.predict(pairs, batch_size=self.batch_size, convert_to_numpy=True), dtype = np.float32).reshape(len(pairs))
+
+    def rerank(self, bet_opportunities : Sequence[Mapping[str, str]]) -> tuple[set[str], list[int]]:
+        """Accepts and rejects confidently scored pairs locally
+
+        Args:
+            bet_opportunities (Sequence[Mapping[str, str]]): bet opportunity titles
+
+        Returns:
+            tuple[set[str], list[int]]: ids of the accepted bet opportunities and positions of the uncertain ones that still need a verdict
+        """
+        scores = self.score(bet_opportunities)
+        accepted, rejected, uncertain = split_by_confidence(scores, self.accept_score, self.reject_score)
+        logging.info(f"Cross-encoder accepted {len(accepted)}, rejected {len(rejected)} and left {len(uncertain)} of {len(scores)} bet opportunities uncertain")
+        return {bet_opportunities[i]["id"] for i in accepted}, uncertain.tolist()
@@ -0,0 +1,155 @@
+import numpy as np
+import hashlib
+import os
+import unicodedata
+import logging
+from typing import Iterable
+from constants import *
+
+class EmbeddingCache:
+    """Content-addressed on-disk store of text embeddings for one model.
+
+    Embeddings are rows of a memory-mapped .npy matrix that grows by doubling, and an append-only log maps a hash of
+    (model name, normalized text) to its row, so adding embeddings only writes the new rows.
+    Removing entries only drops them from the index; compact rewrites the matrix and log without the unreferenced rows.
+    """
+
+    def __init__(self, model_name : str, directory : str = EMBEDDING_CACHE_PATH):
+        self.model_name = model_name
+        self.directory = os.path.join(directory, model_name.replace("/", "_"))
+        self.matrix_path = os.path.join(self.directory, "embeddings.npy")
+        self.index_path = os.path.join(self.directory, "index.log")
+        self.index : dict[str, int] = {}
+        self.size = 0 # rows written to the matrix, including rows of removed entries
+        self.embeddings : np.ndarray | None = None
+        if os.path.exists(self.index_path) and os.path.exists(self.matrix_path):
+            self.embeddings = np.load(self.matrix_path, mmap_mode = "r+")
+            with open(self.index_path, "r") as f:
+                for line in f:
+                    key, row = line.split()
+                    if int(row) < 0:
+                        self.index.pop(key, None)
+                    else:
+                        self.index[key] = int(row)
+                        self.size = max(self.size, int(row) + 1)
+
+    def normalize_text(self, text : str) -> str:
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def key(self, text : str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{self.normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, text : str) -> bool:
+        return self.key(text) in self.index
+
+    def get(self, texts : list[str]) -> tuple[list[np.ndarray | None], list[int]]:
+        """Looks up the embedding of each text
+
+        Args:
+            texts (list[str]): texts to look up
+
+        Returns:
+            tuple[list[np.ndarray | None], list[int]]: embedding of each text (None if not cached) and the positions of the texts that were not cached
+        """
+        out : list[np.ndarray | None] = []
+        missing : list[int] = []
+        for i, text in enumerate(texts):
+            row = self.index.get(self.key(text))
+            if row is None or self.embeddings is None:
+                out.append(None)
+                missing.append(i)
+            else:
+                out.append(self.embeddings[row])
+        return out, missing
+
+    def add(self, texts : list[str], embeddings : np.ndarray) -> None:
+        """Appends embeddings for texts that are not cached yet and persists them
+
+        Args:
+            texts (list[str]): texts that were embedded
+            embeddings (np.ndarray): one embedding row per text
+        """
+        new_rows : dict[str, int] = {}
+        for i, text in enumerate(texts):
+            key = self.key(text)
+            if key not in self.index and key not in new_rows:
+                new_rows[key] = i
+        if not new_rows:
+            return
+        embeddings = np.asarray(embeddings, dtype = np.float32)[list(new_rows.values())]
+        start = self.size
+        self.reserve(start + len(embeddings), embeddings.shape[1])
+        self.embeddings[start:start + len(embeddings)] = embeddings #type: ignore
+        self.embeddings.flush() #type: ignore
+        self.size = start + len(embeddings)
+        # rows are on disk before the log references them
+        entries = {key : start + offset for offset, key in enumerate(new_rows)}
+        self.append_index(entries)
+        self.index.update(entries)
+
+    def remove(self, texts : Iterable[str]) -> int:
+        """Removes texts from the cache, returning the number of entries removed. Space is reclaimed by compact."""
+        removed = {}
+        for text in texts:
+            key = self.key(text)
+            if self.index.pop(key, None) is not None:
+                removed[key] = -1
+        self.append_index(removed)
+        return len(removed)
+
+    def retain(self, texts : Iterable[str]) -> int:
+        """Removes every entry except the given texts (e.g. the questions of markets that are still active), returning the number of entries removed"""
+        keep = {self.key(text) for text in texts}
+        removed = {key : -1 for key in self.index if key not in keep}
+        for key in removed:
+            del self.index[key]
+        self.append_index(removed)
+        return len(removed)
+
+    def compact(self) -> None:
+        """Rewrites the embedding matrix and index keeping only rows that are still referenced"""
+        if self.embeddings is None or self.size == len(self.index):
+            return
+        logging.info(f"Compacting embedding cache from {self.size} to {len(self.index)} rows")
+        keys = list(self.index)
+        rows = np.array([self.index[k] for k in keys], dtype = np.int64)
+        tmp_matrix_path = self.matrix_path + ".tmp.npy"
+        matrix = np.lib.format.open_memmap(tmp_matrix_path, mode = "w+", dtype = np.float32, shape = (max(len(keys), 1), self.embeddings.shape[1]))
+        matrix[:len(keys)] = self.embeddings[rows]
+        matrix.flush()
+        del matrix
+        tmp_index_path = self.index_path + ".tmp"
+        with open(tmp_index_path, "w") as f:
+            f.writelines(f"{key} {row}\n" for row, key in enumerate(keys))
+        self.embeddings = None
+        os.replace(tmp_matrix_path, self.matrix_path)
+        os.replace(tmp_index_path, self.index_path)
+        self.embeddings = np.load(self.matrix_path, mmap_mode = "r+")
+        self.index = {key : row for row, key in enumerate(keys)}
+        self.size = len(keys)
+
+    def reserve(self, rows : int, dimension : int) -> None:
+        """Makes sure the matrix file has room for a number of rows, doubling its capacity when it runs out"""
+        if self.embeddings is not None and len(self.embeddings) >= rows:
+            return
+        os.makedirs(self.directory, exist_ok = True)
+        capacity = max(rows, 2 * (0 if self.embeddings is None else len(self.embeddings)), 1024)
+        tmp_path = self.matrix_path + ".tmp.npy"
+        matrix = np.lib.format.open_memmap(tmp_path, mode = "w+", dtype = np.float32, shape = (capacity, dimension))
+        if self.embeddings is not None:
+            matrix[:self.size] = self.embeddings[:self.size]
+        matrix.flush()
+        del matrix
+        self.embeddings = None
+        os.replace(tmp_path, self.matrix_path)
+        self.embeddings = np.load(self.matrix_path, mmap_mode = "r+")
+
+    def append_index(self, entries : dict[str, int]) -> None:
+        if not entries:
+            return
+        os.makedirs(self.directory, exist_ok = True)
+        with open(self.index_path, "a") as f:
+            f.writelines(f"{key} {row}\n" for key, row in entries.items())
@@ -0,0 +1,227 @@
+import numpy as np
+import logging
+import time
+from constants import *
+
+def normalize_embeddings(embeddings : np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype = np.float32)
+    norms = np.linalg.norm(embeddings, axis = 1, keepdims = True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+def top_k(scores : np.ndarray, k : int) -> tuple[np.ndarray, np.ndarray]:
+    """Gets the k highest scores of each row, in decreasing order, along with their column indices"""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype = np.float32), np.empty((scores.shape[0], 0), dtype = np.int64)
+    indices = np.argpartition(-scores, k - 1, axis = 1)[:, :k]
+    top_scores = np.take_along_axis(scores, indices, axis = 1)
+    order = np.argsort(-top_scores, axis = 1, kind = "stable")
+    return np.take_along_axis(top_scores, order, axis = 1), np.take_along_axis(indices, order, axis = 1)
+
+def exact_top_k(embeddings : np.ndarray, queries : np.ndarray, k : int, chunk_size : int) -> tuple[np.ndarray, np.ndarray]:
+    """Compares every normalized query with every normalized embedding in chunked matrix multiplies, keeping the top k per query"""
+    scores_out, indices_out = [], []
+    for start in range(0, len(queries), chunk_size):
+        scores, indices = top_k(queries[start:start+chunk_size] @ embeddings.T, k)
+        scores_out.append(scores)
+        indices_out.append(indices)
+    if not scores_out:
+        return top_k(np.empty((0, len(embeddings)), dtype = np.float32), k)
+    return np.concatenate(scores_out), np.concatenate(indices_out)
+
+class EmbeddingIndex:
+    """Nearest neighbour index over embeddings, scored by cosine similarity"""
+
+    def build(self, embeddings : np.ndarray) -> None:
+        """Indexes a matrix of embeddings, one row per item
+
+        Args:
+            embeddings (np.ndarray): n x d matrix of embeddings
+        """
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def query(self, queries : np.ndarray, k : int) -> tuple[np.ndarray, np.ndarray]:
+        """Gets the k most similar indexed items for each query embedding
+
+        Args:
+            queries (np.ndarray): m x d matrix of query embeddings
+            k (int): number of neighbours to return per query
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: m x k cosine similarities and m x k row indices of the indexed items, most similar first
+        """
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def __len__(self) -> int:
+        raise NotImplementedError("Subclasses must implement this method")
+
+class ExactIndex(EmbeddingIndex):
+    """Brute force index comparing every query with every indexed embedding in chunked matrix multiplies"""
+
+    def __init__(self, chunk_size : int = SIMILARITY_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.embeddings = np.empty((0, 0), dtype = np.float32)
+
+    def build(self, embeddings : np.ndarray) -> None:
+        self.embeddings = normalize_embeddings(embeddings)
+
+    def query(self, queries : np.ndarray, k : int) -> tuple[np.ndarray, np.ndarray]:
+        return exact_top_k(self.embeddings, normalize_embeddings(queries), k, self.chunk_size)
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+class IVFIndex(EmbeddingIndex):
+    """Inverted file index: embeddings are clustered with spherical k-means and each query only scans the n_probe closest clusters.
+
+    Raising n_probe (or lowering n_lists) trades speed for recall; n_probe = n_lists is an exact search.
+    Indexes smaller than min_vectors are searched exactly since a brute force scan is already cheap.
+
+    Matching is approximate, so question matching only uses it when passed as SemanticEquivalence(index_factory = IVFIndex).
+    At the default n_probe and sqrt(n) lists, recall@1 against exact search is about .99 on 20000 clustered 384 dimension
+    embeddings (2000 topics) but only about .26 on 20000 embeddings without cluster structure, so check recall_report on the
+    questions being matched before opting in.
+    """
+
+    def __init__(self, n_lists : int | None = None, n_probe : int = IVF_N_PROBE, n_iter : int = 10,
+                 min_vectors : int = IVF_MIN_VECTORS, seed : int = 0, chunk_size : int = SIMILARITY_CHUNK_SIZE):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.min_vectors = min_vectors
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.embeddings = np.empty((0, 0), dtype = np.float32)
+        self.centroids = np.empty((0, 0), dtype = np.float32)
+        self.list_offsets = np.zeros(1, dtype = np.int64)
+        self.list_members = np.empty(0, dtype = np.int64)
+
+    def train_centroids(self, embeddings : np.ndarray, n_lists : int) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(embeddings), 64 * n_lists)
+        sample = embeddings[rng.choice(len(embeddings), sample_size, replace = False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace = False)]
+        for _ in range(self.n_iter):
+            assignments = self.assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength = n_lists)
+            # re-seed empty clusters with random points so every list stays in use
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace = False)]
+            centroids = normalize_embeddings(sums)
+        return centroids
+
+    def assign(self, embeddings : np.ndarray, centroids : np.ndarray) -> np.ndarray:
+        assignments = [np.argmax(embeddings[start:start+self.chunk_size] @ centroids.T, axis = 1)
+                       for start in range(0, len(embeddings), self.chunk_size)]
+        return np.concatenate(assignments) if assignments else np.empty(0, dtype = np.int64)
+
+    def build(self, embeddings : np.ndarray) -> None:
+        self.embeddings = normalize_embeddings(embeddings)
+        n = len(self.embeddings)
+        if n < self.min_vectors:
+            n_lists = 1
+            self.centroids = np.zeros((1, self.embeddings.shape[1] if n else 0), dtype = np.float32)
+            assignments = np.zeros(n, dtype = np.int64)
+        else:
+            n_lists = min(n, self.n_lists or int(np.sqrt(n)))
+            self.centroids = self.train_centroids(self.embeddings, n_lists)
+            assignments = self.assign(self.embeddings, self.centroids)
+        # store the inverted lists contiguously: members of list i are list_members[list_offsets[i]:list_offsets[i+1]]
+        self.list_members = np.argsort(assignments, kind = "stable")
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength = n_lists))))
+
+    def query(self, queries : np.ndarray, k : int) -> tuple[np.ndarray, np.ndarray]:
+        queries = normalize_embeddings(queries)
+        n_lists = len(self.centroids)
+        n_probe = min(self.n_probe, n_lists)
+        if n_probe == n_lists:
+            return exact_top_k(self.embeddings, queries, k, self.chunk_size)
+        k = min(k, len(self))
+        scores_out = np.full((len(queries), k), -np.inf, dtype = np.float32)
+        indices_out = np.full((len(queries), k), -1, dtype = np.int64)
+        for start in range(0, len(queries), self.chunk_size):
+            chunk = queries[start:start+self.chunk_size]
+            chunk_scores = scores_out[start:start+self.chunk_size]
+            chunk_indices = indices_out[start:start+self.chunk_size]
+            probed = np.argpartition(-(chunk @ self.centroids.T), n_probe - 1, axis = 1)[:, :n_probe]
+            # group (query, list) pairs by list so each list is scored against all of its queries in one matrix multiply
+            probed_lists = probed.ravel()
+            probing_queries = np.repeat(np.arange(len(chunk)), n_probe)
+            order = np.argsort(probed_lists, kind = "stable")
+            probed_lists, probing_queries = probed_lists[order], probing_queries[order]
+            boundaries = np.searchsorted(probed_lists, np.arange(n_lists + 1))
+            for l in range(n_lists):
+                rows = probing_queries[boundaries[l]:boundaries[l+1]]
+                members = self.list_members[self.list_offsets[l]:self.list_offsets[l+1]]
+                if len(rows) == 0 or len(members) == 0:
+                    continue
+                # merge this list's candidates into the running top k of each probing query
+                candidate_scores = np.concatenate((chunk_scores[rows], chunk[rows] @ self.embeddings[members].T), axis = 1)
+                candidate_indices = np.concatenate((chunk_indices[rows], np.broadcast_to(members, (len(rows), len(members)))), axis = 1)
+                scores, positions = top_k(candidate_scores, k)
+                chunk_scores[rows] = scores
+                chunk_indices[rows] = np.take_along_axis(candidate_indices, positions, axis = 1)
+        return scores_out, indices_out
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+def recall_report(index : EmbeddingIndex, embeddings : np.ndarray, queries : np.ndarray, k : int = 5) -> dict[str, float]:
+    """Compares an index against exact search over the same embeddings
+
+    Args:
+        index (EmbeddingIndex): index to evaluate, built by this function
+        embeddings (np.ndarray): embeddings to index
+        queries (np.ndarray): query embeddings
+        k (int, optional): number of neighbours per query. Defaults to 5.
+
+    Returns:
+        dict[str, float]: recall@1 and recall@k against exact search along with build and query times in seconds
+    """
+    exact = ExactIndex()
+    exact.build(embeddings)
+    start = time.time()
+    _, exact_indices = exact.query(queries, k)
+    exact_query_seconds = time.time() - start
+
+    start = time.time()
+    index.build(embeddings)
+    build_seconds = time.time() - start
+    start = time.time()
+    _, indices = index.query(queries, k)
+    query_seconds = time.time() - start
+
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(indices.tolist(), exact_indices.tolist()))
+    return {
+        "recall@1" : float(np.mean(indices[:, 0] == exact_indices[:, 0])) if len(queries) else 1.0,
+        f"recall@{k}" : hits / exact_indices.size if exact_indices.size else 1.0,
+        "build_seconds" : build_seconds,
+        "query_seconds" : query_seconds,
+        "exact_query_seconds" : exact_query_seconds
+    }
+
+if __name__ == "__main__":
+    # recall of the ivf index against exact search when matching saved polymarket questions to saved kalshi questions
+    import json
+    from SemanticEquivalence import SemanticEquivalence
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    nlp = SemanticEquivalence()
+    from MarketSnapshot import MarketSnapshot, use_snapshot, get_snapshot_path
+    questions_by_platform = {}
+    for platform in [BetPlatform.Kalshi, BetPlatform.Polymarket]:
+        filepath = BETTING_PLATFORM_DATA[platform]["question_filepath"]
+        if use_snapshot(filepath):
+            questions = MarketSnapshot(get_snapshot_path(filepath)).column("question").to_list()
+        else:
+            with open(filepath, "r") as json_file:
+                questions = [m["question"] for m in json.load(json_file)]
+        questions_by_platform[platform] = [q.lower().strip() for q in questions] #type: ignore
+    kalshi_questions = questions_by_platform[BetPlatform.Kalshi]
+    polymarket_questions = questions_by_platform[BetPlatform.Polymarket]
+    kalshi_embeddings = nlp.encode_questions(kalshi_questions).cpu().numpy()
+    polymarket_embeddings = nlp.encode_questions(polymarket_questions).cpu().numpy()
+    for n_probe in [1, 4, 8, 16, 32]:
+        report = recall_report(IVFIndex(n_probe = n_probe, min_vectors = 0), kalshi_embeddings, polymarket_embeddings)
+        logging.info(f"n_probe {n_probe}: {report}")
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Callable, TypeVar, Generic
+import openai
+from openai import AsyncOpenAI
+from llm_batches import estimate_tokens
+from constants import *
+
+T = TypeVar("T")
+
+# errors worth retrying: rate limits (429), server errors (5xx) and dropped connections or timeouts
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+class RateLimiter:
+    """Sliding one minute window over the requests and tokens sent to a provider"""
+
+    def __init__(self, requests_per_minute : int | None, tokens_per_minute : int | None, window : float = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self.sent : deque[list[float]] = deque() # [send time, tokens] of each request in the window
+
+    def get_delay(self, tokens : int, now : float) -> float:
+        """Gets how long to wait before a request using a number of tokens fits in both budgets"""
+        while self.sent and self.sent[0][0] <= now - self.window:
+            self.sent.popleft()
+        delay = 0.0
+        if self.requests_per_minute and len(self.sent) >= self.requests_per_minute:
+            delay = self.sent[len(self.sent) - self.requests_per_minute][0] + self.window - now
+        if self.tokens_per_minute:
+            excess = sum(t for _, t in self.sent) + tokens - self.tokens_per_minute
+            # wait for the oldest requests to leave the window until enough tokens are freed (or the window is empty)
+            for sent_time, sent_tokens in self.sent:
+                if excess <= 0:
+                    break
+                excess -= sent_tokens
+                delay = max(delay, sent_time + self.window - now)
+        return max(delay, 0.0)
+
+    def record(self, tokens : int, now : float) -> list[float]:
+        entry = [now, float(tokens)]
+        self.sent.append(entry)
+        return entry
+
+    async def acquire(self, tokens : int) -> list[float]:
+        """Waits until a request fits in the budgets and records it, returning its entry so the token count can be corrected once usage is known"""
+        while True:
+            now = time.monotonic()
+            delay = self.get_delay(tokens, now)
+            if delay <= 0:
+                return self.record(tokens, now)
+            await asyncio.sleep(delay)
+
+class BatchResult(Generic[T]):
+    def __init__(self, result : T | None, cost : float):
+        self.result = result # parsed response, None if the batch failed
+        self.cost = cost # cost of every completion made for the batch, including retries
+
+class LLMBatchDispatcher:
+    """Sends many prompts to an OpenAI compatible chat completions api concurrently.
+
+    Requests are limited by a concurrency cap and the model's requests and tokens per minute budgets, retried with exponential backoff
+    on rate limits and server errors, and re-submitted when the response cannot be parsed.
+    """
+
+    def __init__(self, model : LLM, api_key : str | None, base_url : str | None = None,
+                 max_concurrency : int = LLM_MAX_CONCURRENT_REQUESTS,
+                 max_retries : int = LLM_MAX_RETRIES,
+                 max_parse_retries : int = LLM_MAX_PARSE_RETRIES,
+                 retry_base_delay : float = LLM_RETRY_BASE_DELAY):
+        self.model = model
+        self.model_name = LLM_INFO[model]["model_name"]
+        self.api_key = api_key
+        self.base_url = base_url or LLM_INFO[model]["base_url"]
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.max_parse_retries = max_parse_retries
+        self.retry_base_delay = retry_base_delay
+        self.rate_limiter = RateLimiter(LLM_INFO[model].get("requests_per_minute"), LLM_INFO[model].get("tokens_per_minute"))
+
+    def get_cost(self, prompt_tokens : int, completion_tokens : int) -> float:
+        cost = prompt_tokens * LLM_INFO[self.model]["cost_per_1m_input_tokens"] /10**6
+        cost += completion_tokens * LLM_INFO[self.model]["cost_per_1m_output_tokens"] /10**6
+        return cost
+
+    def get_retry_delay(self, error : Exception, attempt : int) -> float:
+        """Backs off exponentially with jitter, waiting at least as long as the server's retry-after header asks"""
+        delay = self.retry_base_delay * 2 ** attempt * (1 + random.random())
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers.get("retry-after", 0)))
+            except ValueError:
+                pass
+        return delay
+
+    async def complete(self, client : AsyncOpenAI, semaphore : asyncio.Semaphore, prompt : str) -> tuple[str | None, float]:
+        """Gets one chat completion, retrying rate limits and server errors
+
+        Returns:
+            tuple[str | None, float]: response content and its cost
+        """
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                entry = await self.rate_limiter.acquire(estimate_tokens(prompt) + LLM_COMPLETION_TOKEN_ESTIMATE)
+                try:
+                    chat_completion = await client.chat.completions.create(
+                        messages=[
+                            {
+                                "role": "user",
+                                "content": prompt,
+                            }
+                        ],
+                        model=self.model_name,
+                    )
+                except RETRYABLE_ERRORS as e:
+                    if attempt == self.max_retries:
+                        raise
+                    delay = self.get_retry_delay(e, attempt)
+                    logging.info(f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                    error = e
+                else:
+                    content = chat_completion.choices[0].message.content
+                    usage = chat_completion.usage
+                    cost = 0.0
+                    if usage:
+                        logging.info(f"Prompt tokens: {usage.prompt_tokens}\n Completion tokens: {usage.completion_tokens}")
+                        cost = self.get_cost(usage.prompt_tokens, usage.completion_tokens)
+                        entry[1] = usage.prompt_tokens + usage.completion_tokens
+                    return content, cost
+            # back off outside the semaphore so other batches can use the slot
+            await asyncio.sleep(delay)
+        raise error
+
+    async def dispatch_batch(self, client : AsyncOpenAI, semaphore : asyncio.Semaphore, prompt : str, parse : Callable[[str | None], T]) -> BatchResult[T]:
+        cost = 0.0
+        for attempt in range(self.max_parse_retries + 1):
+            try:
+                content, completion_cost = await self.complete(client, semaphore, prompt)
+            except openai.OpenAIError as e:
+                logging.error(f"LLM request failed for prompt:\n {prompt}\nError message: {e}")
+                return BatchResult(None, cost)
+            cost += completion_cost
+            try:
+                return BatchResult(parse(content), cost)
+            except (ValueError, TypeError) as e:
+                logging.error(f"Could not parse response (attempt {attempt + 1} of {self.max_parse_retries + 1}) for prompt:\n {prompt}\nError message: {e}\nRaw response: {content}")
+        return BatchResult(None, cost)
+
+    async def dispatch_async(self, prompts : list[str], parse : Callable[[str | None], T]) -> list[BatchResult[T]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0) as client:
+            return await asyncio.gather(*[self.dispatch_batch(client, semaphore, prompt, parse) for prompt in prompts])
+
+    def dispatch(self, prompts : list[str], parse : Callable[[str | None], T]) -> list[BatchResult[T]]:
+        """Sends every prompt and parses the responses
+
+        Args:
+            prompts (list[str]): one prompt per batch
+            parse (Callable[[str | None], T]): parses a response's content, raising ValueError or TypeError to re-submit the batch
+
+        Returns:
+            list[BatchResult[T]]: parsed response (None if the batch failed) and cost for each prompt, in order
+        """
+        return asyncio.run(self.dispatch_async(prompts, parse))
@@ -0,0 +1,66 @@
+import threading
+import time
+from typing import Any, Iterable
+from constants import *
+
+MarketKey = tuple[str, str] # (platform, market id)
+
+class DirtyMarkets:
+    """Thread-safe set of markets whose quotes changed since they were last evaluated. Feeds mark markets as their books
+    change and the trading loop takes the whole set at once, so a market that changes many times between evaluations is
+    evaluated once."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.markets : set[MarketKey] = set()
+
+    def mark(self, platform : str, market_id : str) -> None:
+        with self.condition:
+            self.markets.add((platform, market_id))
+            self.condition.notify_all()
+
+    def clear(self) -> None:
+        with self.condition:
+            self.markets = set()
+
+    def take(self, timeout : float, batch_window : float = TRADING_DIRTY_BATCH_SECONDS) -> set[MarketKey]:
+        """Waits up to timeout for a market to be marked, then up to batch_window more so a burst of changes is taken
+        together, and returns and clears the marked markets
+
+        Args:
+            timeout (float): seconds to wait for the first marked market
+            batch_window (float, optional): seconds to keep collecting after the first marked market
+
+        Returns:
+            set[MarketKey]: marked markets, empty if none were marked within timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.markets, timeout = max(timeout, 0)):
+                return set()
+        time.sleep(batch_window)
+        with self.condition:
+            markets, self.markets = self.markets, set()
+        return markets
+
+class OpportunityIndex:
+    """Bet opportunities by the markets they are made of, so a change to one market finds the pairs it affects"""
+
+    def __init__(self, bet_opportunities : Iterable[Any]):
+        """
+        Args:
+            bet_opportunities (Iterable[Any]): BetOpportunity objects
+        """
+        self.bet_opportunities = {bo.id : bo for bo in bet_opportunities}
+        self.positions = {id : i for i, id in enumerate(self.bet_opportunities)}
+        self.by_market : dict[MarketKey, list[str]] = {}
+        for bo in self.bet_opportunities.values():
+            for market in (bo.market_1, bo.market_2):
+                self.by_market.setdefault((market.platform, market.id), []).append(bo.id)
+
+    def __len__(self) -> int:
+        return len(self.bet_opportunities)
+
+    def get_affected(self, markets : Iterable[MarketKey]) -> list[Any]:
+        """Gets each bet opportunity that has at least one of the markets once, in index order"""
+        ids = {id for market in markets for id in self.by_market.get(market, [])}
+        return [self.bet_opportunities[id] for id in sorted(ids, key = self.positions.__getitem__)]
@@ -0,0 +1,150 @@
+import numpy as np
+import json
+import os
+import shutil
+from datetime import datetime, timezone, timedelta
+from typing import Iterator, Sequence
+from utils import CANONICAL_TIMESTAMP_FORMAT
+
+SNAPSHOT_STRING_COLUMNS = ["platform", "question", "id", "yes_id", "no_id", "description"]
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+def get_snapshot_path(json_filepath : str) -> str:
+    """Gets where the columnar snapshot of a question data json file lives, e.g. question_data/kalshi.json -> question_data/kalshi.snapshot"""
+    return os.path.splitext(json_filepath)[0] + ".snapshot"
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_epoch_microseconds(end_date : datetime) -> int:
+    return (end_date - EPOCH) // timedelta(microseconds=1)
+
+def from_epoch_microseconds(end_date : int) -> datetime:
+    return EPOCH + timedelta(microseconds=end_date)
+
+class StringColumn:
+    """Column of optional strings stored as one utf-8 byte buffer with row offsets, only decoded when rows are read"""
+
+    def __init__(self, data : np.ndarray, offsets : np.ndarray, nulls : np.ndarray | None):
+        self.data = data
+        self.offsets = offsets
+        self.nulls = nulls
+
+    @staticmethod
+    def encode(values : Sequence[str | None]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        encoded = [b"" if v is None else v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype = np.int64)
+        np.cumsum([len(v) for v in encoded], out = offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype = np.uint8)
+        nulls = np.array([v is None for v in values], dtype = bool)
+        return data, offsets, nulls
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i : int) -> str | None:
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        return bytes(self.data[self.offsets[i]:self.offsets[i+1]]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str | None]:
+        # decode the whole buffer once and slice it, much faster than decoding row by row
+        text = bytes(self.data).decode("utf-8")
+        if len(text) == len(self.data):
+            char_offsets = self.offsets.tolist()
+        else:
+            # convert byte offsets to character offsets by counting the bytes that start a utf-8 character
+            starts_character = (np.asarray(self.data) & 0xC0) != 0x80
+            char_offsets = np.concatenate(([0], np.cumsum(starts_character)))[self.offsets].tolist()
+        nulls = self.nulls.tolist() if self.nulls is not None else [False] * len(self)
+        for start, end, null in zip(char_offsets[:-1], char_offsets[1:], nulls):
+            yield None if null else text[start:end]
+
+    def to_list(self) -> list[str | None]:
+        return list(self)
+
+class MarketSnapshot:
+    """Columnar snapshot of the binary market metadata of one platform.
+
+    The snapshot is a directory of .npy files: each string column is a utf-8 byte buffer plus row offsets (and a null mask), and
+    end dates are epoch microseconds. Columns are only loaded when accessed and are memory-mapped by default, so reading one
+    column of a large snapshot does not parse the rest.
+    """
+
+    def __init__(self, path : str, mmap : bool = True):
+        self.path = path
+        self.mmap_mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {self.meta['version']} in {path}")
+        self.columns : dict[str, StringColumn] = {}
+        self._end_dates : np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def load_array(self, name : str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode = self.mmap_mode) #type: ignore
+
+    def column(self, name : str) -> StringColumn:
+        if name not in self.columns:
+            nulls = self.load_array(f"{name}.nulls") if name in self.meta["nullable_columns"] else None
+            self.columns[name] = StringColumn(self.load_array(f"{name}.data"), self.load_array(f"{name}.offsets"), nulls)
+        return self.columns[name]
+
+    @property
+    def end_dates(self) -> np.ndarray:
+        """Epoch microseconds of each market's end date"""
+        if self._end_dates is None:
+            self._end_dates = self.load_array("end_date")
+        return self._end_dates
+
+    def to_json(self) -> list[dict]:
+        """Gets every row in the json format of BinaryMarketMetadata.to_json"""
+        columns = {name : self.column(name).to_list() for name in SNAPSHOT_STRING_COLUMNS}
+        end_dates = [from_epoch_microseconds(x).strftime(CANONICAL_TIMESTAMP_FORMAT) for x in self.end_dates.tolist()]
+        return [{**{name : columns[name][i] for name in SNAPSHOT_STRING_COLUMNS}, "end_date" : end_dates[i]} for i in range(len(self))]
+
+    def export_json(self, json_filepath : str) -> None:
+        with open(json_filepath, "w") as json_file:
+            json.dump(self.to_json(), json_file, indent = 4)
+
+    @staticmethod
+    def write(path : str, columns : dict[str, Sequence[str | None]], end_dates : Sequence[int]) -> None:
+        """Writes a snapshot, replacing any snapshot at the same path only once the new one is complete
+
+        Args:
+            path (str): snapshot directory
+            columns (dict[str, Sequence[str | None]]): values of every string column in SNAPSHOT_STRING_COLUMNS
+            end_dates (Sequence[int]): epoch microseconds of each market's end date
+        """
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors = True)
+        os.makedirs(tmp_path)
+        nullable_columns = []
+        for name in SNAPSHOT_STRING_COLUMNS:
+            data, offsets, nulls = StringColumn.encode(columns[name])
+            np.save(os.path.join(tmp_path, f"{name}.data.npy"), data)
+            np.save(os.path.join(tmp_path, f"{name}.offsets.npy"), offsets)
+            if nulls.any():
+                np.save(os.path.join(tmp_path, f"{name}.nulls.npy"), nulls)
+                nullable_columns.append(name)
+        np.save(os.path.join(tmp_path, "end_date.npy"), np.asarray(end_dates, dtype = np.int64))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"version" : SNAPSHOT_FORMAT_VERSION, "rows" : len(end_dates), "nullable_columns" : nullable_columns}, f)
+        old_path = path + ".old"
+        shutil.rmtree(old_path, ignore_errors = True)
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors = True)
+
+def use_snapshot(json_filepath : str) -> bool:
+    """Whether question data should be read from the snapshot of a json file rather than the json itself, i.e. a snapshot exists
+    and the json is not newer (e.g. hand edited or written by an older version)"""
+    snapshot_path = get_snapshot_path(json_filepath)
+    meta_path = os.path.join(snapshot_path, "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    return not os.path.exists(json_filepath) or os.path.getmtime(meta_path) >= os.path.getmtime(json_filepath)
@@ -0,0 +1,415 @@
+import asyncio
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, TypedDict
+from websockets.asyncio.client import connect
+from websockets.exceptions import WebSocketException
+from OrderBook import OrderBook, OrderbookData, PriceLevels, get_complementary_orderbooks, copy_orderbooks
+from constants import *
+
+class StreamMarket(TypedDict):
+    platform : str
+    id : str
+    yes_id : str | None # platform token of the yes outcome, Polymarket only
+    no_id : str | None # platform token of the no outcome, Polymarket only
+
+class Quote(TypedDict):
+    yes_ask : float | None
+    no_ask : float | None
+    yes_bid : float | None
+    no_bid : float | None
+
+class SequenceGap(Exception):
+    """Raised by a feed when a message shows that earlier messages were missed, so the given markets' books can't be trusted"""
+
+    def __init__(self, market_ids : Iterable[str]):
+        self.market_ids = set(market_ids)
+        super().__init__(f"Sequence gap affecting {len(self.market_ids)} markets")
+
+def get_quote(yes_orderbook : OrderBook, no_orderbook : OrderBook) -> Quote:
+    """Gets the best prices of a market from its yes and no orderbooks, None for an empty side"""
+    best = lambda orders: orders[0]["price"] if orders else None
+    return {
+        "yes_ask" : best(yes_orderbook.get_top_asks(1)),
+        "no_ask" : best(no_orderbook.get_top_asks(1)),
+        "yes_bid" : best(yes_orderbook.get_top_bids(1)),
+        "no_bid" : best(no_orderbook.get_top_bids(1))
+    }
+
+class MarketFeed:
+    """Orderbook channel of one platform: what to subscribe to, how to apply its messages to a market's yes and no
+    orderbooks and how to resync them over REST."""
+
+    platform_name : str
+
+    def __init__(self, url : str, get_headers : Callable[[], dict[str, str]] | None = None):
+        self.url = url
+        self.get_headers = get_headers or dict
+        self.markets : dict[str, StreamMarket] = {}
+
+    def set_markets(self, markets : Iterable[StreamMarket]) -> None:
+        self.markets = {m["id"] : m for m in markets}
+
+    def get_subscribe_messages(self) -> list[dict]:
+        """Gets the messages that subscribe to the orderbooks of every market"""
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def reset(self) -> None:
+        """Forgets any per connection state, called on every new connection"""
+        pass
+
+    def handle_message(self, message : Any, books : dict[str, list[OrderBook]]) -> set[str]:
+        """Applies one message to the local orderbooks
+
+        Args:
+            message (Any): decoded json message
+            books (dict[str, list[OrderBook]]): yes and no orderbooks of each market that has been synced, by market id.
+                Snapshots add markets.
+
+        Raises:
+            SequenceGap: if messages were missed
+
+        Returns:
+            set[str]: ids of the markets whose orderbooks changed
+        """
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def fetch_book(self, market_id : str) -> list[OrderBook]:
+        """Gets a market's yes and no orderbooks over REST"""
+        raise NotImplementedError("Subclasses must implement this method")
+
+class KalshiFeed(MarketFeed):
+    """Kalshi orderbook_delta channel. A Kalshi book is the yes bids and no bids in cents, deltas are changes in size, and
+    every message of a subscription has a sequence number."""
+
+    platform_name = BetPlatform.Kalshi.value
+
+    def __init__(self, fetch_orderbook : Callable[[str], dict[str, list[list[int]]]], url : str = KALSHI_WS_ENDPOINT,
+                 get_headers : Callable[[], dict[str, str]] | None = None):
+        """
+        Args:
+            fetch_orderbook (Callable[[str], dict[str, list[list[int]]]]): gets a ticker's orderbook over REST as {"yes" : [[cents, size]], "no" : [[cents, size]]}
+            url (str, optional): websocket endpoint
+            get_headers (Callable[[], dict[str, str]] | None, optional): gets the signed headers to connect with
+        """
+        super().__init__(url, get_headers)
+        self.fetch_orderbook = fetch_orderbook
+        self.sequence_numbers : dict[int, int] = {}
+
+    def new_book(self, orderbook : dict[str, list[list[int]]]) -> list[OrderBook]:
+        yes_bids = PriceLevels(((price, size) for price, size in orderbook.get("yes") or []), descending = True, units = 100)
+        no_bids = PriceLevels(((price, size) for price, size in orderbook.get("no") or []), descending = True, units = 100)
+        return get_complementary_orderbooks(yes_bids, no_bids)
+
+    def get_subscribe_messages(self) -> list[dict]:
+        return [{"id" : 1, "cmd" : "subscribe", "params" : {"channels" : ["orderbook_delta"], "market_tickers" : list(self.markets)}}]
+
+    def reset(self) -> None:
+        self.sequence_numbers = {}
+
+    def check_sequence(self, message : dict) -> None:
+        sid, seq = message.get("sid"), message.get("seq")
+        if sid is None or seq is None:
+            return
+        expected = self.sequence_numbers.get(sid)
+        self.sequence_numbers[sid] = seq
+        if expected is not None and seq != expected + 1:
+            raise SequenceGap(self.markets)
+
+    def handle_message(self, message : Any, books : dict[str, list[OrderBook]]) -> set[str]:
+        if message.get("type") not in ("orderbook_snapshot", "orderbook_delta"):
+            if message.get("type") == "error":
+                logging.error(f"Kalshi websocket error: {message.get('msg')}")
+            return set()
+        self.check_sequence(message)
+        msg = message["msg"]
+        ticker = msg["market_ticker"]
+        if message["type"] == "orderbook_snapshot":
+            books[ticker] = self.new_book(msg)
+        elif ticker in books:
+            # the bids of each outcome, the asks being views of the other outcome's bids
+            yes_orderbook, no_orderbook = books[ticker]
+            bids = yes_orderbook.bids if msg["side"] == "yes" else no_orderbook.bids
+            bids.add(msg["price"], msg["delta"]) #type: ignore
+        else:
+            # a delta to a book we never got a snapshot of
+            raise SequenceGap([ticker])
+        return {ticker}
+
+    def fetch_book(self, market_id : str) -> list[OrderBook]:
+        return self.new_book(self.fetch_orderbook(market_id))
+
+class PolymarketFeed(MarketFeed):
+    """Polymarket market channel. Each outcome token has its own book, and price changes carry the new size of a level.
+    Messages have no sequence numbers, so a gap only shows as a change to a book we have no snapshot of."""
+
+    platform_name = BetPlatform.Polymarket.value
+
+    def __init__(self, fetch_book : Callable[[str], OrderbookData], url : str = POLYMARKET_WS_ENDPOINT,
+                 get_headers : Callable[[], dict[str, str]] | None = None):
+        """
+        Args:
+            fetch_book (Callable[[str], OrderbookData]): gets a token's orderbook over REST
+            url (str, optional): websocket endpoint
+            get_headers (Callable[[], dict[str, str]] | None, optional): gets the headers to connect with
+        """
+        super().__init__(url, get_headers)
+        self.fetch_token_book = fetch_book
+        self.tokens : dict[str, tuple[str, int]] = {}
+        # snapshots of markets whose other token has no snapshot yet, by market id then outcome (0 yes, 1 no)
+        self.pending : dict[str, dict[int, OrderBook]] = {}
+
+    def set_markets(self, markets : Iterable[StreamMarket]) -> None:
+        super().set_markets(markets)
+        self.tokens = {}
+        for m in self.markets.values():
+            self.tokens[m["yes_id"]] = (m["id"], 0) #type: ignore
+            self.tokens[m["no_id"]] = (m["id"], 1) #type: ignore
+
+    def get_subscribe_messages(self) -> list[dict]:
+        return [{"assets_ids" : list(self.tokens), "type" : "market"}]
+
+    def reset(self) -> None:
+        self.pending = {}
+
+    def handle_message(self, message : Any, books : dict[str, list[OrderBook]]) -> set[str]:
+        if isinstance(message, list):
+            updated = set()
+            for m in message:
+                updated |= self.handle_message(m, books)
+            return updated
+        event_type = message.get("event_type")
+        if event_type == "book":
+            return self.apply_book(message, books)
+        if event_type == "price_change":
+            # older messages have one asset and its changes, newer ones a list of changes that each name their asset
+            changes = message.get("price_changes") or [{**change, "asset_id" : message["asset_id"]} for change in message.get("changes", [])]
+            return self.apply_price_changes(changes, books)
+        return set()
+
+    def apply_book(self, message : dict, books : dict[str, list[OrderBook]]) -> set[str]:
+        if message["asset_id"] not in self.tokens:
+            return set()
+        market_id, outcome = self.tokens[message["asset_id"]]
+        orderbook = OrderBook({
+            "bids" : [{"price" : float(o["price"]), "size" : float(o["size"])} for o in message.get("bids", message.get("buys", []))],
+            "asks" : [{"price" : float(o["price"]), "size" : float(o["size"])} for o in message.get("asks", message.get("sells", []))]
+        })
+        if market_id in books:
+            books[market_id][outcome] = orderbook
+            return {market_id}
+        # a market is only synced once both of its tokens have a snapshot
+        pending = self.pending.setdefault(market_id, {})
+        pending[outcome] = orderbook
+        if len(pending) < 2:
+            return set()
+        books[market_id] = [pending[0], pending[1]]
+        del self.pending[market_id]
+        return {market_id}
+
+    def apply_price_changes(self, changes : list[dict], books : dict[str, list[OrderBook]]) -> set[str]:
+        updated = set()
+        for change in changes:
+            if change["asset_id"] not in self.tokens:
+                continue
+            market_id, outcome = self.tokens[change["asset_id"]]
+            side = "bids" if change["side"] == "BUY" else "asks"
+            if market_id in books:
+                books[market_id][outcome].apply_delta(side, float(change["price"]), float(change["size"]))
+                updated.add(market_id)
+            elif outcome in self.pending.get(market_id, {}):
+                self.pending[market_id][outcome].apply_delta(side, float(change["price"]), float(change["size"]))
+            else:
+                raise SequenceGap([market_id])
+        return updated
+
+    def fetch_book(self, market_id : str) -> list[OrderBook]:
+        market = self.markets[market_id]
+        return [OrderBook(self.fetch_token_book(token)) for token in (market["yes_id"], market["no_id"])] #type: ignore
+
+class MarketDataStream:
+    """Keeps local orderbooks of a set of markets up to date from the platforms' websocket feeds.
+
+    Each feed runs on one background event loop and reconnects with backoff when its connection drops. Books are only
+    served once a snapshot arrived since the last connection, and a feed that detects missed messages has the affected books
+    fetched again over REST. Deltas that arrive while that fetch is in flight may already be part of the fetched book, which
+    is the usual trade-off of a REST resync.
+
+    Listeners are called from the stream thread with the platform and id of every market whose book changed.
+    """
+
+    def __init__(self, feeds : Iterable[MarketFeed], reconnect_delay : float = MARKET_STREAM_RECONNECT_DELAY,
+                 max_reconnect_delay : float = MARKET_STREAM_MAX_RECONNECT_DELAY):
+        self.feeds = {feed.platform_name : feed for feed in feeds}
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.lock = threading.Lock()
+        self.books : dict[str, dict[str, list[OrderBook]]] = {platform : {} for platform in self.feeds}
+        self.orderbooks : dict[tuple[str, str], list[OrderBook]] = {}
+        self.listeners : list[Callable[[str, str], None]] = []
+        self.loop : asyncio.AbstractEventLoop | None = None
+        self.thread : threading.Thread | None = None
+        self.resubscribe : dict[str, asyncio.Event] = {}
+        self.stopped : asyncio.Event | None = None
+        self.started = threading.Event()
+
+    def add_listener(self, listener : Callable[[str, str], None]) -> None:
+        self.listeners.append(listener)
+
+    def set_markets(self, markets : Iterable[StreamMarket]) -> None:
+        """Subscribes to the orderbooks of exactly these markets, reconnecting any feed whose markets changed"""
+        by_platform : dict[str, list[StreamMarket]] = {platform : [] for platform in self.feeds}
+        for m in markets:
+            if m["platform"] in by_platform:
+                by_platform[m["platform"]].append(m)
+        for platform, feed in self.feeds.items():
+            if set(feed.markets) == {m["id"] for m in by_platform[platform]}:
+                continue
+            with self.lock:
+                feed.set_markets(by_platform[platform])
+                for market_id in set(self.books[platform]) - set(feed.markets):
+                    del self.books[platform][market_id]
+                    self.orderbooks.pop((platform, market_id), None)
+            if self.loop is not None and platform in self.resubscribe:
+                self.loop.call_soon_threadsafe(self.resubscribe[platform].set)
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target = lambda: asyncio.run(self.run()), daemon = True, name = "market-data-stream")
+        self.thread.start()
+        self.started.wait()
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        if self.loop is not None and self.stopped is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+        self.thread.join()
+        self.thread = None
+
+    def is_synced(self, platform : str, market_id : str) -> bool:
+        with self.lock:
+            return market_id in self.books.get(platform, {})
+
+    def get_orderbooks(self, platform : str, market_id : str) -> list[OrderBook] | None:
+        """Gets a copy of a market's current yes and no orderbooks, None if its book is not synced. The copy is shared by
+        every caller until the next change to the market."""
+        with self.lock:
+            key = (platform, market_id)
+            if key not in self.orderbooks:
+                orderbooks = self.books.get(platform, {}).get(market_id)
+                if orderbooks is None:
+                    return None
+                self.orderbooks[key] = copy_orderbooks(orderbooks)
+            return self.orderbooks[key]
+
+    def get_quote(self, platform : str, market_id : str) -> Quote | None:
+        """Gets a market's current best prices, None if its book is not synced"""
+        with self.lock:
+            orderbooks = self.books.get(platform, {}).get(market_id)
+            return None if orderbooks is None else get_quote(*orderbooks)
+
+    def updated(self, platform : str, market_ids : Iterable[str]) -> None:
+        with self.lock:
+            for market_id in market_ids:
+                self.orderbooks.pop((platform, market_id), None)
+        for market_id in market_ids:
+            for listener in self.listeners:
+                try:
+                    listener(platform, market_id)
+                except Exception as e:
+                    logging.error(f"Market data listener failed for {platform} {market_id}: {e}")
+
+    def resync(self, feed : MarketFeed, market_ids : set[str]) -> set[str]:
+        """Fetches the books of the given markets over REST, returning the ids of those that were fetched"""
+        def fetch(market_id : str) -> tuple[str, list[OrderBook] | None]:
+            try:
+                return market_id, feed.fetch_book(market_id)
+            except Exception as e:
+                logging.error(f"Could not resync {feed.platform_name} orderbook {market_id}: {e}")
+                return market_id, None
+        market_ids = market_ids & set(feed.markets)
+        with ThreadPoolExecutor(max_workers = ORDERBOOK_MAX_CONCURRENT_REQUESTS.get(feed.platform_name, 1)) as executor:
+            fetched = list(executor.map(fetch, market_ids))
+        with self.lock:
+            for market_id, orderbooks in fetched:
+                if orderbooks is None:
+                    self.books[feed.platform_name].pop(market_id, None)
+                else:
+                    self.books[feed.platform_name][market_id] = orderbooks
+        logging.info(f"Resynced {len(fetched)} {feed.platform_name} orderbooks over REST")
+        return {market_id for market_id, orderbooks in fetched if orderbooks is not None}
+
+    def clear_books(self, platform : str) -> None:
+        with self.lock:
+            self.books[platform] = {}
+            self.orderbooks = {key : value for key, value in self.orderbooks.items() if key[0] != platform}
+
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.resubscribe = {platform : asyncio.Event() for platform in self.feeds}
+        self.started.set()
+        tasks = [asyncio.create_task(self.run_feed(feed)) for feed in self.feeds.values()]
+        await self.stopped.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True)
+
+    async def run_feed(self, feed : MarketFeed) -> None:
+        delay = self.reconnect_delay
+        resubscribe = self.resubscribe[feed.platform_name]
+        while True:
+            resubscribe.clear()
+            if not feed.markets:
+                await resubscribe.wait()
+                continue
+            try:
+                async with connect(feed.url, additional_headers = feed.get_headers()) as websocket:
+                    self.clear_books(feed.platform_name)
+                    feed.reset()
+                    for message in feed.get_subscribe_messages():
+                        await websocket.send(json.dumps(message))
+                    delay = self.reconnect_delay
+                    reader = asyncio.create_task(self.read(feed, websocket))
+                    waiter = asyncio.create_task(resubscribe.wait())
+                    done, pending = await asyncio.wait({reader, waiter}, return_when = asyncio.FIRST_COMPLETED)
+                    for task in pending:
+                        task.cancel()
+                    if reader in done:
+                        reader.result()
+                        logging.info(f"{feed.platform_name} market data stream closed")
+                    else:
+                        continue
+            except (OSError, WebSocketException, asyncio.TimeoutError) as e:
+                logging.error(f"{feed.platform_name} market data stream disconnected: {e}")
+            except Exception:
+                # a message the feed could not apply, the books may have missed it so they are rebuilt from new snapshots
+                logging.exception(f"{feed.platform_name} market data stream failed, reconnecting")
+            # books are only trusted again once the next connection sent their snapshots
+            self.clear_books(feed.platform_name)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def read(self, feed : MarketFeed, websocket) -> None:
+        async for raw in websocket:
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+            try:
+                with self.lock:
+                    updated = feed.handle_message(message, self.books[feed.platform_name])
+            except SequenceGap as gap:
+                logging.info(f"{feed.platform_name} {gap}, resyncing over REST")
+                with self.lock:
+                    # the books missed messages, so they are not served until they are fetched again
+                    for market_id in gap.market_ids:
+                        self.books[feed.platform_name].pop(market_id, None)
+                        self.orderbooks.pop((feed.platform_name, market_id), None)
+                updated = await asyncio.get_running_loop().run_in_executor(None, self.resync, feed, gap.market_ids)
+            if updated:
+                self.updated(feed.platform_name, updated)
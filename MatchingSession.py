@@ -0,0 +1,72 @@
+from typing import List, Dict
+from SemanticEquivalence import SemanticEquivalence
+from EmbeddingIndex import normalize_embeddings
+from BinaryMarketMetadata import BinaryMarketMetadata
+import numpy as np
+import logging
+
+class MatchingSession:
+    """Shares one semantic equivalence model across a question map build and keeps the embedding of every market it has seen, by market id,
+    so matching questions across platforms and selecting best matches only encode each question once.
+    """
+
+    def __init__(self, nlp : SemanticEquivalence | None = None):
+        self.nlp = nlp or SemanticEquivalence()
+        self.embeddings_by_market_id : Dict[str, np.ndarray] = {}
+
+    def normalize_question(self, question : str) -> str:
+        return question.lower().strip()
+
+    def embed_markets(self, markets : List[BinaryMarketMetadata]) -> np.ndarray:
+        """Gets the normalized embedding of each market's normalized question, only encoding markets that have not been seen in this session
+
+        Args:
+            markets (List[BinaryMarketMetadata]): markets to embed
+
+        Returns:
+            np.ndarray: one unit length embedding row per market
+        """
+        new_markets = list({m.id : m for m in markets if m.id not in self.embeddings_by_market_id}.values())
+        if new_markets:
+            embeddings = normalize_embeddings(self.nlp.encode_questions([self.normalize_question(m.question) for m in new_markets]).cpu().numpy())
+            for market, embedding in zip(new_markets, embeddings):
+                self.embeddings_by_market_id[market.id] = embedding
+        dimension = self.nlp.model.get_sentence_embedding_dimension()
+        return np.array([self.embeddings_by_market_id[m.id] for m in markets], dtype = np.float32).reshape(len(markets), dimension)
+
+    def embed_unique_questions(self, questions : List[str], entries : List[List[BinaryMarketMetadata]]) -> np.ndarray:
+        """Gets the normalized embedding of each unique question of a question map.
+
+        A unique question is the normalized question of the market that first listed it, so its embedding is reused from that market;
+        only questions whose founding market is gone are encoded.
+
+        Args:
+            questions (List[str]): unique questions
+            entries (List[List[BinaryMarketMetadata]]): markets mapped to each unique question
+
+        Returns:
+            np.ndarray: one unit length embedding row per unique question
+        """
+        founders : List[BinaryMarketMetadata | None] = [next((m for m in entry if self.normalize_question(m.question) == question), None)
+                                                        for question, entry in zip(questions, entries)]
+        founder_embeddings = self.embed_markets([m for m in founders if m is not None])
+        out = np.empty((len(questions), founder_embeddings.shape[1]), dtype = np.float32)
+        found = np.array([m is not None for m in founders], dtype = bool)
+        out[found] = founder_embeddings
+        if not found.all():
+            orphans = [q for q, m in zip(questions, founders) if m is None]
+            logging.info(f"Encoding {len(orphans)} unique questions without a founding market")
+            out[~found] = normalize_embeddings(self.nlp.encode_questions(orphans).cpu().numpy())
+        return out
+
+    def best_match(self, question_embedding : np.ndarray, markets : List[BinaryMarketMetadata]) -> BinaryMarketMetadata:
+        """Gets the market whose question is most similar to a unique question, comparing stored embeddings
+
+        Args:
+            question_embedding (np.ndarray): normalized embedding of the unique question
+            markets (List[BinaryMarketMetadata]): candidate markets
+
+        Returns:
+            BinaryMarketMetadata: most similar candidate market
+        """
+        return markets[int(np.argmax(self.embed_markets(markets) @ question_embedding))]
@@ -0,0 +1,164 @@
+import json
+import queue
+import threading
+import time
+import logging
+import numpy as np
+from typing import Callable, TypedDict
+from BetOpportunitySnapshot import BetOpportunitySnapshot
+from constants import *
+
+class StreamThresholds(TypedDict):
+    absolute_return : float # summed absolute return whose crossing is reported
+    annualized_return : float # summed annualized return whose crossing is reported
+
+class StreamEvent(TypedDict):
+    type : str # new | removed | crossed | snapshot
+    data : str # json payload
+
+def get_crossings(old_values : np.ndarray, new_values : np.ndarray, threshold : float) -> tuple[np.ndarray, np.ndarray]:
+    """Gets which values rose to or above a threshold and which fell below it, where a missing (nan) value is below every threshold"""
+    old_above = np.nan_to_num(old_values, nan = -np.inf) >= threshold
+    new_above = np.nan_to_num(new_values, nan = -np.inf) >= threshold
+    return ~old_above & new_above, old_above & ~new_above
+
+def diff_snapshots(old : BetOpportunitySnapshot, new : BetOpportunitySnapshot, thresholds : StreamThresholds) -> list[StreamEvent]:
+    """Gets the bet opportunities that were added, removed or whose summed absolute or annualized return crossed a threshold
+    between two snapshots
+
+    Args:
+        old (BetOpportunitySnapshot): previous snapshot
+        new (BetOpportunitySnapshot): current snapshot
+        thresholds (StreamThresholds): returns whose crossing is reported
+
+    Returns:
+        list[StreamEvent]: events in the order new, removed, crossed, each carrying the version of the new snapshot
+    """
+    events : list[StreamEvent] = []
+    for id, i in new.positions.items():
+        if id not in old.positions:
+            events.append({"type" : "new", "data" : f'{{"version": {new.version}, "bet_opportunity": {new.serialized[i]}}}'})
+    for id in old.positions:
+        if id not in new.positions:
+            events.append({"type" : "removed", "data" : json.dumps({"version" : new.version, "id" : id})})
+    common = [id for id in new.positions if id in old.positions]
+    old_positions = np.array([old.positions[id] for id in common], dtype = np.int64)
+    new_positions = np.array([new.positions[id] for id in common], dtype = np.int64)
+    crossings : dict[int, list[dict]] = {}
+    for field, sort_key in (("absolute_return", BetOpportunitySortKey.parity_return), ("annualized_return", BetOpportunitySortKey.parity_return_annualized)):
+        threshold = thresholds[field] #type: ignore
+        rose, fell = get_crossings(old.returns[sort_key][old_positions], new.returns[sort_key][new_positions], threshold)
+        for direction, crossed in (("above", rose), ("below", fell)):
+            for i in new_positions[crossed].tolist():
+                crossings.setdefault(i, []).append({"field" : field, "threshold" : threshold, "direction" : direction})
+    for i, crossed in crossings.items():
+        events.append({"type" : "crossed", "data" : f'{{"version": {new.version}, "crossed": {json.dumps(crossed)}, "bet_opportunity": {new.serialized[i]}}}'})
+    return events
+
+class StreamClient:
+    """Bounded queue of events for one stream client. A client that falls behind has its queued events dropped and is sent the
+    whole snapshot instead, so a slow consumer never holds more than max_events in memory."""
+
+    def __init__(self, thresholds : StreamThresholds, max_events : int = STREAM_CLIENT_QUEUE_SIZE):
+        self.thresholds = thresholds
+        self.events : queue.Queue[StreamEvent] = queue.Queue(maxsize = max_events)
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, events : list[StreamEvent]) -> None:
+        with self.lock:
+            for i, event in enumerate(events):
+                try:
+                    self.events.put_nowait(event)
+                except queue.Full:
+                    self.drop_to_snapshot(len(events) - i)
+                    return
+
+    def drop_to_snapshot(self, unsent : int) -> None:
+        """Replaces every queued event with a single snapshot event"""
+        while True:
+            try:
+                self.events.get_nowait()
+                unsent += 1
+            except queue.Empty:
+                break
+        self.dropped += unsent
+        self.events.put_nowait({"type" : "snapshot", "data" : ""})
+
+    def get(self, timeout : float) -> StreamEvent | None:
+        """Waits for the next event, None if none arrived within timeout"""
+        try:
+            return self.events.get(timeout = timeout)
+        except queue.Empty:
+            return None
+
+class OpportunityStream:
+    """Pushes the bet opportunities that changed between snapshots to every subscribed client.
+
+    A new snapshot is published after each refresh, and while there are clients a background thread also checks the store
+    version so refreshes from other processes are picked up. Each client starts with a snapshot event, and events carry the
+    version they were diffed at, so a client can ignore events no newer than the last snapshot it received.
+    """
+
+    def __init__(self, get_snapshot : Callable[[], BetOpportunitySnapshot], poll_interval : float = STREAM_POLL_SECONDS):
+        self.get_snapshot = get_snapshot
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.clients : set[StreamClient] = set()
+        self.snapshot : BetOpportunitySnapshot | None = None
+        self.poller : threading.Thread | None = None
+
+    def subscribe(self, thresholds : StreamThresholds) -> StreamClient:
+        client = StreamClient(thresholds)
+        client.put([{"type" : "snapshot", "data" : ""}])
+        with self.lock:
+            self.clients.add(client)
+            if self.snapshot is None:
+                self.snapshot = self.get_snapshot()
+            if self.poller is None:
+                self.poller = threading.Thread(target = self.poll, daemon = True, name = "opportunity-stream")
+                self.poller.start()
+        return client
+
+    def unsubscribe(self, client : StreamClient) -> None:
+        with self.lock:
+            self.clients.discard(client)
+
+    def poll(self) -> None:
+        while True:
+            with self.lock:
+                if not self.clients:
+                    self.poller = None
+                    return
+            try:
+                self.publish(self.get_snapshot())
+            except Exception as e:
+                logging.error(f"Could not check for new bet opportunities: {e}")
+            time.sleep(self.poll_interval)
+
+    def publish(self, snapshot : BetOpportunitySnapshot) -> None:
+        """Sends every client the changes between the last published snapshot and this one, if it is newer"""
+        with self.lock:
+            if self.snapshot is None:
+                self.snapshot = snapshot
+                return
+            if snapshot.version <= self.snapshot.version:
+                return
+            # clients with the same thresholds share one diff
+            events_by_thresholds : dict[tuple[float, float], list[StreamEvent]] = {}
+            for client in self.clients:
+                key = (client.thresholds["absolute_return"], client.thresholds["annualized_return"])
+                if key not in events_by_thresholds:
+                    events_by_thresholds[key] = diff_snapshots(self.snapshot, snapshot, client.thresholds)
+                client.put(events_by_thresholds[key])
+            self.snapshot = snapshot
+
+    def render(self, event : StreamEvent) -> str:
+        """Formats an event as a server-sent event, filling in snapshot events with the last published snapshot"""
+        data = event["data"]
+        if event["type"] == "snapshot":
+            with self.lock:
+                snapshot = self.snapshot
+            assert snapshot is not None
+            data = f'{{"version": {snapshot.version}, "data": [{", ".join(snapshot.serialized)}]}}'
+        return f"event: {event['type']}\ndata: {data}\n\n"
@@ -1,56 +1,330 @@
-from typing import TypedDict
+from typing import TypedDict, Iterable, Iterator
+from sortedcontainers import SortedDict #type: ignore
+import numpy as np
 
 class Order(TypedDict):
     price : float
     size : float
 
 class OrderbookData(TypedDict):
-    bids : list[Order] #sorted by price increasing
-    asks : list[Order] #sorted by price decreasing
+    bids : list[Order] #sorted by price decreasing
+    asks : list[Order] #sorted by price increasing
 
 DEFAULT_ORDERBOOK_DATA : OrderbookData = {
     "asks" : [],
     "bids" : []
 }
 
+def get_fill_price(prices : np.ndarray, cumulative_sizes : np.ndarray, cumulative_costs : np.ndarray, contracts : float) -> float | None:
+    """Given one side of an orderbook as price levels in fill order with their running totals, gets the average price of filling a number of contracts.
+
+    Args:
+        prices (np.ndarray): level prices in the order they would be filled
+        cumulative_sizes (np.ndarray): running total of contracts available up to and including each level
+        cumulative_costs (np.ndarray): running total of price * size up to and including each level
+        contracts (float): number of contracts to fill
+
+    Returns:
+        float | None: average fill price, None if there is not enough depth to fill the contracts
+    """
+    if len(prices) == 0 or cumulative_sizes[-1] < contracts:
+        return None
+    if contracts <= 0:
+        return float(prices[0])
+    # first level whose running total covers the order
+    i = int(np.searchsorted(cumulative_sizes, contracts))
+    filled_before = cumulative_sizes[i - 1] if i > 0 else 0.0
+    cost_before = cumulative_costs[i - 1] if i > 0 else 0.0
+    return float((cost_before + prices[i] * (contracts - filled_before)) / contracts)
+
+class SideArrays(TypedDict):
+    prices : np.ndarray
+    sizes : np.ndarray
+    cumulative_sizes : np.ndarray
+    cumulative_costs : np.ndarray
+
+def to_side_arrays(levels : list[tuple[float, float]]) -> SideArrays:
+    prices = np.fromiter((price for price, _ in levels), dtype = np.float64, count = len(levels))
+    sizes = np.fromiter((size for _, size in levels), dtype = np.float64, count = len(levels))
+    return {"prices" : prices, "sizes" : sizes, "cumulative_sizes" : np.cumsum(sizes), "cumulative_costs" : np.cumsum(prices * sizes)}
+
+class PriceLevels:
+    """One side of an orderbook as a sorted map of price to size, so setting a level is O(log n) and the best levels are
+    read without sorting.
+
+    Prices are keyed in platform units, units per 1.0 of price (100 for Kalshi cents), so integer tick prices stay exact.
+    The numpy arrays used for depth queries are built on first use after each change.
+    """
+
+    def __init__(self, levels : Iterable[tuple[float, float]] = (), descending : bool = False, units : int = 1):
+        """
+        Args:
+            levels (Iterable[tuple[float, float]], optional): (price in units, size) pairs in any order, sizes at the same price are added
+            descending (bool, optional): whether the best level is the highest price, as for bids
+            units (int, optional): price units per 1.0
+        """
+        self.levels = SortedDict()
+        self.descending = descending
+        self.units = units
+        self.version = 0
+        self._arrays : SideArrays | None = None
+        self._arrays_version = -1
+        for key, size in levels:
+            self.add(key, size)
+
+    def to_key(self, price : float) -> float:
+        return price if self.units == 1 else round(price * self.units)
+
+    def to_price(self, key : float) -> float:
+        return key if self.units == 1 else key / self.units
+
+    def set(self, key : float, size : float) -> None:
+        """Sets the size at a price in units, removing the level when the size is 0"""
+        if size > 0:
+            self.levels[key] = size
+        else:
+            self.levels.pop(key, None)
+        self.version += 1
+
+    def add(self, key : float, size : float) -> None:
+        """Changes the size at a price in units by size"""
+        self.set(key, self.levels.get(key, 0.0) + size)
+
+    def replace(self, levels : Iterable[tuple[float, float]]) -> None:
+        """Replaces every level with (price in units, size) pairs"""
+        self.levels = SortedDict()
+        self.version += 1
+        for key, size in levels:
+            self.add(key, size)
+
+    def copy(self) -> "PriceLevels":
+        out = PriceLevels(descending = self.descending, units = self.units)
+        out.levels = self.levels.copy()
+        out.version = self.version
+        out._arrays, out._arrays_version = self._arrays, self._arrays_version
+        return out
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def iter_levels(self) -> Iterator[tuple[float, float]]:
+        """Iterates (price, size) from the best level"""
+        keys = reversed(self.levels) if self.descending else iter(self.levels)
+        for key in keys:
+            yield self.to_price(key), self.levels[key]
+
+    def get_level(self, i : int) -> tuple[float, float]:
+        """Gets the (price, size) of the i-th best level in O(log n)"""
+        key, size = self.levels.peekitem(-1 - i if self.descending else i)
+        return self.to_price(key), size
+
+    def arrays(self) -> SideArrays:
+        if self._arrays is None or self._arrays_version != self.version:
+            self._arrays = to_side_arrays(list(self.iter_levels()))
+            self._arrays_version = self.version
+        return self._arrays
+
+class ComplementLevels:
+    """Read-through view of a PriceLevels at complementary prices, 1 - price. The bids for one outcome of a binary market
+    are the asks for the other, and the complement of the best bid is the best ask, so the view keeps the same level order."""
+
+    def __init__(self, levels : PriceLevels):
+        self.underlying = levels
+        self._arrays : SideArrays | None = None
+        self._arrays_version = -1
+
+    @property
+    def units(self) -> int:
+        return self.underlying.units
+
+    @property
+    def version(self) -> int:
+        return self.underlying.version
+
+    def to_key(self, price : float) -> float:
+        return self.underlying.units - self.underlying.to_key(price)
+
+    def to_price(self, key : float) -> float:
+        return (self.underlying.units - key) / self.underlying.units
+
+    def set(self, key : float, size : float) -> None:
+        self.underlying.set(key, size)
+
+    def __len__(self) -> int:
+        return len(self.underlying)
+
+    def iter_levels(self) -> Iterator[tuple[float, float]]:
+        levels = self.underlying.levels
+        keys = reversed(levels) if self.underlying.descending else iter(levels)
+        for key in keys:
+            yield self.to_price(key), levels[key]
+
+    def get_level(self, i : int) -> tuple[float, float]:
+        key, size = self.underlying.levels.peekitem(-1 - i if self.underlying.descending else i)
+        return self.to_price(key), size
+
+    def arrays(self) -> SideArrays:
+        if self._arrays is None or self._arrays_version != self.version:
+            self._arrays = to_side_arrays(list(self.iter_levels()))
+            self._arrays_version = self.version
+        return self._arrays
+
 class OrderBook:
+    """Orderbook whose asks and bids are sorted price levels. Levels can be changed one at a time with apply_delta, and the
+    numpy price / size arrays with running size and cost totals used for depth queries are rebuilt lazily after a change, so
+    depth queries are still a binary search."""
+
     def __init__(self, orderbook_data : OrderbookData = DEFAULT_ORDERBOOK_DATA):
-        self.data = self.sort_orderbook_data(orderbook_data)
-
-    def sort_orderbook_data(self, data : OrderbookData) -> OrderbookData:
-        asks = data["asks"]
-        bids = data["bids"]
-        sorted_asks = sorted(asks, key = lambda x : x["price"])
-        sorted_bids = sorted(bids, key = lambda x : x["price"], reverse=True)
-        return {
-            "asks" : sorted_asks,
-            "bids" :  sorted_bids
-        }
+        self.asks : PriceLevels | ComplementLevels = PriceLevels(((o["price"], o["size"]) for o in orderbook_data["asks"]))
+        self.bids : PriceLevels | ComplementLevels = PriceLevels(((o["price"], o["size"]) for o in orderbook_data["bids"]), descending = True)
+        self._data : OrderbookData | None = None
+        self._data_version : tuple[int, int] | None = None
+
+    @classmethod
+    def from_levels(cls, asks : PriceLevels | ComplementLevels, bids : PriceLevels | ComplementLevels) -> "OrderBook":
+        """Gets an orderbook over existing price levels, without copying them"""
+        orderbook = cls.__new__(cls)
+        orderbook.asks = asks
+        orderbook.bids = bids
+        orderbook._data = None
+        orderbook._data_version = None
+        return orderbook
+
+    def get_side(self, side : str) -> PriceLevels | ComplementLevels:
+        if side == "asks":
+            return self.asks
+        if side == "bids":
+            return self.bids
+        raise ValueError(f"Unknown orderbook side {side}, expected asks or bids")
+
+    def apply_delta(self, side : str, price : float, size : float) -> None:
+        """Sets the size at one price level in O(log n), removing the level when the size is 0
+
+        Args:
+            side (str): asks | bids
+            price (float): level price
+            size (float): new size of the level
+        """
+        levels = self.get_side(side)
+        levels.set(levels.to_key(price), size)
+
+    @property
+    def ask_prices(self) -> np.ndarray:
+        return self.asks.arrays()["prices"]
+
+    @property
+    def ask_sizes(self) -> np.ndarray:
+        return self.asks.arrays()["sizes"]
+
+    @property
+    def ask_cumulative_sizes(self) -> np.ndarray:
+        return self.asks.arrays()["cumulative_sizes"]
+
+    @property
+    def ask_cumulative_costs(self) -> np.ndarray:
+        return self.asks.arrays()["cumulative_costs"]
+
+    @property
+    def bid_prices(self) -> np.ndarray:
+        return self.bids.arrays()["prices"]
+
+    @property
+    def bid_sizes(self) -> np.ndarray:
+        return self.bids.arrays()["sizes"]
+
+    @property
+    def bid_cumulative_sizes(self) -> np.ndarray:
+        return self.bids.arrays()["cumulative_sizes"]
+
+    @property
+    def bid_cumulative_costs(self) -> np.ndarray:
+        return self.bids.arrays()["cumulative_costs"]
+
+    @property
+    def data(self) -> OrderbookData:
+        version = (self.asks.version, self.bids.version)
+        if self._data is None or self._data_version != version:
+            self._data = {
+                "asks" : [{"price" : p, "size" : s} for p, s in self.asks.iter_levels()],
+                "bids" : [{"price" : p, "size" : s} for p, s in self.bids.iter_levels()]
+            }
+            self._data_version = version
+        return self._data
 
     def get_sorted_asks(self) -> list[Order]:
         return self.data["asks"]
-    
+
     def get_sorted_bids(self) -> list[Order]:
         return self.data["bids"]
 
-    def implied_ask_price(self, amount : float) -> float:
-        return 0.0 #TBU
+    def get_top_asks(self, n : int) -> list[Order]:
+        """Gets the n best asks without building the whole book"""
+        return [{"price" : p, "size" : s} for p, s in (self.asks.get_level(i) for i in range(min(n, len(self.asks))))]
 
-    def implied_bid_price(self, sale_amount : float) -> float:
-        return 0.0 #TBU
+    def get_top_bids(self, n : int) -> list[Order]:
+        """Gets the n best bids without building the whole book"""
+        return [{"price" : p, "size" : s} for p, s in (self.bids.get_level(i) for i in range(min(n, len(self.bids))))]
+
+    def implied_ask_price(self, amount : float) -> float | None:
+        """Gets the average price paid to buy a number of contracts by walking up the asks.
+
+        Args:
+            amount (float): number of contracts to buy
+
+        Returns:
+            float | None: average price per contract, None if there are not enough asks to fill the order
+        """
+        return get_fill_price(self.ask_prices, self.ask_cumulative_sizes, self.ask_cumulative_costs, amount)
+
+    def implied_bid_price(self, sale_amount : float) -> float | None:
+        """Gets the average price received to sell a number of contracts by walking down the bids.
+
+        Args:
+            sale_amount (float): number of contracts to sell
+
+        Returns:
+            float | None: average price per contract, None if there are not enough bids to fill the order
+        """
+        return get_fill_price(self.bid_prices, self.bid_cumulative_sizes, self.bid_cumulative_costs, sale_amount)
 
     def get_best_ask(self) -> Order:
-        return self.data["asks"][0]
-    
+        price, size = self.asks.get_level(0)
+        return {"price" : price, "size" : size}
+
     def get_best_bid(self) -> Order:
-        return self.data["bids"][0]
-    
+        price, size = self.bids.get_level(0)
+        return {"price" : price, "size" : size}
+
     def __str__(self) -> str:
         return str(self.data)
-    
+
     def to_json(self) -> OrderbookData:
         return self.data
-    
+
     @classmethod
     def from_json(cls, data):
-        return OrderBook(data)
\ No newline at end of file
+        return OrderBook(data)
+
+def get_complementary_orderbooks(yes_bids : PriceLevels, no_bids : PriceLevels) -> list[OrderBook]:
+    """Gets the yes and no orderbooks of a binary market quoted only as bids, as on Kalshi. Buying yes is selling no at
+    the complementary price, so the yes asks are a view of the no bids and the no asks a view of the yes bids, and a change
+    to either set of bids shows in both orderbooks.
+
+    Args:
+        yes_bids (PriceLevels): bids for yes
+        no_bids (PriceLevels): bids for no
+
+    Returns:
+        list[OrderBook]: yes orderbook, no orderbook
+    """
+    return [OrderBook.from_levels(ComplementLevels(no_bids), yes_bids), OrderBook.from_levels(ComplementLevels(yes_bids), no_bids)]
+
+def copy_orderbooks(orderbooks : list[OrderBook]) -> list[OrderBook]:
+    """Copies orderbooks so later deltas don't change the copies, keeping levels shared between them shared in the copies"""
+    copies : dict[int, PriceLevels] = {}
+    def copy_levels(levels : PriceLevels | ComplementLevels) -> PriceLevels | ComplementLevels:
+        underlying = levels.underlying if isinstance(levels, ComplementLevels) else levels
+        if id(underlying) not in copies:
+            copies[id(underlying)] = underlying.copy()
+        return ComplementLevels(copies[id(underlying)]) if isinstance(levels, ComplementLevels) else copies[id(underlying)]
+    return [OrderBook.from_levels(copy_levels(o.asks), copy_levels(o.bids)) for o in orderbooks]
@@ -1,13 +1,22 @@
-from typing import TypedDict
+from typing import TypedDict, Generator
 import json
 from QuestionMap import QuestionMap
+from MatchingSession import MatchingSession
 import pandas as pd #type: ignore
-from BettingPlatform import Polymarket, Kalshi, BettingPlatform, BinaryMarket, BinaryMarketMetadata
+from BettingPlatform import Polymarket, Kalshi, BettingPlatform, BinaryMarket, BinaryMarketMetadata, read_market_snapshot, valid_prices
+from MarketStream import MarketDataStream, StreamMarket
+from MarketSnapshot import use_snapshot, get_snapshot_path
 from datetime import datetime, timezone
 from OrderBook import OrderBook
 from constants import *
-from BetOpportunity import BetOpportunity
+from BetOpportunity import BetOpportunity, refresh_return_calculations
 from SemanticEquivalence import filter_bet_opportunities_with_llm_semantic_equivalence, BetOpportunityTitles
+from EmbeddingCache import EmbeddingCache
+from CrossEncoderReranker import CrossEncoderReranker
+from BetOpportunityStore import BetOpportunityStore
+from RefreshJobs import RefreshProgress
+from RefreshPlanner import RefreshPlanner
+from market_requests import iter_market_results
 import uuid
 import logging
 
@@ -52,26 +61,26 @@ class QuestionData:
                 "questions_filepath" : BETTING_PLATFORM_DATA[BetPlatform.Polymarket]["question_filepath"]
             }
         }
+        self.bet_opportunity_store = BetOpportunityStore(BET_OPPORTUNITIES_DB_PATH)
+        self.bet_opportunity_store.migrate_from_json(BET_OPPORTUNITIES_FILE)
+        self.refresh_planner = RefreshPlanner()
+        # when each market's prices were last refreshed by this process
+        self.market_refresh_times : dict[tuple[str, str], datetime] = {}
+        self.market_stream = MarketDataStream(m["betting_platform"].get_market_feed() for m in self.betting_platforms.values())
 
     def open_question_map_json(self, json_file : str) -> QuestionMap:
          with open(json_file, 'r') as f:
             question_map_json = json.load(f)
             return QuestionMap.from_json(question_map_json)
 
-    def delete_bet_opportunity(self, id : str) -> tuple[bool, list[BetOpportunity]]:
-        bet_opportunities = self.get_bet_opportunities()
-        to_delete_index = None
-        for i in range(len(bet_opportunities)):
-            if bet_opportunities[i].id == id:
-                to_delete_index = i
-                break
-        
-        if to_delete_index != None:
-            bet_opportunities.pop(to_delete_index)
-            self.save_bet_opportunities(bet_opportunities)
-            return True, bet_opportunities
-        else:
-            return False, bet_opportunities
+    def delete_bet_opportunity(self, id : str) -> tuple[bool, int]:
+        """Deletes a bet opportunity by id
+
+        Returns:
+            tuple[bool, int]: whether the bet opportunity was found and the number of bet opportunities remaining
+        """
+        found = self.bet_opportunity_store.delete(id)
+        return found, len(self.bet_opportunity_store)
 
     def save_active_markets_to_json(self):
         """For each platform in the data set, gets all active markets and saves them lists of binary market metadata
@@ -81,32 +90,87 @@ class QuestionData:
             market = self.betting_platforms[market_name]["betting_platform"]
             market.save_active_markets(self.betting_platforms[market_name]["questions_filepath"], None)
 
+    def read_binary_market_metadata(self, filepath : str) -> list[BinaryMarketMetadata]:
+        """Reads question data from the columnar snapshot saved next to a json filepath, falling back to the json itself
+        if there is no snapshot or the json is newer"""
+        if use_snapshot(filepath):
+            return read_market_snapshot(get_snapshot_path(filepath))
+        return self.read_binary_market_metadata_json(filepath)
+
     def read_binary_market_metadata_json(self, filepath : str ) -> list[BinaryMarketMetadata]:
         with open(filepath, "r") as json_file:
             metadata = json.load(json_file)
             return [BinaryMarketMetadata.from_json(m) for m in metadata]
 
-    def build_question_map(self, filepaths : list[str]) -> QuestionMap:
+    def build_question_map(self, filepaths : list[str], candidate_map_filepath : str | None = None) -> QuestionMap:
         """Given a list of filepaths representing where arrays of binary market metadata are stored, uses nlp
             to map each unique question across all platforms to a list of markets that are semantically equivalent 
 
         Args:
             filepaths (list[str]): list of filepaths to binary markets
+            candidate_map_filepath (str | None, optional): where to save the map before best match selection so it can later be updated incrementally. Defaults to None.
 
         Returns:
             QuestionMap: maps each unique question across platforms to a list of markets that are semantically equivalent
         """
         questions_by_platform : list[list[BinaryMarketMetadata]] = []
         for filepath in filepaths:
-            platform_questions = self.read_binary_market_metadata_json(filepath)
+            platform_questions = self.read_binary_market_metadata(filepath)
             questions_by_platform.append(platform_questions)
         
+        # one model and one set of market embeddings for the whole build
+        session = MatchingSession()
         qmap = QuestionMap()
-        qmap.map_questions_across_platforms(questions_by_platform)
+        qmap.map_questions_across_platforms(questions_by_platform, session = session)
         logging.info("Mapping all questions across platforms to a semantically unique question...")
-        qmap.get_best_match_by_platform()
+        if candidate_map_filepath:
+            self.save_question_map_to_json(qmap, candidate_map_filepath)
+        qmap.get_best_match_by_platform(session)
         logging.info("Finding most semantically equivalent question for each platform for each question...")
+        self.prune_embedding_cache(qmap, questions_by_platform)
         return qmap
+
+    def update_question_map(self, filepaths : list[str], candidate_map_filepath : str, active_map_filepath : str) -> QuestionMap:
+        """Incrementally updates a saved question map with the latest binary market metadata instead of rebuilding it.
+
+        Markets that closed or expired since the last map are dropped, only newly listed markets are matched against the existing
+        unique questions, and best matches are only re-selected for the unique questions whose markets changed.
+        Both the candidate map and the active map are saved back to their files.
+
+        Args:
+            filepaths (list[str]): list of filepaths to binary markets
+            candidate_map_filepath (str): candidate map saved by the last build or update
+            active_map_filepath (str): question map saved by the last build or update
+
+        Returns:
+            QuestionMap: updated question map
+        """
+        candidate_map = self.open_question_map_json(candidate_map_filepath)
+        active_map = self.open_question_map_json(active_map_filepath)
+        questions_by_platform : list[list[BinaryMarketMetadata]] = [self.read_binary_market_metadata(filepath) for filepath in filepaths]
+        candidate_map.update(active_map, questions_by_platform, datetime.now(timezone.utc))
+
+        self.save_question_map_to_json(candidate_map, candidate_map_filepath)
+        self.save_question_map_to_json(active_map, active_map_filepath)
+        self.prune_embedding_cache(candidate_map, questions_by_platform)
+        return active_map
+
+    def prune_embedding_cache(self, question_map : QuestionMap, questions_by_platform : list[list[BinaryMarketMetadata]]) -> None:
+        """Drops cached embeddings for questions that are no longer in the active markets (e.g. expired markets) and compacts the cache
+
+        Args:
+            question_map (QuestionMap): question map built from the active markets
+            questions_by_platform (list[list[BinaryMarketMetadata]]): active markets for each platform
+        """
+        active_questions : set[str] = set(question_map.keys())
+        for platform_questions in questions_by_platform:
+            for q in platform_questions:
+                active_questions.add(q.question)
+                active_questions.add(question_map.normalize_question(q.question))
+        cache = EmbeddingCache(EMBEDDING_MODEL_NAME)
+        removed = cache.retain(active_questions)
+        cache.compact()
+        logging.info(f"Removed {removed} inactive questions from the embedding cache")
     
     def save_question_map_to_json(self, question_map : QuestionMap, filepath : str) -> None:
         with open(filepath, 'w') as f:
@@ -118,17 +182,16 @@ class QuestionData:
         Returns:
             list[BetOpportunity]: list of current bet opportunites
         """
-        json_file = BET_OPPORTUNITIES_FILE
-        with open(json_file, 'r') as f:
-            bet_opportunities = json.load(f)
-            return [BetOpportunity.from_json(bo) for bo in bet_opportunities]
+        return [BetOpportunity.from_json(bo) for bo in self.bet_opportunity_store.get_all()]
 
-    def get_bet_opportunities_from_question_map(self, question_map: QuestionMap, n : (int | None) = None, llm_check : bool = False, llm_model : LLM | None = None) -> tuple[list[BetOpportunity], float]: 
+    def get_bet_opportunities_from_question_map(self, question_map: QuestionMap, n : (int | None) = None, llm_check : bool = False, llm_model : LLM | None = None,
+                                                rerank : bool = True) -> tuple[list[BetOpportunity], float]: 
         """Given a QuestionMap, gets a list of bet opportunities
 
         Args:
             question_map (QuestionMap): maps normalized, unique questions across all platforms to a list of semantically equivalent binary markets across platforms
             n (int  |  None, optional): limit for testing Defaults to None.
+            rerank (bool, optional): when checking with an llm, first score pairs with a local cross-encoder and only send the uncertain ones to the llm. Defaults to True.
 
         Returns:
             list[BetOpportunity]: a list of bet opportunities containing latest market information for two markets
@@ -177,87 +240,122 @@ class QuestionData:
                                     bo_id
                                 )
                             )
+        refresh_return_calculations(out)
         # check market title equivalence
         if llm_check and llm_model:
             # further guarantee name semantic equivalence using an LLM
             logging.info("filtering for semantic equivalence via llm...")
             titles : list[BetOpportunityTitles] = [{"id" : x.id, 
+                    "market_1_id" : x.market_1.id,
                     "market_1_question" : x.market_1.question, 
                     "market_1_description" : x.market_1.description,
+                    "market_2_id" : x.market_2.id,
                     "market_2_question" : x.market_2.question,
                     "market_2_description" : x.market_2.description
                     } for x in out]
-            valid_ids, llm_cost = filter_bet_opportunities_with_llm_semantic_equivalence(bet_opportunities=titles, model = llm_model)
+            valid_ids, llm_cost = filter_bet_opportunities_with_llm_semantic_equivalence(bet_opportunities=titles, model = llm_model,
+                                                                                          reranker = CrossEncoderReranker() if rerank else None)
             return list(filter(lambda x: x.id in valid_ids, out)), llm_cost
         return out, 0.0
 
-    def get_updated_bet_opportunity_data(self) -> list[BetOpportunity]:
-        """Given the path to a bet opportunities json file, 
-            - reads it
-            - refreshes it with latest market data
-            - returns as a list of bet opportunities 
+    def get_updated_bet_opportunity_data(self, progress : RefreshProgress | None = None) -> list[BetOpportunity]:
+        """Reads the stored bet opportunities, refreshes them with latest market data and returns them as a list of bet opportunities
 
         Args:
-            bet_opportunities_file (str): path to a json file containing the bet opportunities
+            progress (RefreshProgress | None, optional): progress to report each stage and each platform's market data requests to
 
         Returns:
             list[BetOpportunity]: updated bet opportunities with latest market data
         """
+        progress = progress or RefreshProgress()
+        progress.start_stage(RefreshStage.load)
         bet_opportunities = self.get_bet_opportunities()
+        progress.finish_stage(RefreshStage.load)
 
-        binary_market_by_platform : dict[str, list[BinaryMarket]] = {}
+        # each market once, most in need of a refresh first, within the request budget
+        now = datetime.now(timezone.utc)
+        plan = self.refresh_planner.plan(bet_opportunities, self.market_refresh_times, now)
+        for platform, skipped in plan["skipped"].items():
+            if skipped:
+                logging.info(f"Request budget reached, {skipped} {platform} markets keep their last prices until a later refresh")
 
-        # organize markets by platform
-        for bo in bet_opportunities:
-            for binary_market in [bo.market_1, bo.market_2]:
-                platform = binary_market.platform
-                if platform in binary_market_by_platform:
-                    binary_market_by_platform[platform].append(binary_market)
-                else:
-                    binary_market_by_platform[platform] = [binary_market]
-        
-        #map each market id to its updated market 
-        updated_market_map : dict[str, BinaryMarket] = {}
-        for platform in binary_market_by_platform:
-            binary_markets = binary_market_by_platform[platform]
-            updated_markets = self.betting_platforms[platform]["betting_platform"].get_batch_market_data(binary_markets)
+        #map each market to its updated market 
+        progress.start_stage(RefreshStage.fetch_market_data)
+        requested_markets : set[tuple[str, str]] = set()
+        updated_market_map : dict[tuple[str, str], BinaryMarket] = {}
+        for platform, binary_markets in plan["markets"].items():
+            requested_markets.update((platform, m.id) for m in binary_markets)
+            updated_markets = self.betting_platforms[platform]["betting_platform"].get_batch_market_data(
+                binary_markets, lambda done, total: progress.update_platform(platform, done, total) #type: ignore
+            )
             for m in updated_markets:
-                updated_market_map[m.id] = m
+                updated_market_map[(platform, m.id)] = m
+                self.market_refresh_times[(platform, m.id)] = now
+        progress.finish_stage(RefreshStage.fetch_market_data)
 
+        # fan the updated markets out to every bet opportunity they are in
         out : list[BetOpportunity] = []
         for bo in bet_opportunities:
-            market_id_1 = bo.market_1.id
-            market_id_2 = bo.market_2.id
-            #only add if both updatedfe
-            if market_id_1 in updated_market_map and market_id_2 in updated_market_map:
-                bo.market_1 = updated_market_map[market_id_1]
-                bo.market_2 = updated_market_map[market_id_2]
-                bo.last_update = datetime.now(timezone.utc)
-                bo.refresh_return_calculations()
-                out.append(bo)
-            elif market_id_1 in updated_market_map:
-                logging.info("Could not get market date for platform {} market {}".format(bo.market_2.platform, market_id_2))
-            elif market_id_2 in updated_market_map:
-                logging.info("Could not get market date for platform {} market {}".format(bo.market_1.platform, market_id_1))
-            else:
+            key_1 = (bo.market_1.platform, bo.market_1.id)
+            key_2 = (bo.market_2.platform, bo.market_2.id)
+            missing_1 = key_1 in requested_markets and key_1 not in updated_market_map
+            missing_2 = key_2 in requested_markets and key_2 not in updated_market_map
+            #only keep if no requested market is missing
+            if missing_1 and missing_2:
                 logging.info("Could not get market data for question {}".format(bo.question))
+            elif missing_1:
+                logging.info("Could not get market date for platform {} market {}".format(bo.market_1.platform, bo.market_1.id))
+            elif missing_2:
+                logging.info("Could not get market date for platform {} market {}".format(bo.market_2.platform, bo.market_2.id))
+            else:
+                bo.market_1 = updated_market_map.get(key_1, bo.market_1)
+                bo.market_2 = updated_market_map.get(key_2, bo.market_2)
+                # as old as the older of its markets' prices
+                bo.last_update = min(self.market_refresh_times.get(key_1, bo.last_update), self.market_refresh_times.get(key_2, bo.last_update))
+                out.append(bo)
+        active_markets = {(m.platform, m.id) for bo in out for m in (bo.market_1, bo.market_2)}
+        self.market_refresh_times = {key : t for key, t in self.market_refresh_times.items() if key in active_markets}
+        progress.start_stage(RefreshStage.calculate_returns)
+        refresh_return_calculations(out)
+        progress.finish_stage(RefreshStage.calculate_returns)
         return out
     
     def save_bet_opportunities(self, bet_opportunities : list[BetOpportunity]) -> None:
-        to_save = [bo.to_json() for bo in bet_opportunities]
-        filepath = BET_OPPORTUNITIES_FILE
-        with open(filepath, "w") as json_file:
-            json.dump(to_save, json_file, indent = 4)
-        logging.info(f"Bet opportunities saved to {filepath}")
+        """Saves the current bet opportunities, replacing the stored ones. Only added, changed and removed rows are written."""
+        self.bet_opportunity_store.save_all(bo.to_json() for bo in bet_opportunities)
 
     def get_bet_opportunity(self, id : str) -> BetOpportunity:
-        return [x for x in self.get_bet_opportunities() if x.id == id].pop(0)
+        bet_opportunity = self.bet_opportunity_store.get(id)
+        if bet_opportunity is None:
+            raise KeyError(f"No bet opportunity with id {id}")
+        return BetOpportunity.from_json(bet_opportunity)
     
+    def stream_markets(self, bet_opportunities : list[BetOpportunity]) -> None:
+        """Streams the orderbooks of every market of the given bet opportunities, replacing the previously streamed markets"""
+        markets : list[StreamMarket] = [{"platform" : m.platform, "id" : m.id, "yes_id" : m.yes_id, "no_id" : m.no_id}
+                                        for bo in bet_opportunities for m in (bo.market_1, bo.market_2)]
+        self.market_stream.set_markets(markets)
+        self.market_stream.start()
+
+    def get_streamed_market(self, market : BinaryMarket) -> BinaryMarket | None:
+        """Gets a copy of a market with its streamed best prices, None if its book is not synced or has an empty side"""
+        quote = self.market_stream.get_quote(market.platform, market.id)
+        if quote is None or not valid_prices(quote["yes_ask"], quote["no_ask"], quote["yes_bid"], quote["no_bid"]): #type: ignore
+            return None
+        return BinaryMarket(market.platform, market.question, market.id, market.yes_id, market.no_id,
+                            quote["yes_ask"], quote["no_ask"], quote["yes_bid"], quote["no_bid"], #type: ignore
+                            market.end_date, market.description, market.can_close_early)
+
+    def get_market_orderbooks(self, market : BinaryMarket) -> list[OrderBook]:
+        """Gets a market's yes and no orderbooks from the market data stream when its book is synced, otherwise over REST"""
+        orderbooks = self.market_stream.get_orderbooks(market.platform, market.id)
+        if orderbooks is not None:
+            return orderbooks
+        return self.betting_platforms[market.platform]["betting_platform"].get_orderbooks(market)
+
     def get_orderbooks(self, bet_opportunity : BetOpportunity) -> BetOpportunityOrderBooks:
-        m1_platform = bet_opportunity.market_1.platform
-        m2_platform = bet_opportunity.market_2.platform
-        m1_yes_orderbook, m1_no_orderbook = self.betting_platforms[m1_platform]["betting_platform"].get_orderbooks(bet_opportunity.market_1)
-        m2_yes_orderbook, m2_no_orderbook = self.betting_platforms[m2_platform]["betting_platform"].get_orderbooks(bet_opportunity.market_2)
+        m1_yes_orderbook, m1_no_orderbook = self.get_market_orderbooks(bet_opportunity.market_1)
+        m2_yes_orderbook, m2_no_orderbook = self.get_market_orderbooks(bet_opportunity.market_2)
 
         return BetOpportunityOrderBooks(
             m1_yes_orderbook,
@@ -266,6 +364,29 @@ class QuestionData:
             m2_no_orderbook,
         )
 
+    def iter_orderbooks(self, bet_opportunities : list[BetOpportunity], max_concurrency : dict[str, int] = ORDERBOOK_MAX_CONCURRENT_REQUESTS) -> Generator[tuple[BetOpportunity, BetOpportunityOrderBooks], None, None]:
+        """Fetches the orderbooks for many bet opportunities concurrently, yielding each opportunity as soon as both of its markets' orderbooks arrive.
+
+        Each platform gets its own thread pool so in-flight requests are bounded per platform, and a market shared by
+        several bet opportunities is only requested once.
+
+        Args:
+            bet_opportunities (list[BetOpportunity]): bet opportunities to get orderbooks for
+            max_concurrency (dict[str, int], optional): maximum number of concurrent orderbook requests per platform
+
+        Yields:
+            tuple[BetOpportunity, BetOpportunityOrderBooks]: a bet opportunity and its orderbooks, in completion order
+        """
+        for bo, market_1_orderbooks, market_2_orderbooks in iter_market_results(bet_opportunities, self.get_market_orderbooks, max_concurrency):
+            m1_yes_orderbook, m1_no_orderbook = market_1_orderbooks
+            m2_yes_orderbook, m2_no_orderbook = market_2_orderbooks
+            yield bo, BetOpportunityOrderBooks(
+                m1_yes_orderbook,
+                m1_no_orderbook,
+                m2_yes_orderbook,
+                m2_no_orderbook,
+            )
+
 if __name__ == "__main__":
     # qdata = QuestionData()
     # qdata.save_active_markets_to_json()
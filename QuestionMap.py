@@ -1,6 +1,10 @@
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Set, Iterable
+from datetime import datetime
 from SemanticEquivalence import SemanticEquivalence
-from BettingPlatform import BinaryMarketMetadata
+from EmbeddingIndex import EmbeddingIndex
+from MatchingSession import MatchingSession
+from BinaryMarketMetadata import BinaryMarketMetadata
+import numpy as np
 import torch # type: ignore
 from constants import SIMILARITY_CUTOFF
 import logging
@@ -54,47 +58,149 @@ class QuestionMap:
         [similar_questions, similar_ids] = nlp.get_k_similar_questions(question, existing_questions, existing_questions_embedding, k)
         return self.most_similar_question(question, similar_questions)
 
-    def map_questions_across_platforms(self, questions_by_platform : List[List[BinaryMarketMetadata]]):
+    def questions_exist(self, nlp : SemanticEquivalence, questions : List[str], existing_questions : List[str], existing_questions_index : EmbeddingIndex, k : int = 5,
+                        question_embeddings : np.ndarray | None = None) -> List[str | bool]:
+        """
+        Batched question_exists: for each question, returns the unique question it maps to if it exists in the question map, false otherwise
+        """
+        similar_questions_by_question = nlp.get_k_similar_questions_batch(questions, existing_questions, existing_questions_index, k, question_embeddings)
+        return [self.most_similar_question(question, similar_questions) for question, similar_questions in zip(questions, similar_questions_by_question)]
+
+    def map_questions_across_platforms(self, questions_by_platform : List[List[BinaryMarketMetadata]], batched : bool = True, session : MatchingSession | None = None) -> Set[str]:
         """Given a list of lists of market metadata, creates the question map which maps each unique, normalized question in the provided data
             to a list of similar BinaryMarketMetadata based on semantic equivalence of the market question
 
         Args:
             questions_by_platform (List[List[BinaryMarketMetadata]]): contains a list of binarymarketmetadata for each platform
+            batched (bool, optional): match each platform's questions in batches rather than one question at a time. Defaults to True.
+            session (MatchingSession | None, optional): model and market embeddings shared with the rest of the build. Defaults to a new session.
+
+        Returns:
+            Set[str]: unique questions that were added or had markets added to them
         """
         # Dictionary to store normalized questions as keys and list of platform/question IDs as values
+        changed_questions : Set[str] = set()
+        earlier_platforms : Set[str] = set()
         count = 0
-        nlp = SemanticEquivalence()
+        session = session or MatchingSession()
+        nlp = session.nlp
         for platform_questions in questions_by_platform:
             logging.info("Processing Platform Data for platform " + str(count) + "...")
-            #only check questions from other platforms
-            existing_questions = list(self.keys())
-            existing_questions_embedding = nlp.encode_questions(existing_questions)
-            for question in platform_questions:
-                normalized_question = self.normalize_question(question.question)
-                unique_question = self.question_exists(nlp, normalized_question, existing_questions, existing_questions_embedding)
+            count += 1
+            if not platform_questions:
+                # nothing to match, e.g. no new markets on this platform in an incremental update
+                continue
+            #only check questions from other platforms: ones first listed on a platform processed earlier, or without a market from this platform yet
+            platforms = {q.platform for q in platform_questions}
+            existing_questions = [q for q, entry in self.items()
+                                  if entry[0].platform in earlier_platforms or all(m.platform not in platforms for m in entry)]
+            normalized_questions = [self.normalize_question(question.question) for question in platform_questions]
+            if batched:
+                existing_questions_embedding = session.embed_unique_questions(existing_questions, [self[q] for q in existing_questions])
+                existing_questions_index = nlp.build_index(existing_questions_embedding)
+                unique_questions = self.questions_exist(nlp, normalized_questions, existing_questions, existing_questions_index,
+                                                        question_embeddings = session.embed_markets(platform_questions))
+            else:
+                existing_questions_embedding = nlp.encode_questions(existing_questions)
+                unique_questions = [self.question_exists(nlp, q, existing_questions, existing_questions_embedding) for q in normalized_questions]
+            for question, normalized_question, unique_question in zip(platform_questions, normalized_questions, unique_questions):
                 if type(unique_question) == str:
                     self[unique_question].append(question)
+                    changed_questions.add(unique_question)
                 else:
                     self[normalized_question] = [question]
-            count += 1
+                    changed_questions.add(normalized_question)
+            earlier_platforms |= platforms
+        return changed_questions
+
+    def remove_markets(self, market_ids : Set[str]) -> Set[str]:
+        """Removes markets from the question map, dropping unique questions that are left without markets
+
+        Args:
+            market_ids (Set[str]): ids of the markets to remove
+
+        Returns:
+            Set[str]: unique questions that had markets removed
+        """
+        changed_questions : Set[str] = set()
+        for question in list(self.keys()):
+            entry = self[question]
+            remaining = [m for m in entry if m.id not in market_ids]
+            if len(remaining) != len(entry):
+                changed_questions.add(question)
+                if remaining:
+                    self[question] = remaining
+                else:
+                    del self.map[question]
+        return changed_questions
+
+    def market_ids(self) -> Set[str]:
+        return {m.id for _, entry in self.items() for m in entry}
+
+    def subset(self, questions : Iterable[str]) -> "QuestionMap":
+        """Gets a new question map containing copies of the entries for the given unique questions that exist in this map"""
+        out = QuestionMap()
+        for question in questions:
+            if question in self.map:
+                out[question] = list(self[question])
+        return out
+
+    def update(self, active_map : "QuestionMap", questions_by_platform : List[List[BinaryMarketMetadata]], now : datetime,
+               session : MatchingSession | None = None) -> Set[str]:
+        """Incrementally updates this candidate map (the map before best match selection) and the active map selected from it with the
+        latest market metadata instead of rebuilding both.
+
+        Markets that closed or expired since the last update are dropped, only newly listed markets are matched against the existing
+        unique questions, and best matches are only re-selected for the unique questions whose markets changed.
+
+        Args:
+            active_map (QuestionMap): question map selected from this candidate map by the last build or update, updated in place
+            questions_by_platform (List[List[BinaryMarketMetadata]]): latest market metadata for each platform
+            now (datetime): current time, markets that end before it are expired
+            session (MatchingSession | None, optional): model and market embeddings shared with the rest of the update. Defaults to a new session.
+
+        Returns:
+            Set[str]: unique questions that were added, removed or had their markets changed
+        """
+        session = session or MatchingSession()
+        open_by_platform = [[q for q in platform_questions if q.end_date > now] for platform_questions in questions_by_platform]
+        previous_ids = self.market_ids()
+        current_ids = {q.id for platform_questions in open_by_platform for q in platform_questions}
+        added_by_platform = [[q for q in platform_questions if q.id not in previous_ids] for platform_questions in open_by_platform]
+        removed_ids = previous_ids - current_ids
+        logging.info(f"Updating question map: {sum(len(x) for x in added_by_platform)} markets added, {len(removed_ids)} markets removed")
+
+        changed_questions = self.remove_markets(removed_ids)
+        changed_questions |= self.map_questions_across_platforms(added_by_platform, session = session)
+
+        changed_map = self.subset(changed_questions)
+        changed_map.get_best_match_by_platform(session)
+        for question in changed_questions:
+            active_map.map.pop(question, None)
+        for question, entry in changed_map.items():
+            active_map[question] = entry
+        logging.info(f"Re-selected best matches for {len(changed_map.map)} unique questions")
+        return changed_questions
 
-    def get_best_match_by_platform(self):
+    def get_best_match_by_platform(self, session : MatchingSession | None = None):
         """Updates the question map that such that it has, for each question, ensured only one best match for each platform
 
         Args:
-            question_map (QuestionMap): maps questions to list of similar questions across platforms
+            session (MatchingSession | None, optional): model and market embeddings shared with the rest of the build, so the best match is
+                picked from stored embeddings. Defaults to a new session.
         """
-        nlp = SemanticEquivalence()
+        session = session or MatchingSession()
+        multi_platform_questions = [question for question, entry in self.items() if len({i.platform for i in entry}) > 1]
+        question_embeddings = session.embed_unique_questions(multi_platform_questions, [self[q] for q in multi_platform_questions])
+        embedding_by_question = dict(zip(multi_platform_questions, question_embeddings))
         new_map : Dict[str, List[BinaryMarketMetadata]] = {}
         for question, entry in self.items():
             unique_platforms = {i.platform for i in entry}
             if len(unique_platforms) > 1:
                 new_entry = []
                 for platform in unique_platforms:
-                    platform_questions = [i.question for i in entry if i.platform == platform]
-                    platform_ids = [i.id for i in entry if i.platform == platform]         
-                    [(best_question, score)], [(best_id, score)] = nlp.get_k_similar_questions(question, platform_questions, nlp.encode_questions(platform_questions), 1, question_ids=platform_ids)
-                    new_entry.append(next(i for i in entry if i.id == best_id))
+                    platform_markets = [i for i in entry if i.platform == platform]
+                    new_entry.append(session.best_match(embedding_by_question[question], platform_markets))
                 entry = new_entry
             new_map[question] = entry
         self.map = new_map
@@ -0,0 +1,122 @@
+import threading
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable
+from constants import *
+
+class RefreshProgress:
+    """Thread-safe progress of one refresh, by stage and by platform, written by the refresh and read by status requests"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages : dict[str, str] = {stage.value : "pending" for stage in RefreshStage}
+        self.platforms : dict[str, dict[str, int]] = {}
+
+    def start_stage(self, stage : RefreshStage) -> None:
+        with self.lock:
+            self.stages[stage.value] = "running"
+
+    def finish_stage(self, stage : RefreshStage) -> None:
+        with self.lock:
+            self.stages[stage.value] = "done"
+
+    def fail_running_stages(self) -> None:
+        """Marks the stages that were running when the refresh failed as failed"""
+        with self.lock:
+            for stage, state in self.stages.items():
+                if state == "running":
+                    self.stages[stage] = "failed"
+
+    def update_platform(self, platform : str, done : int, total : int) -> None:
+        """Records that done of the total market data requests items for a platform have been fetched"""
+        with self.lock:
+            self.platforms[platform] = {"done" : done, "total" : total}
+
+    def to_json(self):
+        with self.lock:
+            return {"stages" : dict(self.stages), "platforms" : {platform : dict(p) for platform, p in self.platforms.items()}}
+
+class RefreshJob:
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+        self.status = RefreshJobStatus.queued
+        self.progress = RefreshProgress()
+        self.created = datetime.now(timezone.utc)
+        self.started : datetime | None = None
+        self.finished : datetime | None = None
+        self.total_opportunities : int | None = None
+        self.error : str | None = None
+
+    @property
+    def in_flight(self) -> bool:
+        return self.status in (RefreshJobStatus.queued, RefreshJobStatus.running)
+
+    def to_json(self):
+        return {
+            "job_id" : self.id,
+            "status" : self.status.value,
+            "created" : self.created.isoformat(),
+            "started" : self.started.isoformat() if self.started else None,
+            "finished" : self.finished.isoformat() if self.finished else None,
+            "total_opportunities" : self.total_opportunities,
+            "error" : self.error,
+            **self.progress.to_json()
+        }
+
+class RefreshJobRunner:
+    """Runs bet opportunity refreshes in a background thread, one at a time.
+
+    Submitting while a refresh is queued or running returns that refresh instead of starting another, so concurrent
+    requests share one refresh. Finished jobs are kept so their status can still be read, up to max_finished_jobs.
+    """
+
+    def __init__(self, refresh : Callable[[RefreshProgress], int], max_finished_jobs : int = REFRESH_MAX_FINISHED_JOBS):
+        """
+        Args:
+            refresh (Callable[[RefreshProgress], int]): refreshes and publishes bet opportunities, reporting to the given
+                progress, and returns the number of bet opportunities published
+            max_finished_jobs (int, optional): finished jobs whose status is kept
+        """
+        self.refresh = refresh
+        self.max_finished_jobs = max_finished_jobs
+        self.lock = threading.Lock()
+        self.jobs : OrderedDict[str, RefreshJob] = OrderedDict()
+        self.current : RefreshJob | None = None
+
+    def submit(self) -> tuple[RefreshJob, bool]:
+        """Starts a refresh unless one is already in flight
+
+        Returns:
+            tuple[RefreshJob, bool]: the refresh job, and whether it was already in flight
+        """
+        with self.lock:
+            if self.current is not None and self.current.in_flight:
+                return self.current, True
+            job = RefreshJob()
+            self.current = job
+            self.jobs[job.id] = job
+            finished = [id for id, j in self.jobs.items() if not j.in_flight]
+            for id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self.jobs[id]
+        threading.Thread(target = self.run, args = (job,), daemon = True, name = f"refresh-{job.id}").start()
+        return job, False
+
+    def get(self, job_id : str) -> RefreshJob | None:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def run(self, job : RefreshJob) -> None:
+        job.started = datetime.now(timezone.utc)
+        job.status = RefreshJobStatus.running
+        try:
+            job.total_opportunities = self.refresh(job.progress)
+            job.status = RefreshJobStatus.succeeded
+        except Exception as e:
+            logging.exception(f"Refresh job {job.id} failed: {e}")
+            job.progress.fail_running_stages()
+            job.error = str(e)
+            job.status = RefreshJobStatus.failed
+        finally:
+            job.finished = datetime.now(timezone.utc)
@@ -0,0 +1,99 @@
+import math
+import numpy as np
+from datetime import datetime
+from typing import Any, TypedDict
+from constants import *
+
+MarketKey = tuple[str, str] # (platform, market id)
+
+class RefreshPriorityWeights(TypedDict):
+    staleness : float # weight of how long ago the market was last refreshed
+    closeness : float # weight of the best return of the bet opportunities the market is in
+    expiry : float # weight of how soon the market closes
+
+class RefreshPlan(TypedDict):
+    markets : dict[str, list[Any]] # markets to refresh per platform, each market once, highest priority first
+    skipped : dict[str, int] # markets per platform left for a later refresh by the request budget
+
+def get_percentile_ranks(values : np.ndarray) -> np.ndarray:
+    """Gets the rank of each value scaled to [0, 1], 1 for the largest, with equal values sharing their average rank. Ranks
+    make criteria with different units comparable."""
+    if len(values) < 2:
+        return np.ones(len(values))
+    sorted_values = np.sort(values)
+    ranks = (np.searchsorted(sorted_values, values, side = "left") + np.searchsorted(sorted_values, values, side = "right") - 1) / 2
+    return ranks / (len(values) - 1)
+
+class RefreshPlanner:
+    """Chooses which markets a bet opportunity refresh requests prices for.
+
+    Markets shared by several bet opportunities are requested once. Markets are ordered by a weighted sum of percentile
+    ranks of their staleness, the best return of the bet opportunities they are in (closeness to arbitrage) and how soon
+    they close, with markets staler than max_staleness always first so every market is eventually refreshed. Each platform
+    gets at most its request budget of markets, the rest keep their last prices until a later refresh.
+    """
+
+    def __init__(self,
+                 request_budget : dict[str, int] = REFRESH_REQUEST_BUDGET,
+                 markets_per_request : dict[str, int] = REFRESH_MARKETS_PER_REQUEST,
+                 weights : RefreshPriorityWeights = REFRESH_PRIORITY_WEIGHTS, #type: ignore
+                 max_staleness : float = REFRESH_MAX_STALENESS_SECONDS):
+        """
+        Args:
+            request_budget (dict[str, int], optional): market data requests per platform per refresh
+            markets_per_request (dict[str, int], optional): markets one market data request refreshes, per platform
+            weights (RefreshPriorityWeights, optional): weight of each priority criterion
+            max_staleness (float, optional): seconds since the last refresh after which a market is refreshed first
+        """
+        self.request_budget = request_budget
+        self.markets_per_request = markets_per_request
+        self.weights = weights
+        self.max_staleness = max_staleness
+
+    def get_market_budget(self, platform : str) -> float:
+        if platform not in self.request_budget:
+            return math.inf
+        return self.request_budget[platform] * self.markets_per_request.get(platform, 1)
+
+    def plan(self, bet_opportunities : list[Any], last_refreshed : dict[MarketKey, datetime], now : datetime) -> RefreshPlan:
+        """Plans one refresh of the markets of a list of bet opportunities
+
+        Args:
+            bet_opportunities (list[Any]): BetOpportunity objects
+            last_refreshed (dict[MarketKey, datetime]): when each market was last refreshed, markets that are missing count
+                as refreshed at the oldest last_update of the bet opportunities they are in
+            now (datetime): current time
+
+        Returns:
+            RefreshPlan: markets to refresh per platform and markets skipped per platform
+        """
+        markets : dict[MarketKey, Any] = {}
+        refreshed : dict[MarketKey, datetime] = {}
+        best_returns : dict[MarketKey, float] = {}
+        for bo in bet_opportunities:
+            best_return = max((r for r in bo.absolute_return if r is not None and not math.isnan(r)), default = -math.inf)
+            for market in (bo.market_1, bo.market_2):
+                key = (market.platform, market.id)
+                markets.setdefault(key, market)
+                refreshed[key] = min(refreshed.get(key, bo.last_update), bo.last_update)
+                best_returns[key] = max(best_returns.get(key, -math.inf), best_return)
+
+        out : RefreshPlan = {"markets" : {}, "skipped" : {}}
+        by_platform : dict[str, list[MarketKey]] = {}
+        for key in markets:
+            by_platform.setdefault(key[0], []).append(key)
+        for platform, keys in by_platform.items():
+            staleness = np.array([(now - last_refreshed.get(key, refreshed[key])).total_seconds() for key in keys])
+            returns = np.array([best_returns[key] for key in keys])
+            time_to_close = np.array([(markets[key].end_date - now).total_seconds() for key in keys])
+            priority = (self.weights["staleness"] * get_percentile_ranks(staleness)
+                        + self.weights["closeness"] * get_percentile_ranks(returns)
+                        + self.weights["expiry"] * get_percentile_ranks(-time_to_close))
+            overdue = staleness >= self.max_staleness
+            # overdue markets first, then by priority, highest first
+            order = np.lexsort((-priority, ~overdue))
+            budget = self.get_market_budget(platform)
+            planned = order if budget >= len(order) else order[:int(budget)]
+            out["markets"][platform] = [markets[keys[i]] for i in planned.tolist()]
+            out["skipped"][platform] = len(order) - len(planned)
+        return out
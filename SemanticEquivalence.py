@@ -1,8 +1,13 @@
 from sentence_transformers import SentenceTransformer, util # type: ignore
-from BetOpportunity import BetOpportunity
+from EmbeddingIndex import EmbeddingIndex, ExactIndex
+from EmbeddingCache import EmbeddingCache
+from VerdictCache import VerdictCache
+from CrossEncoderReranker import CrossEncoderReranker
+from LLMDispatcher import LLMBatchDispatcher
+from llm_batches import pack_batches, build_prompt
+import numpy as np
 import torch # type: ignore
-from typing import List, Tuple, TypedDict
-from openai import OpenAI
+from typing import List, Tuple, TypedDict, Callable
 import os
 from dotenv import load_dotenv
 from constants import *
@@ -11,19 +16,41 @@ import logging
 
 class BetOpportunityTitles(TypedDict):
     id : str
+    market_1_id : str
     market_1_question : str
     market_1_description : str
+    market_2_id : str
     market_2_question : str
     market_2_description : str
 
 class SemanticEquivalence:
-    def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+    def __init__(self, index_factory : Callable[[], EmbeddingIndex] = ExactIndex, use_embedding_cache : bool = True):
+        """
+        Args:
+            index_factory (Callable[[], EmbeddingIndex], optional): index batched matching looks questions up in. Defaults to exact
+                search, so batched matching finds the same questions as get_k_similar_questions.
+            use_embedding_cache (bool, optional): reuse stored question embeddings. Defaults to True.
+        """
+        self.model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        self.index_factory = index_factory
+        self.embedding_cache = EmbeddingCache(EMBEDDING_MODEL_NAME) if use_embedding_cache else None
 
-    def encode_questions(self, question_list : List[str]) -> torch.Tensor:
+    def encode_questions(self, question_list : List[str], batch_size : int = EMBEDDING_BATCH_SIZE) -> torch.Tensor:
         # Encode the list of existing questions
-        question_list_embeddings = self.model.encode(question_list, convert_to_tensor=True)
-        return question_list_embeddings
+        if self.embedding_cache is None:
+            return self.model.encode(question_list, batch_size=batch_size, convert_to_tensor=True)
+
+        # only run the model on questions that are not in the embedding cache
+        cached, missing = self.embedding_cache.get(question_list)
+        if missing:
+            missing_questions = list(dict.fromkeys(question_list[i] for i in missing))
+            logging.info(f"Embedding {len(missing_questions)} new questions ({len(question_list) - len(missing)} cached)")
+            new_embeddings = self.model.encode(missing_questions, batch_size=batch_size, convert_to_numpy=True)
+            self.embedding_cache.add(missing_questions, new_embeddings)
+            cached, _ = self.embedding_cache.get(question_list)
+        dimension = self.model.get_sentence_embedding_dimension()
+        embeddings = np.array(cached, dtype=np.float32).reshape(len(question_list), dimension)
+        return torch.from_numpy(embeddings).to(self.model.device)
 
     def get_k_similar_questions(self, question: str, question_list : List[str],question_list_embeddings: torch.Tensor, k: int, question_ids : (List[str] | None) = None) -> List[List[Tuple[str, float]]]:
         """
@@ -38,7 +65,7 @@ class SemanticEquivalence:
         if question_list == []:
             return [[], []]
         # Encode the input question
-        question_embedding = self.model.encode(question, convert_to_tensor=True)
+        question_embedding = self.encode_questions([question])[0]
         
         # Compute the cosine similarities
         similarities = util.pytorch_cos_sim(question_embedding, question_list_embeddings)[0]
@@ -57,23 +84,60 @@ class SemanticEquivalence:
         else:
             return [top_k_similar_questions, top_k_similar_question_ids]
         
-def filter_bet_opportunities_with_llm_semantic_equivalence(bet_opportunities : list[BetOpportunityTitles], model : LLM) -> tuple[set[str], float]:
+    def build_index(self, question_list_embeddings : torch.Tensor | np.ndarray) -> EmbeddingIndex:
+        """Builds a nearest neighbour index over question embeddings using the configured index type"""
+        index = self.index_factory()
+        if isinstance(question_list_embeddings, torch.Tensor):
+            question_list_embeddings = question_list_embeddings.cpu().numpy()
+        index.build(question_list_embeddings)
+        return index
+
+    def get_k_similar_questions_batch(self, questions : List[str], question_list : List[str], question_list_index : EmbeddingIndex, k : int,
+                                      question_embeddings : np.ndarray | None = None) -> List[List[Tuple[str, float]]]:
+        """
+        Get the top-k semantically similar questions for each of many input questions, encoding the inputs in batches and
+        looking them up in a nearest neighbour index of the existing questions.
+
+        :param questions: The input questions.
+        :param question_list: A list of questions to compare against.
+        :param question_list_index: Index built by build_index over the embeddings of question_list.
+        :param k: The number of top similar questions to return for each input question.
+        :param question_embeddings: Embeddings of the input questions if they are already known, encoded otherwise.
+        :return: For each input question, a list of tuples containing the top-k similar questions and their similarity scores
+        """
+        if question_list == []:
+            return [[] for _ in questions]
+        if questions == []:
+            return []
+        if question_embeddings is None:
+            question_embeddings = self.encode_questions(questions).cpu().numpy()
+        scores, indices = question_list_index.query(question_embeddings, k)
+
+        out : List[List[Tuple[str, float]]] = []
+        for row_scores, row_indices in zip(scores.tolist(), indices.tolist()):
+            out.append([(question_list[i], score) for i, score in zip(row_indices, row_scores) if i >= 0])
+        return out
+
+def filter_bet_opportunities_with_llm_semantic_equivalence(bet_opportunities : list[BetOpportunityTitles], model : LLM, use_verdict_cache : bool = True,
+                                                            reranker : CrossEncoderReranker | None = None) -> tuple[set[str], float]:
     """given a list of bet opportunity metadata (id and question titles), returns a list of bet opportunity ids with valid semantic equivalence
 
     Args:
         bet_opportunities (list[BetOpportunityTitles]): given a list of bet opportunities by with id and question titles
+        use_verdict_cache (bool, optional): reuse verdicts for market pairs this model already judged and only send the rest to the llm. Defaults to True.
+        reranker (CrossEncoderReranker | None, optional): scores the pairs without a cached verdict locally, so only the ones it
+            is unsure about are sent to the llm. Cached verdicts always win over its scores.
 
     Returns:
         set[str]: set of bet opportunity ids that are semantically equivalent
         float: cost of the llm operation
     """
-    ENTRIES_PER_LLM_REQUEST = 30
     load_dotenv()
-    batches = [bet_opportunities[i:i+ENTRIES_PER_LLM_REQUEST] for i in range(0, len(bet_opportunities), ENTRIES_PER_LLM_REQUEST)]
     api_key_name = LLM_INFO[model]["api_key_name"]
     base_url = LLM_INFO[model]["base_url"]
     model_name = LLM_INFO[model]["model_name"]
-    prompt_prefix = """for the below list, return a list of ids where market_1_question is semantically equivalent to market_2_question 
+    prompt_prefix = """each line of the below list is a pair of markets with an id, the question of each market (q1 and q2) and the start of each
+    market's resolution rules (d1 and d2). Return a list of ids where q1 is semantically equivalent to q2 
     i.e. they mean precisely the same thing. Return as a valid json list of strings for the valid ids. 
     It is critical that returned ids are completely equivalent, meaning if the answer to one is yes the answer to the other must also be yes in all cases (and vice versa).
     In your response include no extra explanation or text just the list 
@@ -88,36 +152,52 @@ def filter_bet_opportunities_with_llm_semantic_equivalence(bet_opportunities : l
     
     out = set()
     cost = 0.0
-    client = OpenAI(
-            api_key=os.environ.get(api_key_name),
-            base_url= base_url
-        )
-    for batch in batches:
-        prompt = f"{prompt_prefix}{batch}"
-        # logging.info("PROMPT:\n" +"---"*10 + "\n" + prompt)
-        try:
-            chat_completion = client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                model=model_name,
-            )
-            content = chat_completion.choices[0].message.content
-            usage = chat_completion.usage
-            if content:
-                logging.info("RESPONSE:\n" + "---"*10 + "\n" + content)
-                out.update(set(json.loads(content)))
-            if usage:
-                prompt_tokens = usage.prompt_tokens
-                completion_tokens = usage.completion_tokens
-                logging.info(f"Prompt tokens: {prompt_tokens}\n Completion tokens: {completion_tokens}")
+    verdict_cache = VerdictCache(model_name) if use_verdict_cache else None
+    if verdict_cache is not None:
+        uncached : list[BetOpportunityTitles] = []
+        saved_cost = 0.0
+        for bo in bet_opportunities:
+            verdict = verdict_cache.get(bo)
+            if verdict is None:
+                uncached.append(bo)
+            else:
+                saved_cost += verdict_cache.get_cost(bo)
+                if verdict:
+                    out.add(bo["id"])
+        logging.info(f"Reusing {len(bet_opportunities) - len(uncached)} cached verdicts from {model_name}, saving ${saved_cost:.4f}. "
+                     f"Sending {len(uncached)} bet opportunities to the llm")
+        bet_opportunities = uncached
+    if reranker is not None:
+        accepted_ids, uncertain = reranker.rerank(bet_opportunities)
+        out |= accepted_ids
+        bet_opportunities = [bet_opportunities[i] for i in uncertain]
+    # pack as many compactly serialized entries into each request as the model's token budget allows
+    batches = pack_batches(bet_opportunities, LLM_INFO[model]["batch_token_budget"], LLM_MAX_DESCRIPTION_CHARS)
+    if not batches:
+        return out, cost
 
-                cost += prompt_tokens * LLM_INFO[model]["cost_per_1m_input_tokens"] /10**6
-                cost += completion_tokens * LLM_INFO[model]["cost_per_1m_output_tokens"] /10**6
-        except json.decoder.JSONDecodeError as e:
-            logging.error(f"Json parsing error for prompt:\n {prompt}\nError message: {e}\nRaw response: {chat_completion} ")
+    dispatcher = LLMBatchDispatcher(model, api_key=os.environ.get(api_key_name), base_url=base_url)
+    prompts, short_ids_by_batch = zip(*[build_prompt(prompt_prefix, batch, LLM_MAX_DESCRIPTION_CHARS) for batch in batches])
+    logging.info(f"Packed {len(bet_opportunities)} bet opportunities into {len(batches)} llm requests")
+    results = dispatcher.dispatch(list(prompts), parse_valid_ids)
+    for batch, short_ids, result in zip(batches, short_ids_by_batch, results):
+        cost += result.cost
+        if result.result is None:
+            continue
+        valid_ids = {short_ids[short_id] for short_id in result.result if short_id in short_ids}
+        out.update(valid_ids)
+        if verdict_cache is not None:
+            verdict_cache.add(batch, valid_ids, result.cost)
+    logging.info(f"{sum(r.result is None for r in results)} of {len(batches)} llm batches failed")
 
     return out, cost
+
+def parse_valid_ids(content : str | None) -> set[str]:
+    """Parses an llm response listing valid bet opportunity ids, raising ValueError if it is not a json list of strings"""
+    if not content:
+        raise ValueError("Empty response")
+    logging.info("RESPONSE:\n" + "---"*10 + "\n" + content)
+    valid_ids = json.loads(content)
+    if not isinstance(valid_ids, list) or not all(isinstance(x, str) for x in valid_ids):
+        raise ValueError("Response is not a json list of ids")
+    return set(valid_ids)
@@ -1,4 +1,5 @@
 from BetOpportunity import BetOpportunity
+from orderbook_returns import OptimalTrade
 
 class TradeExecution:
 
@@ -8,6 +9,13 @@ class TradeExecution:
     def create_order(self):
         pass
 
-    def execute_arbitrate_trade_for_bet_opportunity(self, op : BetOpportunity):
+    def execute_arbitrate_trade_for_bet_opportunity(self, op : BetOpportunity, trade : OptimalTrade):
+        """Executes a solved arbitrage trade on a bet opportunity
+
+        Args:
+            op (BetOpportunity): bet opportunity to trade
+            trade (OptimalTrade): size and direction to trade, buying trade["contracts"] yes contracts on market trade["yes_market"]
+                of the bet opportunity and as many no contracts on the other market
+        """
         #
-        pass
\ No newline at end of file
+        pass
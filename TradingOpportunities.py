@@ -1,6 +1,11 @@
 import logging
+import os
+import threading
+from typing import Generator
 from QuestionData import QuestionData, BetOpportunityOrderBooks
 from BetOpportunity import BetOpportunity
+from BetOpportunitySnapshot import BetOpportunitySnapshot, SnapshotHistory, resolve_sort_key
+from RefreshJobs import RefreshProgress
 from constants import *
 
 
@@ -21,10 +26,26 @@ class BetDataManager:
         """Creates a mapping of equivalent questions across betting platforms."""
         logging.info(f"Building question map with similarity cutoff {SIMILARITY_CUTOFF}")
         qmap = self.qdata.build_question_map(
-            [BETTING_PLATFORM_DATA[x]["question_filepath"] for x in BETTING_PLATFORM_DATA]
+            [BETTING_PLATFORM_DATA[x]["question_filepath"] for x in BETTING_PLATFORM_DATA],
+            candidate_map_filepath=QUESTION_MAP_JSON_BASE_PATH + CANDIDATE_MAP_JSON_FILENAME
         )
         self.qdata.save_question_map_to_json(qmap, QUESTION_MAP_JSON_BASE_PATH + ACTIVE_MAP_JSON_FILENAME)
 
+    def update_and_save_question_map(self):
+        """Updates the saved question map with markets added or closed since it was built, falling back to a full build if there is no saved map."""
+        candidate_map_filepath = QUESTION_MAP_JSON_BASE_PATH + CANDIDATE_MAP_JSON_FILENAME
+        active_map_filepath = QUESTION_MAP_JSON_BASE_PATH + ACTIVE_MAP_JSON_FILENAME
+        if not (os.path.exists(candidate_map_filepath) and os.path.exists(active_map_filepath)):
+            logging.info("No saved question map to update, building from scratch")
+            self.generate_and_save_question_map()
+            return
+        logging.info(f"Updating question map with similarity cutoff {SIMILARITY_CUTOFF}")
+        self.qdata.update_question_map(
+            [BETTING_PLATFORM_DATA[x]["question_filepath"] for x in BETTING_PLATFORM_DATA],
+            candidate_map_filepath,
+            active_map_filepath
+        )
+
     def build_bet_opportunities(self, llm_check=False, llm_model=LLM.deepseek_v2) -> tuple[list[BetOpportunity], float]:
         """Builds bet opportunities using the latest question map."""
         logging.info("Building bet opportunities from question map...")
@@ -35,11 +56,17 @@ class BetDataManager:
         self.qdata.save_bet_opportunities(bet_opportunities)
         return bet_opportunities, llm_cost
 
-    def refresh_bet_opportunities(self) -> list[BetOpportunity]:
-        """Refreshes bet opportunities with the latest market data."""
+    def refresh_bet_opportunities(self, progress: RefreshProgress | None = None) -> list[BetOpportunity]:
+        """Refreshes bet opportunities with the latest market data, reporting each stage to progress if given.
+
+        The refreshed bet opportunities are saved in one transaction, so readers see either all of them or none.
+        """
         logging.info("Refreshing all bet opportunities...")
-        updated_data = self.qdata.get_updated_bet_opportunity_data()
+        progress = progress or RefreshProgress()
+        updated_data = self.qdata.get_updated_bet_opportunity_data(progress)
+        progress.start_stage(RefreshStage.publish)
         self.qdata.save_bet_opportunities(updated_data)
+        progress.finish_stage(RefreshStage.publish)
         return updated_data
 
 
@@ -48,11 +75,41 @@ class BetArbitrageAnalyzer:
 
     def __init__(self):
         self.qdata = QuestionData()
+        self.snapshot: BetOpportunitySnapshot | None = None
+        self.snapshot_lock = threading.Lock()
+        self.snapshot_history = SnapshotHistory()
+
+    def get_snapshot(self) -> BetOpportunitySnapshot:
+        """Returns the in-memory snapshot of the stored bet opportunities, only rebuilding it when the store version changed."""
+        store = self.qdata.bet_opportunity_store
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == store.get_version():
+            return snapshot
+        with self.snapshot_lock:
+            # another request may have rebuilt the snapshot while we waited for the lock
+            if self.snapshot is None or self.snapshot.version != store.get_version():
+                version, documents = store.get_all_with_version()
+                self.snapshot = BetOpportunitySnapshot(version, documents)
+                self.snapshot_history.add(self.snapshot)
+                logging.info(f"Loaded {len(documents)} bet opportunities at store version {version}")
+            return self.snapshot
+
+    def get_cursor_snapshot(self, cursor: str) -> BetOpportunitySnapshot:
+        """Returns the snapshot a cursor was made on, so a scroll pages through one version of the bet opportunities.
+
+        Raises:
+            ExpiredCursorError: if that snapshot is no longer kept
+            ValueError: if the cursor is malformed
+        """
+        self.get_snapshot()
+        return self.snapshot_history.get_for_cursor(cursor)
 
     def sort_bet_opportunities(
-        self, sort_key: BetOpportunitySortKey, ops: list[BetOpportunity], n: int | None = None
+        self, sort_key: BetOpportunitySortKey | str, ops: list[BetOpportunity], n: int | None = None
     ) -> list[BetOpportunity]:
         """Sorts bet opportunities based on a given metric."""
+        sort_key = resolve_sort_key(sort_key)  # type: ignore
+
         def lambda_func(x: BetOpportunity):
             if sort_key == BetOpportunitySortKey.parity_return:
                 return sum(x.absolute_return)
@@ -68,10 +125,10 @@ class BetArbitrageAnalyzer:
 
         return ops[:n] if n else ops
 
-    def get_bet_opportunities(self, sort: BetOpportunitySortKey | None = None) -> list[BetOpportunity]:
-        """Returns the latest bet opportunities."""
-        ops = self.qdata.get_bet_opportunities()
-        return self.sort_bet_opportunities(sort, ops) if sort else ops
+    def get_bet_opportunities(self, sort: BetOpportunitySortKey | str | None = None, n: int | None = None) -> list[BetOpportunity]:
+        """Returns the latest bet opportunities, or the first n of them, sorted if specified."""
+        documents = self.get_snapshot().get_documents(resolve_sort_key(sort), 0, n)
+        return [BetOpportunity.from_json(bo) for bo in documents]
 
     def get_bet_opportunity_orderbooks(self, bet_id: str) -> tuple[BetOpportunity, BetOpportunityOrderBooks]:
         """Retrieves orderbooks for a given bet opportunity."""
@@ -82,8 +139,12 @@ class BetArbitrageAnalyzer:
     def get_orderbooks(self, bet_opportunity : BetOpportunity) -> BetOpportunityOrderBooks:
         return self.qdata.get_orderbooks(bet_opportunity)
 
-    def delete_bet_opportunity(self, bet_id: str) -> tuple[bool, list[BetOpportunity]]:
-        """Deletes a bet opportunity by ID."""
+    def iter_orderbooks(self, bet_opportunities : list[BetOpportunity]) -> Generator[tuple[BetOpportunity, BetOpportunityOrderBooks], None, None]:
+        """Fetches orderbooks for many bet opportunities concurrently, yielding each as soon as its orderbooks arrive."""
+        return self.qdata.iter_orderbooks(bet_opportunities)
+
+    def delete_bet_opportunity(self, bet_id: str) -> tuple[bool, int]:
+        """Deletes a bet opportunity by ID, returning whether it was found and the number of bet opportunities remaining."""
         return self.qdata.delete_bet_opportunity(bet_id)
 
 
@@ -91,7 +152,7 @@ if __name__ == "__main__":
     # **Step 1: Data Setup**
     data_manager = BetDataManager()
     # data_manager.save_active_question_data_for_all_markets()
-    # data_manager.generate_and_save_question_map()
+    # data_manager.update_and_save_question_map() # builds from scratch with generate_and_save_question_map if there is no saved map
     bet_ops, cost = data_manager.build_bet_opportunities(llm_check=True, llm_model=LLM.openai_4o )
     logging.info(f"LLM cost: ${round(cost, 5)}")
 
@@ -3,6 +3,8 @@ import logging
 from TradingOpportunities import BetDataManager, BetArbitrageAnalyzer
 from constants import Strategy
 from strategies.arbitrage_1 import ArbitrageV1
+from strategies.TradingStrategy import TradingStrategy
+from MarketEvents import DirtyMarkets, OpportunityIndex, MarketKey
 from constants import *
 
 STRATEGIES = {
@@ -16,34 +18,61 @@ logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
 class BetTradingSystem:
     """Continuously updates betting data and opportunities."""
 
-    def __init__(self, refresh_interval: int = 300):
+    def __init__(self, refresh_interval: int = TRADING_SWEEP_SECONDS):
         """
         Args:
-            refresh_interval (int): How often to refresh opportunities (seconds).
+            refresh_interval (int): How often to refresh and sweep every opportunity (seconds).
         """
         self.refresh_interval = refresh_interval
         self.refresh_count = 0
         self.data_manager = BetDataManager()
         self.analyzer = BetArbitrageAnalyzer()
+        self.dirty_markets = DirtyMarkets()
+        self.opportunity_index = OpportunityIndex([])
+        self.analyzer.qdata.market_stream.add_listener(self.dirty_markets.mark)
 
     def run(self, strategy : Strategy):
-        """Continuously refreshes bet opportunities."""
+        """Continuously runs a strategy, on every opportunity after each refresh and in between on the opportunities whose
+        markets' streamed quotes changed, as soon as they change."""
+        trading_strategy = STRATEGIES[strategy](self.analyzer)
+        next_sweep = time.monotonic()
         while True:
-            
-            self.run_strategy(strategy)
-            time.sleep(self.refresh_interval)  # Wait before next refresh
-    
+            if time.monotonic() >= next_sweep:
+                self.sweep(trading_strategy)
+                next_sweep = time.monotonic() + self.refresh_interval
+            dirty = self.dirty_markets.take(timeout = next_sweep - time.monotonic())
+            if dirty:
+                self.run_on_markets(trading_strategy, dirty)
+
+    def sweep(self, trading_strategy : TradingStrategy):
+        """Refreshes every bet opportunity, streams their markets and runs the strategy on all of them"""
+        logging.info("Refreshing market data...")
+        bet_opportunities = self.data_manager.refresh_bet_opportunities()
+        self.refresh_count += 1
+        self.opportunity_index = OpportunityIndex(bet_opportunities)
+        self.analyzer.qdata.stream_markets(bet_opportunities)
+        # the full run sees every change made so far
+        self.dirty_markets.clear()
+        trading_strategy.run()
+
+    def run_on_markets(self, trading_strategy : TradingStrategy, markets : set[MarketKey]):
+        """Runs the strategy on only the bet opportunities made of the given markets"""
+        bet_opportunities = self.opportunity_index.get_affected(markets)
+        if bet_opportunities:
+            logging.info(f"{len(markets)} markets changed, re-evaluating {len(bet_opportunities)} bet opportunities")
+            trading_strategy.run_on(bet_opportunities)
+
     def run_strategy(self, strategy : Strategy):
         logging.info("Refreshing market data...")
         self.data_manager.refresh_bet_opportunities()
-        STRATEGIES[strategy]().run()
+        STRATEGIES[strategy](self.analyzer).run()
 
 if __name__ == "__main__":
     # dm = BetDataManager()
     # dm.save_active_question_data_for_all_markets()
-    # dm.generate_and_save_question_map()
+    # dm.update_and_save_question_map() # builds from scratch with generate_and_save_question_map if there is no saved map
     # ops, cost = dm.build_bet_opportunities(llm_check=True, llm_model=LLM.openai_4o)
     # logging.info(f"Model Cost: {cost}")
-    trading_system = BetTradingSystem(refresh_interval=300)  # Refresh every 5 minutes
+    trading_system = BetTradingSystem(refresh_interval=TRADING_SWEEP_SECONDS)
     # trading_system.run(Strategy.arbitrage_1)
     trading_system.run_strategy(Strategy.arbitrage_1)
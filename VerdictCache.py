@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+import logging
+from typing import Mapping, Iterable
+from constants import *
+
+class VerdictCache:
+    """Persistent store of LLM semantic equivalence verdicts for one model.
+
+    Verdicts are keyed by a hash of the model and both markets' ids, questions and descriptions, so a pair is judged again
+    whenever either market's rules text changes. Each verdict also records its share of the cost of the request that produced it.
+    The file is an append-only log of json lines where the last line for a key wins.
+    """
+
+    def __init__(self, model_name : str, filepath : str = LLM_VERDICT_CACHE_PATH):
+        self.model_name = model_name
+        self.filepath = filepath
+        self.verdicts : dict[str, tuple[bool, float]] = {}
+        if os.path.exists(filepath):
+            with open(filepath, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.decoder.JSONDecodeError:
+                        # a partially written last line from an interrupted run
+                        logging.error(f"Skipping malformed line in verdict cache {filepath}")
+                        continue
+                    self.verdicts[entry["key"]] = (entry["equivalent"], entry["cost"])
+
+    def key(self, entry : Mapping[str, str]) -> str:
+        """Hashes the content of a bet opportunity's two markets, ignoring which market is first"""
+        market_1 = [entry["market_1_id"], entry["market_1_question"], entry["market_1_description"]]
+        market_2 = [entry["market_2_id"], entry["market_2_question"], entry["market_2_description"]]
+        content = json.dumps([self.model_name] + sorted([market_1, market_2]))
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.verdicts)
+
+    def get(self, entry : Mapping[str, str]) -> bool | None:
+        """Gets the cached verdict for a bet opportunity, None if it was never judged"""
+        verdict = self.verdicts.get(self.key(entry))
+        return None if verdict is None else verdict[0]
+
+    def get_cost(self, entry : Mapping[str, str]) -> float:
+        """Gets what the cached verdict for a bet opportunity cost when it was judged, 0 if it was never judged"""
+        verdict = self.verdicts.get(self.key(entry))
+        return 0.0 if verdict is None else verdict[1]
+
+    def add(self, entries : Iterable[Mapping[str, str]], equivalent_ids : set[str], cost : float) -> None:
+        """Records the verdicts from one LLM request and persists them
+
+        Args:
+            entries (Iterable[Mapping[str, str]]): bet opportunities that were judged in the request
+            equivalent_ids (set[str]): ids of the bet opportunities judged semantically equivalent
+            cost (float): cost of the request, split evenly across its entries
+        """
+        entries = list(entries)
+        if not entries:
+            return
+        cost_per_entry = cost / len(entries)
+        new_verdicts = {self.key(entry) : (entry["id"] in equivalent_ids, cost_per_entry) for entry in entries}
+        directory = os.path.dirname(self.filepath)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        with open(self.filepath, "a") as f:
+            f.writelines(json.dumps({"key" : key, "equivalent" : equivalent, "cost" : cost}) + "\n"
+                         for key, (equivalent, cost) in new_verdicts.items())
+        self.verdicts.update(new_verdicts)
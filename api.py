@@ -1,7 +1,19 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
+import gzip
+import json
 import logging
 from TradingOpportunities import BetDataManager, BetArbitrageAnalyzer
+from BetOpportunitySnapshot import BetOpportunityFilters, ExpiredCursorError, resolve_sort_key, parse_fields, project_document
+from RefreshJobs import RefreshJobRunner
+from OpportunityStream import OpportunityStream
+from utils import parse_timestamp
+from constants import *
+
+try:
+    import brotli #type: ignore
+except ImportError:
+    brotli = None
 
 
 # Initialize Flask app and enable CORS
@@ -11,56 +23,193 @@ CORS(app)
 # Instantiate Data Manager & Analyzer
 data_manager = BetDataManager()
 analyzer = BetArbitrageAnalyzer()
+opportunity_stream = OpportunityStream(analyzer.get_snapshot)
+
+
+def refresh_and_publish(progress) -> int:
+    """Refreshes bet opportunities and pushes the changes to stream clients."""
+    bet_opportunities = data_manager.refresh_bet_opportunities(progress)
+    opportunity_stream.publish(analyzer.get_snapshot())
+    return len(bet_opportunities)
+
+
+refresh_jobs = RefreshJobRunner(refresh_and_publish)
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
 
+# ----------------------------- Compression -----------------------------
+
+@app.after_request
+def compress_response(response):
+    """Compresses successful responses with brotli (when installed) or gzip, whichever the client prefers."""
+    if (response.direct_passthrough or response.status_code != 200 or "Content-Encoding" in response.headers
+            or response.content_length is None or response.content_length < API_COMPRESSION_MIN_BYTES):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(["br", "gzip"] if brotli is not None else ["gzip"])
+    if encoding == "br":
+        response.set_data(brotli.compress(response.get_data(), quality=API_BROTLI_QUALITY))
+    elif encoding == "gzip":
+        response.set_data(gzip.compress(response.get_data(), compresslevel=API_GZIP_LEVEL))
+    else:
+        return response
+    response.headers["Content-Encoding"] = encoding
+    return response
+
 # ----------------------------- API Endpoints -----------------------------
 
 @app.route('/refresh_bet_opportunities', methods=['POST'])
 def refresh_bet_opportunity_data():
-    """Refreshes bet opportunities and returns the count of updated opportunities."""
-    bet_opportunities = data_manager.refresh_bet_opportunities()
-    return jsonify({"message": "Bet opportunities refreshed successfully", "total_opportunities": len(bet_opportunities)}), 201
+    """Starts refreshing bet opportunities in the background, or joins the refresh already in flight, and returns its job id."""
+    job, coalesced = refresh_jobs.submit()
+    response = jsonify({"message": "Bet opportunity refresh in progress" if coalesced else "Bet opportunity refresh started",
+                        "job_id": job.id, "status": job.status.value})
+    response.headers["Location"] = f"/refresh_jobs/{job.id}"
+    return response, 202
+
+
+@app.route('/refresh_jobs/<string:job_id>', methods=['GET'])
+def get_refresh_job(job_id):
+    """Returns the status of a refresh job with its progress per stage and per platform."""
+    job = refresh_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Refresh job not found"}), 404
+    return jsonify(job.to_json()), 200
 
 
 @app.route('/bet_opportunity/<string:bet_id>', methods=['GET'])
 def get_bet_opportunity(bet_id):
-    """Retrieves a specific bet opportunity and its orderbooks."""
+    """Retrieves a specific bet opportunity, projected to the given fields if specified, and its orderbooks."""
+    try:
+        fields = parse_fields(request.args['fields']) if 'fields' in request.args else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     try:
         bo, obs = analyzer.get_bet_opportunity_orderbooks(bet_id)
-        return jsonify({"bet_opportunity": bo.to_json(), "orderbooks": obs.to_json()}), 200
+        bet_opportunity = bo.to_json() if fields is None else project_document(bo.to_json(), fields)
+        return jsonify({"bet_opportunity": bet_opportunity, "orderbooks": obs.to_json()}), 200
     except Exception as e:
         logging.error(f"Error fetching bet opportunity {bet_id}: {e}")
         return jsonify({"error": "Bet opportunity not found"}), 404
 
 
+def get_bet_opportunity_filters(args) -> BetOpportunityFilters:
+    """Reads bet opportunity filters from query parameters, raising ValueError if one is malformed."""
+    filters: BetOpportunityFilters = {}
+    if 'min_return' in args:
+        filters["min_return"] = float(args['min_return'])
+    if 'min_annualized_return' in args:
+        filters["min_annualized_return"] = float(args['min_annualized_return'])
+    if 'platforms' in args:
+        platforms = args['platforms'].split(',')
+        if len(platforms) != 2:
+            raise ValueError(f"platforms must be two comma separated platforms, got {args['platforms']}")
+        filters["platforms"] = (platforms[0], platforms[1])
+    if 'end_date_after' in args:
+        filters["end_date_after"] = parse_timestamp(args['end_date_after'])
+    if 'end_date_before' in args:
+        filters["end_date_before"] = parse_timestamp(args['end_date_before'])
+    if 'max_staleness' in args:
+        filters["max_staleness"] = float(args['max_staleness'])
+    return filters
+
+
 @app.route('/bet_opportunities', methods=['GET'])
 def bet_opportunities():
-    """Returns a paginated list of bet opportunities, sorted if specified."""
+    """Returns a page of bet opportunities matching the filters, sorted and projected to the given fields if specified.
+
+    Pages by page_index unless a cursor is given, where an empty cursor is the first page and each page returns the cursor
+    of the next. A cursor scroll pages through the bet opportunities as they were when it started, so it neither skips nor
+    repeats bet opportunities when the data is refreshed mid scroll. Cursors from a version that is no longer kept get a 410.
+
+    Responses carry an ETag of the snapshot version, so polling clients get a 304 until the bet opportunities change.
+    """
     try:
         page_index = int(request.args.get('page_index', 0))
         results_per_page = int(request.args.get('results_per_page', 10))
-        sort = request.args.get('sort')
-        all_opportunities = analyzer.get_bet_opportunities(sort = sort) #type: ignore
-        total_opportunities = len(all_opportunities)
-
-        # Pagination
-        start_index = page_index * results_per_page
-        end_index = start_index + results_per_page
-        paginated_opportunities = [x.to_json() for x in all_opportunities[start_index:end_index]]
-
-        next_page_index = page_index + 1 if end_index < total_opportunities else None
-
-        return jsonify({
-            "results": len(paginated_opportunities),
-            "data": paginated_opportunities,
-            "next_page_index": next_page_index
-        }), 200
+        cursor = request.args.get('cursor')
+        try:
+            sort = resolve_sort_key(request.args.get('sort'))
+            filters = get_bet_opportunity_filters(request.args)
+            fields = parse_fields(request.args['fields']) if 'fields' in request.args else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # served from the analyzer's pre-sorted and pre-serialized snapshot, the one a cursor scroll started on if given a cursor
+        if cursor:
+            try:
+                snapshot = analyzer.get_cursor_snapshot(cursor)
+            except ExpiredCursorError as e:
+                return jsonify({"error": str(e)}), 410
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        else:
+            snapshot = analyzer.get_snapshot()
+
+        # the page only changes with the snapshot, unless it is filtered by staleness which also changes with time
+        etag = None if "max_staleness" in filters else f"bet-opportunities-{snapshot.version}"
+        if etag is not None and request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+
+        if cursor is not None:
+            try:
+                positions, next_cursor = snapshot.query_after(sort, filters, cursor or None, results_per_page)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            paginated_opportunities = snapshot.get_serialized(positions, fields)
+            body = (f'{{"results": {len(paginated_opportunities)}, "data": [{", ".join(paginated_opportunities)}], '
+                    f'"next_cursor": {json.dumps(next_cursor)}}}')
+        else:
+            # Pagination
+            start_index = page_index * results_per_page
+            end_index = start_index + results_per_page
+            positions, total_opportunities = snapshot.query(sort, filters, start_index, end_index)
+            paginated_opportunities = snapshot.get_serialized(positions, fields)
+
+            next_page_index = page_index + 1 if end_index < total_opportunities else None
+
+            body = (f'{{"results": {len(paginated_opportunities)}, "data": [{", ".join(paginated_opportunities)}], '
+                    f'"next_page_index": {json.dumps(next_page_index)}}}')
+
+        response = Response(body, status=200, mimetype="application/json")
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+        return response
     except Exception as e:
         logging.error(f"Error fetching bet opportunities: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route('/bet_opportunities/stream', methods=['GET'])
+def stream_bet_opportunities():
+    """Streams bet opportunity changes as server-sent events.
+
+    Starts with a snapshot event of every bet opportunity, then after each refresh sends new and removed bet opportunities
+    and those whose summed absolute or annualized return crossed min_return or min_annualized_return. A client that falls
+    behind is sent a snapshot event again instead of the events it missed.
+    """
+    try:
+        thresholds = {
+            "absolute_return": float(request.args.get('min_return', STREAM_RETURN_THRESHOLD)),
+            "annualized_return": float(request.args.get('min_annualized_return', STREAM_ANNUALIZED_RETURN_THRESHOLD))
+        }
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    client = opportunity_stream.subscribe(thresholds)  # type: ignore
+
+    def generate():
+        try:
+            while True:
+                event = client.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                yield ": keep-alive\n\n" if event is None else opportunity_stream.render(event)
+        finally:
+            opportunity_stream.unsubscribe(client)
+
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.route('/bet_opportunities/<string:bet_id>', methods=['DELETE'])
 def delete_bet_opportunities(bet_id):
     """Deletes a bet opportunity by its ID."""
@@ -71,7 +220,7 @@ def delete_bet_opportunities(bet_id):
             return jsonify({"message": "Bet opportunity not found"}), 404
 
         return jsonify({"message": f"Bet opportunity with id {bet_id} deleted successfully",
-                        "remaining_opportunities": len(remaining_opportunities)}), 200
+                        "remaining_opportunities": remaining_opportunities}), 200
     except Exception as e:
         logging.error(f"Error deleting bet opportunity {bet_id}: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -0,0 +1,55 @@
+import numpy as np
+from datetime import datetime, timezone
+from constants import MS_IN_ONE_YEAR
+
+# largest growth factor exponent that does not overflow a float
+MAX_LOG_GROWTH = float(np.log(np.finfo(np.float64).max))
+
+def calculate_absolute_returns(market_1_yes_asks : np.ndarray,
+                               market_1_no_asks : np.ndarray,
+                               market_2_yes_asks : np.ndarray,
+                               market_2_no_asks : np.ndarray,
+                               yes_contracts : float = 1,
+                               no_contracts : float = 1) -> np.ndarray:
+    """Calculates the absolute return of buying the cheapest yes and cheapest no contracts across two markets for many bet opportunities at once
+
+    Args:
+        market_1_yes_asks (np.ndarray): yes ask for market 1 of each bet opportunity
+        market_1_no_asks (np.ndarray): no ask for market 1 of each bet opportunity
+        market_2_yes_asks (np.ndarray): yes ask for market 2 of each bet opportunity
+        market_2_no_asks (np.ndarray): no ask for market 2 of each bet opportunity
+        yes_contracts (float, optional): number of yes contracts to purchase. Defaults to 1.
+        no_contracts (float, optional): number of no contracts to purchase. Defaults to 1.
+
+    Returns:
+        np.ndarray: n x 2 array of the absolute return if the market resolves to yes and if it resolves to no
+    """
+    best_yes_prices = np.minimum(market_1_yes_asks, market_2_yes_asks)
+    best_no_prices = np.minimum(market_1_no_asks, market_2_no_asks)
+    investments = best_yes_prices * yes_contracts + best_no_prices * no_contracts
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        return np.column_stack((yes_contracts / investments - 1, no_contracts / investments - 1))
+
+def calculate_annualized_returns(absolute_returns : np.ndarray, end_dates : np.ndarray, now : float | None = None) -> np.ndarray:
+    """Annualizes absolute returns for many bet opportunities at once.
+
+    Growth is computed in log space so returns that would overflow or turn complex come out as nan instead of raising.
+    If either return of a bet opportunity cannot be annualized, both are nan.
+
+    Args:
+        absolute_returns (np.ndarray): n x 2 array of absolute returns
+        end_dates (np.ndarray): close time of each bet opportunity as epoch seconds
+        now (float | None, optional): epoch seconds to annualize from, shared by every bet opportunity. Defaults to the current time.
+
+    Returns:
+        np.ndarray: n x 2 array of annualized returns, nan where the return cannot be annualized
+    """
+    if now is None:
+        now = datetime.now(timezone.utc).timestamp()
+    with np.errstate(divide = "ignore", invalid = "ignore", over = "ignore"):
+        exponents = MS_IN_ONE_YEAR / (end_dates - now)
+        log_growth = np.log1p(absolute_returns) * exponents[:, np.newaxis]
+        annualized = np.expm1(log_growth)
+    valid = np.isfinite(log_growth) & (log_growth < MAX_LOG_GROWTH) & np.isfinite(exponents)[:, np.newaxis]
+    annualized[~valid.all(axis = 1)] = np.nan
+    return annualized
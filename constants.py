@@ -5,12 +5,38 @@ POLYMARKET_ENDPOINT = "https://clob.polymarket.com/"
 
 KALSHI_ENDPOINT = "https://api.elections.kalshi.com/trade-api/v2"
 
+KALSHI_WS_ENDPOINT = "wss://api.elections.kalshi.com/trade-api/ws/v2"
+
+# path signed when connecting to the kalshi websocket
+KALSHI_WS_PATH = "/trade-api/ws/v2"
+
+POLYMARKET_WS_ENDPOINT = "wss://ws-subscriptions-clob.polymarket.com/ws/market"
+
 KALSHI_REQUEST_LIMIT = 100
 
 POLYMARKET_REQUEST_LIMIT = 500
 
+# maximum in-flight orderbook requests per platform when fetching many orderbooks at once
+ORDERBOOK_MAX_CONCURRENT_REQUESTS = {
+    "Kalshi" : 5,
+    "Polymarket" : 20
+}
+
 SIMILARITY_CUTOFF = .6
 
+# number of questions per forward pass when embedding questions
+EMBEDDING_BATCH_SIZE = 256
+
+# number of query embeddings per similarity matrix multiply when matching questions in bulk
+SIMILARITY_CHUNK_SIZE = 1024
+
+# number of inverted lists each query scans in the approximate question index (higher is slower with better recall), only used when
+# IVFIndex is passed to SemanticEquivalence, question matching searches exactly by default
+IVF_N_PROBE = 16
+
+# below this many questions the question index is searched exactly
+IVF_MIN_VECTORS = 10000
+
 class BetPlatform(str, Enum):
     Kalshi = "Kalshi"
     Polymarket = "Polymarket"
@@ -24,19 +50,36 @@ BETTING_PLATFORM_DATA = {
         },  
 }
 
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+EMBEDDING_CACHE_PATH = "embedding_cache/"
+
+LLM_VERDICT_CACHE_PATH = "llm_verdict_cache/verdicts.jsonl"
+
+# cross-encoder trained on duplicate questions, scoring candidate pairs before they are sent to the llm
+CROSS_ENCODER_MODEL_NAME = "cross-encoder/quora-distilroberta-base"
+
+# pairs scored at or above the accept score are kept and pairs at or below the reject score are dropped without asking the llm
+CROSS_ENCODER_ACCEPT_SCORE = .95
+
+CROSS_ENCODER_REJECT_SCORE = .2
+
+CROSS_ENCODER_BATCH_SIZE = 64
+
+CROSS_ENCODER_MAX_DESCRIPTION_CHARS = 400
+
 QUESTION_MAP_JSON_BASE_PATH = "question_map_data/"
 
 ACTIVE_MAP_JSON_FILENAME = "active.json"
 
+# question map before best match selection, with every semantically equivalent market kept per question
+CANDIDATE_MAP_JSON_FILENAME = "candidates.json"
+
 BET_OPPORTUNITIES_JSON_PATH = "bet_opportunity_data/"
 
 ACTIVE_BET_OPPORTUNITIES_JSON_FILENAME = "active.json"
 
-PARITY_RETURN_SORT = "parity_return"
-
-PARITY_RETURN_ANNUALIZED_SORT ="parity_return_annualized"
-
-BET_OPPORTUNITIES_SORT = {PARITY_RETURN_SORT, PARITY_RETURN_ANNUALIZED_SORT}
+BET_OPPORTUNITIES_DB_PATH = "bet_opportunity_data/bet_opportunities.db"
 
 PREDICTIT_HOST = "https://www.predictit.org/api/marketdata/"
 
@@ -56,6 +99,9 @@ class LLMInfoDict(TypedDict):
     api_key_name : str
     cost_per_1m_input_tokens : float
     cost_per_1m_output_tokens : float
+    requests_per_minute : int
+    tokens_per_minute : int
+    batch_token_budget : int
 
 LLM_INFO : dict[Enum, LLMInfoDict] = {
     LLM.deepseek_r1 : {
@@ -63,32 +109,124 @@ LLM_INFO : dict[Enum, LLMInfoDict] = {
         "model_name" : "deepseek-reasoner", 
         "api_key_name" : "DEEPSEEK_API_KEY",
         "cost_per_1m_input_tokens" : .14,
-        "cost_per_1m_output_tokens" : .55
+        "cost_per_1m_output_tokens" : .55,
+        "requests_per_minute" : 60,
+        "tokens_per_minute" : 1000000,
+        "batch_token_budget" : 12000
     },
     LLM.deepseek_v2 : {
         "base_url" : "https://api.deepseek.com",
         "model_name" : "deepseek-chat", 
         "api_key_name" : "DEEPSEEK_API_KEY",
         "cost_per_1m_input_tokens" : .014,
-        "cost_per_1m_output_tokens" : .14
+        "cost_per_1m_output_tokens" : .14,
+        "requests_per_minute" : 60,
+        "tokens_per_minute" : 1000000,
+        "batch_token_budget" : 12000
     },
     LLM.openai_4o : {
         "base_url" : "https://api.openai.com/v1/",
         "model_name" : "gpt-4o", 
         "api_key_name" : "OPENAI_API_KEY",
         "cost_per_1m_input_tokens" : 2.5,
-        "cost_per_1m_output_tokens" : 10.0
+        "cost_per_1m_output_tokens" : 10.0,
+        "requests_per_minute" : 500,
+        "tokens_per_minute" : 30000,
+        "batch_token_budget" : 8000
     },
     LLM.openai_4o_mini : {
         "base_url" : "https://api.openai.com/v1/",
         "model_name" : "gpt-4o-mini", 
         "api_key_name" : "OPENAI_API_KEY",
         "cost_per_1m_input_tokens" : .15,
-        "cost_per_1m_output_tokens" : .6
+        "cost_per_1m_output_tokens" : .6,
+        "requests_per_minute" : 500,
+        "tokens_per_minute" : 200000,
+        "batch_token_budget" : 8000
     }
 
 }
 
+# maximum in-flight llm requests when filtering bet opportunities for semantic equivalence
+LLM_MAX_CONCURRENT_REQUESTS = 8
+
+# retries of an llm request that was rate limited or failed with a server error, backing off exponentially from the base delay
+LLM_MAX_RETRIES = 5
+
+LLM_RETRY_BASE_DELAY = 1.0
+
+# times a batch is re-submitted when the llm response is not a valid json list
+LLM_MAX_PARSE_RETRIES = 2
+
+# descriptions sent to the llm are trimmed to this many characters
+LLM_MAX_DESCRIPTION_CHARS = 600
+
+# batches are packed to this fraction of a model's batch_token_budget, leaving room for where the token estimate undercounts
+LLM_BATCH_BUDGET_FRACTION = .8
+
+# completion tokens budgeted for a request before its actual usage is known
+LLM_COMPLETION_TOKEN_ESTIMATE = 256
+
+# api responses smaller than this are sent uncompressed
+API_COMPRESSION_MIN_BYTES = 1024
+
+API_GZIP_LEVEL = 6
+
+API_BROTLI_QUALITY = 5
+
+# market data requests per platform a refresh may make, markets beyond the budget keep their last prices until a later refresh
+REFRESH_REQUEST_BUDGET = {
+    "Kalshi" : 50,
+    "Polymarket" : 20
+}
+
+# markets whose prices one market data request refreshes (polymarket requests yes and no prices separately)
+REFRESH_MARKETS_PER_REQUEST = {
+    "Kalshi" : KALSHI_REQUEST_LIMIT,
+    "Polymarket" : POLYMARKET_REQUEST_LIMIT // 2
+}
+
+# weights of the percentile ranks that order markets for refresh
+REFRESH_PRIORITY_WEIGHTS = {
+    "staleness" : .5,
+    "closeness" : .3,
+    "expiry" : .2
+}
+
+# seconds since its last refresh after which a market is refreshed before any other
+REFRESH_MAX_STALENESS_SECONDS = 3600
+
+# finished refresh jobs whose status can still be read
+REFRESH_MAX_FINISHED_JOBS = 20
+
+# most recent bet opportunity snapshots kept in memory, so a cursor scroll started on one can finish after refreshes
+SNAPSHOT_CURSOR_VERSIONS = 4
+
+# events queued per stream client before it is dropped back to a snapshot
+STREAM_CLIENT_QUEUE_SIZE = 256
+
+# seconds between checks of the bet opportunity store version while stream clients are connected
+STREAM_POLL_SECONDS = 2
+
+# seconds without events after which a stream sends a keep-alive comment
+STREAM_KEEPALIVE_SECONDS = 15
+
+# default summed returns whose crossing is streamed
+STREAM_RETURN_THRESHOLD = 0.0
+
+STREAM_ANNUALIZED_RETURN_THRESHOLD = 0.0
+
+# seconds before reconnecting a dropped market data websocket, doubled after each failed attempt up to the maximum
+MARKET_STREAM_RECONNECT_DELAY = 1
+
+MARKET_STREAM_MAX_RECONNECT_DELAY = 60
+
+# seconds between full refreshes and strategy sweeps of every bet opportunity in the trading loop
+TRADING_SWEEP_SECONDS = 300
+
+# seconds the trading loop keeps collecting changed markets after the first one before re-evaluating them
+TRADING_DIRTY_BATCH_SECONDS = .5
+
 class Strategy(str, Enum):
     arbitrage_1 = "arbitrage_1"
 
@@ -97,3 +235,18 @@ class BetOpportunitySortKey(str, Enum):
     parity_return_annualized = "parity return annualized"
     parity_return_orderbook_aware = "parity return orderbook aware"
     parity_return_orderbook_aware_annualized = "parity return orderbook aware annualized"
+
+# sort keys that only need saved data, orderbook aware sorts need live orderbooks
+BET_OPPORTUNITIES_SORT = {BetOpportunitySortKey.parity_return, BetOpportunitySortKey.parity_return_annualized}
+
+class RefreshStage(str, Enum):
+    load = "load"
+    fetch_market_data = "fetch market data"
+    calculate_returns = "calculate returns"
+    publish = "publish"
+
+class RefreshJobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
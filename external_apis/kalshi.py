@@ -42,6 +42,10 @@ class KalshiAPI:
                                   private_key=private_key, #type:ignore
                                   environment=Environment.PROD)
     
+    def get_websocket_headers(self) -> dict[str, str]:
+        """Gets freshly signed headers for connecting to the websocket api"""
+        return self.client.request_headers("GET", KALSHI_WS_PATH)
+
     def get_market_orderbook(self, ticker : str) -> KalshiGetMarketOrderbookResponse:
 
         path = f"{self.client.markets_url}/{ticker}/orderbook"
@@ -0,0 +1,77 @@
+import json
+from typing import Mapping, Sequence, TypeVar
+from constants import LLM_BATCH_BUDGET_FRACTION
+
+T = TypeVar("T", bound = Mapping[str, str])
+
+def estimate_tokens(text : str) -> int:
+    """Conservative token count of a prompt without the model's tokenizer.
+
+    Ascii text other than digits is counted at four characters per token, which holds for english prose. Digits and non-ascii
+    characters are counted as a token each, since tokenizers split numbers into short runs and often spend one or more tokens on
+    a character outside the latin alphabet. The estimate can still undercount, e.g. for emoji, so batches are packed with a margin
+    under the budget (see pack_batches).
+    """
+    dense = sum(1 for c in text if not c.isascii() or c.isdigit())
+    return (len(text) - dense) // 4 + dense + 1
+
+def trim_text(text : str, max_chars : int) -> str:
+    """Shortens text to at most max_chars characters, cutting at a word boundary and marking the cut with an ellipsis"""
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars - 1]
+    if " " in cut:
+        cut = cut[:cut.rindex(" ")]
+    return cut + "…"
+
+def serialize_entry(entry : Mapping[str, str], short_id : str, max_description_chars : int) -> str:
+    """Serializes a bet opportunity's titles as one compact json line with a short id and trimmed descriptions"""
+    return json.dumps({
+        "id" : short_id,
+        "q1" : entry["market_1_question"],
+        "d1" : trim_text(entry["market_1_description"], max_description_chars),
+        "q2" : entry["market_2_question"],
+        "d2" : trim_text(entry["market_2_description"], max_description_chars)
+    }, ensure_ascii = False, separators = (",", ":"))
+
+def pack_batches(entries : Sequence[T], token_budget : int, max_description_chars : int) -> list[list[T]]:
+    """Greedily packs entries, in order, into batches whose serialized size stays within a token budget.
+
+    Short ids grow with the position in the batch, so each entry is measured with the id it will be sent with.
+    Entries are packed to LLM_BATCH_BUDGET_FRACTION of the budget, as estimate_tokens is a heuristic rather than the model's tokenizer.
+    An entry that is larger than the budget on its own is sent in a batch by itself.
+
+    Args:
+        entries (Sequence[T]): bet opportunity titles to pack
+        token_budget (int): maximum tokens of the serialized entries of a batch
+        max_description_chars (int): length descriptions are trimmed to
+
+    Returns:
+        list[list[T]]: batches of entries
+    """
+    token_budget = int(token_budget * LLM_BATCH_BUDGET_FRACTION)
+    batches : list[list[T]] = []
+    batch : list[T] = []
+    batch_tokens = 0
+    for entry in entries:
+        tokens = estimate_tokens(serialize_entry(entry, str(len(batch)), max_description_chars))
+        if batch and batch_tokens + tokens > token_budget:
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+            tokens = estimate_tokens(serialize_entry(entry, "0", max_description_chars))
+        batch.append(entry)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def build_prompt(prompt_prefix : str, batch : Sequence[Mapping[str, str]], max_description_chars : int) -> tuple[str, dict[str, str]]:
+    """Builds the prompt for a batch, numbering its entries with short ids
+
+    Returns:
+        tuple[str, dict[str, str]]: prompt and the bet opportunity id of each short id
+    """
+    short_ids = {str(i) : entry["id"] for i, entry in enumerate(batch)}
+    lines = [serialize_entry(entry, short_id, max_description_chars) for short_id, entry in zip(short_ids, batch)]
+    return prompt_prefix + "\n".join(lines), short_ids
@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from typing import Any, Callable, Generator
+import logging
+
+MarketKey = tuple[str, str] # (platform, market id)
+
+def iter_market_results(bet_opportunities : list[Any], fetch_market : Callable[[Any], Any],
+                        max_concurrency : dict[str, int]) -> Generator[tuple[Any, Any, Any], None, None]:
+    """Requests the markets of many bet opportunities concurrently, yielding each bet opportunity as soon as the results for both
+    of its markets arrive.
+
+    Each platform gets its own thread pool so in-flight requests are bounded per platform, and a market shared by several bet
+    opportunities is only requested once. Bet opportunities with a market whose request failed are logged and skipped.
+
+    Args:
+        bet_opportunities (list[Any]): BetOpportunity objects
+        fetch_market (Callable[[Any], Any]): requests one BinaryMarket
+        max_concurrency (dict[str, int]): maximum number of concurrent requests per platform
+
+    Yields:
+        tuple[Any, Any, Any]: a bet opportunity and the results for its first and second market, in completion order
+    """
+    executors : dict[str, ThreadPoolExecutor] = {}
+    market_futures : dict[MarketKey, Future] = {}
+    waiting_bet_opportunities : dict[Future, list[int]] = {}
+    remaining_markets = [2] * len(bet_opportunities)
+    try:
+        for i, bo in enumerate(bet_opportunities):
+            for binary_market in [bo.market_1, bo.market_2]:
+                key = (binary_market.platform, binary_market.id)
+                if key not in market_futures:
+                    if binary_market.platform not in executors:
+                        executors[binary_market.platform] = ThreadPoolExecutor(max_workers = max_concurrency[binary_market.platform])
+                    future = executors[binary_market.platform].submit(fetch_market, binary_market)
+                    market_futures[key] = future
+                    waiting_bet_opportunities[future] = []
+                waiting_bet_opportunities[market_futures[key]].append(i)
+
+        for future in as_completed(waiting_bet_opportunities):
+            for i in waiting_bet_opportunities[future]:
+                remaining_markets[i] -= 1
+                if remaining_markets[i] > 0:
+                    continue
+                bo = bet_opportunities[i]
+                try:
+                    market_1_result = market_futures[(bo.market_1.platform, bo.market_1.id)].result()
+                    market_2_result = market_futures[(bo.market_2.platform, bo.market_2.id)].result()
+                except Exception as e:
+                    logging.info(f"error retrieving orderbook data for bet opportunity {bo.id}")
+                    logging.error(f"Full error: {e}")
+                    continue
+                yield bo, market_1_result, market_2_result
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait = False, cancel_futures = True)
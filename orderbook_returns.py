@@ -1,35 +1,39 @@
-from OrderBook import OrderBook, Order
+from OrderBook import OrderBook, Order, get_fill_price, to_side_arrays
 from typing import TypedDict
+import numpy as np
+import math
 
 class Returns(TypedDict):
     yes_contracts : float
     no_contracts : float
     returns : float
 
+class OptimalTrade(TypedDict):
+    yes_market : int # market to buy yes contracts on (1 or 2), no contracts are bought on the other market
+    contracts : float # number of yes contracts and of no contracts to buy
+    cost : float
+    profit : float
+    absolute_return : float
+    annualized_return : float | None
+
 def get_effective_price(asks : list[Order], contracts : float, i : int = 0) -> float | None:
     """Given an orderbook and a number of contracts to buy, get the effective price.
 
+    Builds the running totals of the asks and binary searches them with get_fill_price, as OrderBook does. Deprecated: building
+    the running totals is O(depth) per call, so to price several sizes against one book use OrderBook.implied_ask_price, which
+    builds them once per book version and prices each size in O(log depth).
+
     Args:
         orderbook (Order): list of sorted orders in increasing price
         contracts (int): number of contracts to buy
+        i (int): index of the first ask to fill from
     
     Returns: 
         float | None : effective price of the transaction, None if insufficient available asks to complete the transaction
     """
-    if len(asks) == i:
-        return None
-    else:
-        ask = asks[i]
-        price, size = ask['price'], ask['size']
-        if size >= contracts:
-            return price
-        remaining_contracts = contracts - size
-        effective_price_remaining = get_effective_price(asks, remaining_contracts, i + 1)
-        if effective_price_remaining == None:
-            return None
-        else:
-            return (price * size + effective_price_remaining * remaining_contracts) / (size + remaining_contracts)
-        
+    arrays = to_side_arrays([(ask["price"], ask["size"]) for ask in asks[i:]])
+    return get_fill_price(arrays["prices"], arrays["cumulative_sizes"], arrays["cumulative_costs"], contracts)
+
 def get_max_return(m1: OrderBook, m2 : OrderBook) -> tuple[float, float]:
     """Buying yes contracts on m1 and m2, returns the contract size to get the best return you could achieve.
 
@@ -56,8 +60,8 @@ def get_market_return(m1 : OrderBook, m2 : OrderBook, yes_contracts : float, no_
     Returns:
         float | None: return of the trade, None if error
     """
-    m1_yes_ep = get_effective_price(m1.get_sorted_asks(), yes_contracts)
-    m2_no_ep = get_effective_price(m2.get_sorted_asks(), no_contracts)
+    m1_yes_ep = m1.implied_ask_price(yes_contracts)
+    m2_no_ep = m2.implied_ask_price(no_contracts)
     if m1_yes_ep and m2_no_ep:
         return 1 / (m1_yes_ep + m2_no_ep) - 1
     else:
@@ -81,6 +85,115 @@ def get_return_size_aware(yes_contracts : float, no_contracts : float,
         return return_2
     return -1.0
 
+def get_cost(orderbook : OrderBook, contracts : float) -> float:
+    """Gets the total cost of buying a number of contracts from the asks of an orderbook (assumes there is enough depth)."""
+    if contracts <= 0:
+        return 0.0
+    return orderbook.implied_ask_price(contracts) * contracts #type: ignore
+
+def get_optimal_contracts(yes_orderbook : OrderBook, no_orderbook : OrderBook, max_pair_price : float = 1.0, max_capital : float | None = None) -> float:
+    """Buying yes contracts on one orderbook and the same number of no contracts on the other, gets the number of contracts that maximizes profit.
+
+    Each leg's cost is piecewise linear in the number of contracts with a breakpoint at every ask level, so the cost of a yes + no
+    pair is constant between the merged breakpoints of both legs and non-decreasing as size grows. Profit is therefore maximized
+    by buying every pair priced below max_pair_price, cut short if the capital runs out.
+
+    Args:
+        yes_orderbook (OrderBook): orderbook to buy yes contracts from
+        no_orderbook (OrderBook): orderbook to buy no contracts from
+        max_pair_price (float, optional): most to pay for one yes + no pair, 1 is break-even. Defaults to 1.0.
+        max_capital (float | None, optional): most capital to spend. Defaults to None.
+
+    Returns:
+        float: number of contracts to buy on each leg, 0 if no pair is worth buying
+    """
+    depth = min(yes_orderbook.ask_cumulative_sizes[-1] if len(yes_orderbook.ask_prices) else 0.0,
+                no_orderbook.ask_cumulative_sizes[-1] if len(no_orderbook.ask_prices) else 0.0)
+    if depth <= 0:
+        return 0.0
+    # merge the breakpoints of both legs into one set of segments with a constant pair price
+    breakpoints = np.union1d(yes_orderbook.ask_cumulative_sizes, no_orderbook.ask_cumulative_sizes)
+    segment_ends = np.append(breakpoints[breakpoints < depth], depth)
+    segment_starts = np.concatenate(([0.0], segment_ends[:-1]))
+    yes_prices = yes_orderbook.ask_prices[np.searchsorted(yes_orderbook.ask_cumulative_sizes, segment_starts, side = "right")]
+    no_prices = no_orderbook.ask_prices[np.searchsorted(no_orderbook.ask_cumulative_sizes, segment_starts, side = "right")]
+    pair_prices = yes_prices + no_prices
+
+    # pair prices never decrease, so the profitable segments are a prefix
+    profitable = int(np.searchsorted(pair_prices, max_pair_price, side = "left"))
+    if profitable == 0:
+        return 0.0
+    contracts = float(segment_ends[profitable - 1])
+
+    if max_capital is not None:
+        segment_costs = pair_prices[:profitable] * (segment_ends[:profitable] - segment_starts[:profitable])
+        cumulative_costs = np.cumsum(segment_costs)
+        if cumulative_costs[-1] > max_capital:
+            i = int(np.searchsorted(cumulative_costs, max_capital, side = "right"))
+            cost_before = cumulative_costs[i - 1] if i > 0 else 0.0
+            contracts = float(segment_starts[i] + (max_capital - cost_before) / pair_prices[i])
+    return contracts
+
+def get_optimal_trade(market_1_yes_orderbook : OrderBook,
+                      market_1_no_orderbook : OrderBook,
+                      market_2_yes_orderbook : OrderBook,
+                      market_2_no_orderbook : OrderBook,
+                      max_capital : float | None = None,
+                      years_to_close : float | None = None,
+                      min_annualized_return : float = 0.0,
+                      whole_contracts : bool = True
+                ) -> OptimalTrade | None:
+    """Gets the direction and number of contracts that maximize profit for a bet opportunity, checking both
+    buying yes on market 1 / no on market 2 and yes on market 2 / no on market 1.
+
+    With years_to_close set, only pairs that each earn at least min_annualized_return are bought, which maximizes profit
+    net of the cost of tying up capital at that rate until close.
+
+    Args:
+        market_1_yes_orderbook (OrderBook): yes orderbook for market 1
+        market_1_no_orderbook (OrderBook): no orderbook for market 1
+        market_2_yes_orderbook (OrderBook): yes orderbook for market 2
+        market_2_no_orderbook (OrderBook): no orderbook for market 2
+        max_capital (float | None, optional): most capital to spend on the trade. Defaults to None.
+        years_to_close (float | None, optional): years until the proceeds are returned. Defaults to None.
+        min_annualized_return (float, optional): hurdle rate each pair must clear when years_to_close is set. Defaults to 0.0.
+        whole_contracts (bool, optional): round the size down to a whole number of contracts. Defaults to True.
+
+    Returns:
+        OptimalTrade | None: most profitable trade, None if neither direction is profitable
+    """
+    max_pair_price = 1.0
+    if years_to_close is not None and years_to_close > 0:
+        max_pair_price = 1 / (1 + min_annualized_return) ** years_to_close
+
+    best : OptimalTrade | None = None
+    for yes_market, yes_orderbook, no_orderbook in [(1, market_1_yes_orderbook, market_2_no_orderbook),
+                                                    (2, market_2_yes_orderbook, market_1_no_orderbook)]:
+        contracts = get_optimal_contracts(yes_orderbook, no_orderbook, max_pair_price, max_capital)
+        if whole_contracts:
+            contracts = math.floor(contracts)
+        if contracts <= 0:
+            continue
+        cost = get_cost(yes_orderbook, contracts) + get_cost(no_orderbook, contracts)
+        profit = contracts - cost
+        if profit <= 0 or (best is not None and profit <= best["profit"]):
+            continue
+        absolute_return = contracts / cost - 1
+        annualized_return = None
+        if years_to_close is not None and years_to_close > 0:
+            # annualize in log space so very short horizons overflow to None rather than raising
+            exponent = math.log1p(absolute_return) / years_to_close
+            annualized_return = math.expm1(exponent) if exponent < math.log(np.finfo(np.float64).max) else None
+        best = {
+            "yes_market" : yes_market,
+            "contracts" : contracts,
+            "cost" : cost,
+            "profit" : profit,
+            "absolute_return" : absolute_return,
+            "annualized_return" : annualized_return
+        }
+    return best
+
 if __name__ == "__main__":
     # orders : list[Order] = [{'price': 0.65, 'size': 50.0}, {'price': 0.67, 'size': 200.0}, {'price': 0.98, 'size': 590.0}, {'price': 0.99, 'size': 7400.0}]
     # contracts = 300.0
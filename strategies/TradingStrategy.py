@@ -5,3 +5,7 @@ class TradingStrategy():
     def run(self):
         pass
 
+    def run_on(self, bet_opportunities : list):
+        """Evaluates only the given bet opportunities, as when prices of their markets changed"""
+        pass
+
@@ -2,49 +2,97 @@ from strategies.TradingStrategy import TradingStrategy
 from TradeExecution import TradeExecution
 from TradingOpportunities import BetArbitrageAnalyzer
 from BetOpportunity import BetOpportunity
-from orderbook_returns import get_return_size_aware
-from utils import get_annualized_return
+from orderbook_returns import get_return_size_aware, get_optimal_trade, OptimalTrade
+from utils import get_years_until
 from constants import *
 import logging
-from typing import Generator
+from typing import Generator, Iterable
 
 # parameters
 MIN_RETURN = .05
 MAX_RETURN = 100 #anything above highly likely to be an error
 N = 500
 BET_SIZE = 10
+MAX_CAPITAL = 1000
 
 class ArbitrageV1(TradingStrategy):
-    def __init__(self):
-        self.bet_arbitrage_analyzer = BetArbitrageAnalyzer()
+    def __init__(self, bet_arbitrage_analyzer : BetArbitrageAnalyzer | None = None):
+        """
+        Args:
+            bet_arbitrage_analyzer (BetArbitrageAnalyzer | None, optional): analyzer to share, e.g. one whose market data
+                stream is running, so orderbooks of streamed markets are not requested over REST
+        """
+        self.bet_arbitrage_analyzer = bet_arbitrage_analyzer or BetArbitrageAnalyzer()
         self.trade_execution = TradeExecution()
-    
+
     def run(self):
-        for (op, r) in self.get_top_n_opportunities(n=N, bet_size=BET_SIZE):
-            annualized_return = get_annualized_return(r, max(op.market_1.end_date,op.market_2.end_date))
-            if annualized_return > MIN_RETURN and annualized_return < MAX_RETURN:
+        self.execute_trades(self.get_top_n_trades(n=N, max_capital=MAX_CAPITAL, min_annualized_return=MIN_RETURN))
+
+    def run_on(self, bet_opportunities : list[BetOpportunity]):
+        self.execute_trades(self.get_trades(bet_opportunities, max_capital=MAX_CAPITAL, min_annualized_return=MIN_RETURN))
+
+    def execute_trades(self, trades : Iterable[tuple[BetOpportunity, OptimalTrade]]):
+        for (op, trade) in trades:
+            annualized_return = trade["annualized_return"]
+            if annualized_return and annualized_return > MIN_RETURN and annualized_return < MAX_RETURN:
                 logging.info(
                     f"----------------------------------\n"
                     f"\nMarket 1 Platform / Question: {op.market_1.platform} / {op.market_1.question}"
                     f"\nMarket 2 Platform / Question: {op.market_2.platform} / {op.market_2.question}"
-                    f"\nOrderbook size aware return: {r}"
+                    f"\nBuy yes on market {trade['yes_market']}: {trade['contracts']} contracts for {trade['cost']}"
+                    f"\nOrderbook size aware return: {trade['absolute_return']}"
                     f"\nAnnualized size aware return: {annualized_return}"
                 )
-                self.trade_execution.execute_arbitrate_trade_for_bet_opportunity(op)
-    
+                self.trade_execution.execute_arbitrate_trade_for_bet_opportunity(op, trade)
+
     def get_top_n_opportunities(
         self,
         n: int = 20,
         initial_sort: BetOpportunitySortKey = BetOpportunitySortKey.parity_return,
         bet_size : float  = 100
     ) -> Generator[tuple[BetOpportunity, float], None, None]:
-        """Finds the top N highest-return bet opportunities."""
-        top_n_ops = self.bet_arbitrage_analyzer.get_bet_opportunities(sort=initial_sort)[:n]
-        for op in top_n_ops:
-            orderbooks = self.bet_arbitrage_analyzer.get_orderbooks(op)
+        """Finds the top N highest-return bet opportunities, yielding each as soon as its orderbooks arrive."""
+        top_n_ops = self.bet_arbitrage_analyzer.get_bet_opportunities(sort=initial_sort, n=n)
+        for op, orderbooks in self.bet_arbitrage_analyzer.iter_orderbooks(top_n_ops):
             m1_yes = orderbooks.m1_yes_ob
             m1_no = orderbooks.m1_no_ob
             m2_yes = orderbooks.m2_yes_ob
             m2_no = orderbooks.m2_no_ob
             op_return = get_return_size_aware(bet_size, bet_size, m1_yes, m1_no, m2_yes, m2_no)
-            yield (op, op_return)
\ No newline at end of file
+            yield (op, op_return)
+
+    def get_top_n_trades(
+        self,
+        n: int = 20,
+        initial_sort: BetOpportunitySortKey = BetOpportunitySortKey.parity_return,
+        max_capital : float | None = None,
+        min_annualized_return : float = 0.0
+    ) -> Generator[tuple[BetOpportunity, OptimalTrade], None, None]:
+        """For the top N bet opportunities, finds the most profitable trade size and direction using the full orderbook depth,
+        yielding each profitable trade as soon as its orderbooks arrive."""
+        top_n_ops = self.bet_arbitrage_analyzer.get_bet_opportunities(sort=initial_sort, n=n)
+        return self.get_trades(top_n_ops, max_capital=max_capital, min_annualized_return=min_annualized_return)
+
+    def get_trades(
+        self,
+        bet_opportunities : list[BetOpportunity],
+        max_capital : float | None = None,
+        min_annualized_return : float = 0.0
+    ) -> Generator[tuple[BetOpportunity, OptimalTrade], None, None]:
+        """For the given bet opportunities, finds the most profitable trade size and direction using the full orderbook depth,
+        yielding each profitable trade as soon as its orderbooks arrive."""
+        for op, orderbooks in self.bet_arbitrage_analyzer.iter_orderbooks(bet_opportunities):
+            years_to_close = get_years_until(max(op.market_1.end_date, op.market_2.end_date))
+            if years_to_close <= 0:
+                continue
+            trade = get_optimal_trade(
+                orderbooks.m1_yes_ob,
+                orderbooks.m1_no_ob,
+                orderbooks.m2_yes_ob,
+                orderbooks.m2_no_ob,
+                max_capital=max_capital,
+                years_to_close=years_to_close,
+                min_annualized_return=min_annualized_return
+            )
+            if trade:
+                yield (op, trade)
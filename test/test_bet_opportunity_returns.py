@@ -0,0 +1,45 @@
+import unittest
+import math
+import numpy as np
+from bet_opportunity_returns import calculate_absolute_returns, calculate_annualized_returns
+from constants import MS_IN_ONE_YEAR
+
+class TestBetOpportunityReturns(unittest.TestCase):
+    def test_absolute_returns(self):
+        """Test that the cheapest yes and no across both markets are used.
+
+        Cheapest yes is .40 (market 2) and cheapest no is .50 (market 1), so one pair costs .90
+        """
+        returns = calculate_absolute_returns(np.array([.45]), np.array([.50]), np.array([.40]), np.array([.55]))
+        self.assertAlmostEqual(returns[0, 0], 1 / .9 - 1)
+        self.assertAlmostEqual(returns[0, 1], 1 / .9 - 1)
+
+    def test_annualized_matches_power(self):
+        """Test that annualizing in log space matches (1 + r) ** (year / time remaining) - 1."""
+        now = 1_700_000_000.0
+        absolute_returns = np.array([[.1, .1], [.02, .03]])
+        end_dates = np.array([now + MS_IN_ONE_YEAR / 2, now + 2 * MS_IN_ONE_YEAR])
+        annualized = calculate_annualized_returns(absolute_returns, end_dates, now)
+        self.assertAlmostEqual(annualized[0, 0], 1.1 ** 2 - 1)
+        self.assertAlmostEqual(annualized[1, 1], 1.03 ** .5 - 1)
+
+    def test_overflow_is_nan(self):
+        """Test that a return closing in one second is nan for both outcomes instead of overflowing."""
+        now = 1_700_000_000.0
+        annualized = calculate_annualized_returns(np.array([[.5, .0]]), np.array([now + 1]), now)
+        self.assertTrue(np.isnan(annualized).all())
+
+    def test_close_time_now_is_nan(self):
+        """Test that a bet opportunity closing exactly now cannot be annualized."""
+        now = 1_700_000_000.0
+        annualized = calculate_annualized_returns(np.array([[.5, .5]]), np.array([now]), now)
+        self.assertTrue(np.isnan(annualized).all())
+
+    def test_negative_return_past_close(self):
+        """Test that a losing return past its close time is still annualized like the power formula."""
+        now = 1_700_000_000.0
+        annualized = calculate_annualized_returns(np.array([[-.1, -.1]]), np.array([now - MS_IN_ONE_YEAR]), now)
+        self.assertTrue(math.isclose(annualized[0, 0], .9 ** -1 - 1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import json
+from datetime import datetime, timezone
+from BetOpportunitySnapshot import (BetOpportunitySnapshot, SnapshotHistory, ExpiredCursorError, resolve_sort_key, encode_cursor, decode_cursor,
+                                   parse_fields, project_document)
+from constants import BetOpportunitySortKey
+
+def make_bet_opportunity(id, absolute_return, annualized_return, platforms = ("Kalshi", "Polymarket"),
+                         end_dates = ("2026-01-01T00:00:00.000000Z", "2026-06-01T00:00:00.000000Z"),
+                         last_update = "2025-02-01T00:00:00+00:00"):
+    return {
+        "question" : f"question {id}",
+        "id" : id,
+        "market_1" : {"id" : f"K{id}", "platform" : platforms[0], "end_date" : end_dates[0]},
+        "market_2" : {"id" : f"P{id}", "platform" : platforms[1], "end_date" : end_dates[1]},
+        "absolute_return" : absolute_return,
+        "annualized_return" : annualized_return,
+        "last_update" : last_update
+    }
+
+DOCUMENTS = [
+    make_bet_opportunity("a", [.1, .1], [.3, .3], platforms = ("Polymarket", "Kalshi")),
+    make_bet_opportunity("b", [.5, .5], [None, None], last_update = "2025-02-01T00:10:00+00:00"),
+    make_bet_opportunity("c", [.1, .1], [.9, .9], platforms = ("Kalshi", "PredictIt")),
+    make_bet_opportunity("d", [-.2, -.2], [-.5, -.5], end_dates = ("2027-01-01T00:00:00.000000Z", "2027-01-01T00:00:00.000000Z"))
+]
+
+class TestBetOpportunitySnapshot(unittest.TestCase):
+    def setUp(self):
+        self.snapshot = BetOpportunitySnapshot(3, DOCUMENTS)
+
+    def get_ids(self, positions):
+        return [DOCUMENTS[i]["id"] for i in positions]
+
+    def test_sort_orders(self):
+        """Test that sorts put the highest summed return first, missing returns as -1 and ties by id."""
+        ids = lambda sort: [bo["id"] for bo in self.snapshot.get_documents(sort)]
+        self.assertEqual(ids(None), ["a", "b", "c", "d"])
+        self.assertEqual(ids(BetOpportunitySortKey.parity_return), ["b", "a", "c", "d"])
+        self.assertEqual(ids(BetOpportunitySortKey.parity_return_annualized), ["c", "a", "b", "d"])
+        self.assertEqual(ids(BetOpportunitySortKey.parity_return_orderbook_aware), ["a", "b", "c", "d"])
+
+    def test_serialized_pages(self):
+        """Test that a page is the pre-serialized json of a slice of the sorted bet opportunities."""
+        positions, total = self.snapshot.query(BetOpportunitySortKey.parity_return, None, 1, 3)
+        self.assertEqual([json.loads(bo) for bo in self.snapshot.get_serialized(positions)], [DOCUMENTS[0], DOCUMENTS[2]])
+        self.assertEqual(total, 4)
+        self.assertEqual(self.snapshot.query(None, None, 10, 20), ([], 4))
+
+    def test_filters(self):
+        """Test that each filter only keeps matching bet opportunities and filters combine."""
+        query = lambda filters: self.get_ids(self.snapshot.query(None, filters, now = datetime(2025, 2, 1, 0, 15, tzinfo=timezone.utc))[0])
+        self.assertEqual(query({"min_return" : .2}), ["a", "b", "c"])
+        self.assertEqual(query({"min_annualized_return" : 0}), ["a", "c"])
+        self.assertEqual(query({"platforms" : ("Kalshi", "Polymarket")}), ["a", "b", "d"])
+        self.assertEqual(query({"end_date_after" : datetime(2026, 6, 1, tzinfo=timezone.utc)}), ["d"])
+        self.assertEqual(query({"end_date_before" : datetime(2026, 6, 1, tzinfo=timezone.utc)}), ["a", "b", "c"])
+        self.assertEqual(query({"max_staleness" : 600}), ["b"])
+        self.assertEqual(query({"min_return" : 0, "platforms" : ("Polymarket", "Kalshi")}), ["a", "b"])
+        self.assertEqual(self.snapshot.query(None, {"min_return" : .2}, 0, 1)[1], 3)
+
+    def test_cursor_pages(self):
+        """Test that following cursors visits every matching bet opportunity once in sorted order."""
+        sort = BetOpportunitySortKey.parity_return
+        ids, cursor = [], None
+        while True:
+            positions, cursor = self.snapshot.query_after(sort, {"min_return" : 0}, cursor, 2)
+            ids += self.get_ids(positions)
+            if cursor is None:
+                break
+        self.assertEqual(ids, ["b", "a", "c"])
+
+    def test_cursor_stable_across_refresh(self):
+        """Test that a scroll keeps paging through the snapshot it started on when a refresh moves returns across its cursor."""
+        sort = BetOpportunitySortKey.parity_return
+        history = SnapshotHistory()
+        history.add(self.snapshot)
+        positions, cursor = self.snapshot.query_after(sort, None, None, 2)
+        self.assertEqual(self.get_ids(positions), ["b", "a"])
+        # b drops below the cursor and c rises above it
+        refreshed = BetOpportunitySnapshot(4, [make_bet_opportunity("b", [-.5, -.5], [None, None]), DOCUMENTS[0],
+                                               make_bet_opportunity("c", [.8, .8], [.9, .9]), DOCUMENTS[3]])
+        history.add(refreshed)
+        with self.assertRaises(ValueError):
+            refreshed.query_after(sort, None, cursor, 2)
+        snapshot = history.get_for_cursor(cursor) #type: ignore
+        self.assertIs(snapshot, self.snapshot)
+        positions, cursor = snapshot.query_after(sort, None, cursor, 2)
+        self.assertEqual(self.get_ids(positions), ["c", "d"])
+        self.assertIsNone(cursor)
+
+    def test_expired_cursor(self):
+        """Test that a cursor is rejected once its snapshot is older than the kept versions."""
+        history = SnapshotHistory(max_versions = 2)
+        history.add(self.snapshot)
+        _, cursor = self.snapshot.query_after(None, None, None, 2)
+        history.add(BetOpportunitySnapshot(4, DOCUMENTS))
+        self.assertIs(history.get_for_cursor(cursor), self.snapshot) #type: ignore
+        history.add(BetOpportunitySnapshot(5, DOCUMENTS))
+        with self.assertRaises(ExpiredCursorError):
+            history.get_for_cursor(cursor) #type: ignore
+
+    def test_invalid_cursors(self):
+        """Test that malformed cursors and cursors from another sort are rejected."""
+        with self.assertRaises(ValueError):
+            decode_cursor("not a cursor")
+        with self.assertRaises(ValueError):
+            self.snapshot.query_after(BetOpportunitySortKey.parity_return, None, encode_cursor(3, None, 0, "a"), 2)
+        self.assertEqual(decode_cursor(encode_cursor(3, BetOpportunitySortKey.parity_return, .1, "a")), (3, BetOpportunitySortKey.parity_return, .1, "a"))
+
+    def test_projection(self):
+        """Test that projections keep top level and market fields, and that a whole market wins over its fields."""
+        fields = parse_fields("id, absolute_return,market_1.platform,market_2.end_date")
+        self.assertEqual(json.loads(self.snapshot.get_serialized([0], fields)[0]), {
+            "id" : "a", "absolute_return" : [.1, .1], "market_1" : {"platform" : "Polymarket"},
+            "market_2" : {"end_date" : "2026-06-01T00:00:00.000000Z"}
+        })
+        self.assertEqual(project_document(DOCUMENTS[0], ("market_1.id", "market_1")), {"market_1" : DOCUMENTS[0]["market_1"]})
+        for fields in ["volume", "market_1.volume", "market_3.id", ""]:
+            with self.assertRaises(ValueError):
+                parse_fields(fields)
+
+    def test_resolve_sort_key(self):
+        """Test that sort keys resolve from enum values and names and unknown sorts are rejected."""
+        self.assertEqual(resolve_sort_key("parity return"), BetOpportunitySortKey.parity_return)
+        self.assertEqual(resolve_sort_key("parity_return_annualized"), BetOpportunitySortKey.parity_return_annualized)
+        self.assertIsNone(resolve_sort_key(None))
+        with self.assertRaises(ValueError):
+            resolve_sort_key("volume")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import tempfile
+import json
+import os
+from BetOpportunityStore import BetOpportunityStore
+
+def make_bet_opportunity(id, absolute_return = [.1, .2], annualized_return = [.5, .6], last_update = "2025-02-01T00:00:00+00:00"):
+    return {
+        "question" : f"question {id}",
+        "id" : id,
+        "market_1" : {"id" : f"K{id}"},
+        "market_2" : {"id" : f"P{id}"},
+        "absolute_return" : absolute_return,
+        "annualized_return" : annualized_return,
+        "last_update" : last_update
+    }
+
+class TestBetOpportunityStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = BetOpportunityStore(os.path.join(self.directory.name, "bet_opportunities.db"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_save_get_and_order(self):
+        """Test that saved documents round trip, keep their order and can be read by id."""
+        bet_opportunities = [make_bet_opportunity("b"), make_bet_opportunity("a", annualized_return = [None, None])]
+        self.store.save_all(bet_opportunities)
+        self.assertEqual(self.store.get_all(), bet_opportunities)
+        self.assertEqual(self.store.get("a"), bet_opportunities[1])
+        self.assertIsNone(self.store.get("missing"))
+
+    def test_only_changed_rows_written(self):
+        """Test that saving again only counts added, changed and removed rows and only bumps the version when something changed."""
+        self.store.save_all([make_bet_opportunity("a"), make_bet_opportunity("b"), make_bet_opportunity("c")])
+        version = self.store.get_version()
+        self.assertEqual(self.store.save_all([make_bet_opportunity("a"), make_bet_opportunity("b"), make_bet_opportunity("c")]), 0)
+        self.assertEqual(self.store.get_version(), version)
+        changed = self.store.save_all([make_bet_opportunity("a"), make_bet_opportunity("b", absolute_return = [.3, .3]), make_bet_opportunity("d")])
+        self.assertEqual(changed, 3) # b changed, c removed, d added
+        self.assertEqual([bo["id"] for bo in self.store.get_all()], ["a", "b", "d"])
+        self.assertGreater(self.store.get_version(), version)
+
+    def test_delete(self):
+        """Test that deleting removes only the given bet opportunity and reports whether it existed."""
+        self.store.save_all([make_bet_opportunity("a"), make_bet_opportunity("b")])
+        self.assertTrue(self.store.delete("a"))
+        self.assertFalse(self.store.delete("a"))
+        self.assertEqual(len(self.store), 1)
+
+    def test_migrate_from_json_once(self):
+        """Test that the json migration imports into an empty store and never runs again."""
+        json_filepath = os.path.join(self.directory.name, "active.json")
+        with open(json_filepath, "w") as f:
+            json.dump([make_bet_opportunity("a"), make_bet_opportunity("b")], f, indent = 4)
+        self.assertTrue(self.store.migrate_from_json(json_filepath))
+        self.assertEqual(len(self.store), 2)
+        self.store.delete("a")
+        self.assertFalse(self.store.migrate_from_json(json_filepath))
+        self.assertEqual(len(self.store), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+from CrossEncoderReranker import CrossEncoderReranker, split_by_confidence
+
+class ScriptedCrossEncoder:
+    """Stands in for a cross-encoder, scoring each pair from a table keyed by the first market's text"""
+
+    def __init__(self, scores : dict[str, float]):
+        self.scores = scores
+        self.pairs : list[tuple[str, str]] = []
+
+    def predict(self, pairs, batch_size = 32, convert_to_numpy = True):
+        self.pairs.extend(pairs)
+        return np.array([self.scores[a.split()[0]] for a, _ in pairs])
+
+def make_entry(id, question):
+    return {"id" : id, "market_1_id" : "K" + id, "market_1_question" : question, "market_1_description" : "resolves  yes\nif so",
+            "market_2_id" : "P" + id, "market_2_question" : "other", "market_2_description" : ""}
+
+class TestCrossEncoderReranker(unittest.TestCase):
+    def test_split_by_confidence(self):
+        """Test that scores at the thresholds are confident and scores between them are uncertain."""
+        accepted, rejected, uncertain = split_by_confidence(np.array([.95, .2, .5, .99, .01]), .95, .2)
+        self.assertEqual(accepted.tolist(), [0, 3])
+        self.assertEqual(rejected.tolist(), [1, 4])
+        self.assertEqual(uncertain.tolist(), [2])
+
+    def test_rerank(self):
+        """Test that confident matches are accepted, confident non-matches dropped and only uncertain pairs are left for the llm."""
+        model = ScriptedCrossEncoder({"same" : .99, "different" : .05, "unsure" : .6})
+        reranker = CrossEncoderReranker(model, accept_score = .9, reject_score = .1) #type: ignore
+        entries = [make_entry("a", "same"), make_entry("b", "different"), make_entry("c", "unsure")]
+        accepted, uncertain = reranker.rerank(entries)
+        self.assertEqual(accepted, {"a"})
+        self.assertEqual(uncertain, [2])
+        self.assertEqual(model.pairs[0][0], "same resolves yes if so")
+
+    def test_rerank_empty(self):
+        """Test that reranking nothing does not call the model."""
+        model = ScriptedCrossEncoder({})
+        self.assertEqual(CrossEncoderReranker(model).rerank([]), (set(), [])) #type: ignore
+        self.assertEqual(model.pairs, [])
+
+if __name__ == "__main__":
+    unittest.main()
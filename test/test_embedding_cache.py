@@ -0,0 +1,54 @@
+import unittest
+import tempfile
+import numpy as np
+from EmbeddingCache import EmbeddingCache
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = EmbeddingCache("test-model", self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_missing(self):
+        """Test that texts that were never added are reported missing."""
+        embeddings, missing = self.cache.get(["a", "b"])
+        self.assertEqual(embeddings, [None, None])
+        self.assertEqual(missing, [0, 1])
+
+    def test_add_and_reload(self):
+        """Test that added embeddings persist across cache instances and whitespace differences share an entry."""
+        self.cache.add(["will it rain?", "will it snow?"], np.array([[1, 0], [0, 1]]))
+        reloaded = EmbeddingCache("test-model", self.directory.name)
+        embeddings, missing = reloaded.get(["will it snow?", " will  it rain? ", "will it hail?"])
+        self.assertEqual(missing, [2])
+        np.testing.assert_array_equal(embeddings[0], [0, 1]) #type: ignore
+        np.testing.assert_array_equal(embeddings[1], [1, 0]) #type: ignore
+
+    def test_keyed_by_model(self):
+        """Test that the same text embedded by another model is not reused."""
+        self.cache.add(["a"], np.array([[1, 0]]))
+        other = EmbeddingCache("other-model", self.directory.name)
+        self.assertNotIn("a", other)
+
+    def test_retain_and_compact(self):
+        """Test that retained entries survive compaction and removed rows are reclaimed."""
+        self.cache.add(["a", "b", "c"], np.array([[1, 0], [0, 1], [1, 1]]))
+        self.assertEqual(self.cache.retain(["c", "a"]), 1)
+        self.cache.compact()
+        reloaded = EmbeddingCache("test-model", self.directory.name)
+        self.assertEqual(reloaded.size, 2)
+        embeddings, missing = reloaded.get(["a", "b", "c"])
+        self.assertEqual(missing, [1])
+        np.testing.assert_array_equal(embeddings[2], [1, 1]) #type: ignore
+
+    def test_remove(self):
+        """Test that removed texts are no longer returned."""
+        self.cache.add(["a", "b"], np.array([[1, 0], [0, 1]]))
+        self.assertEqual(self.cache.remove(["a", "z"]), 1)
+        self.assertNotIn("a", self.cache)
+        self.assertIn("b", self.cache)
+
+if __name__ == "__main__":
+    unittest.main()
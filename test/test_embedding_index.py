@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+from EmbeddingIndex import ExactIndex, IVFIndex, recall_report
+from constants import IVF_MIN_VECTORS
+
+class TestEmbeddingIndex(unittest.TestCase):
+    def setUp(self):
+        # clustered unit vectors so the approximate index has structure to exploit
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size = (40, 32))
+        self.embeddings = (centers[rng.integers(0, 40, 4000)] + rng.normal(scale = .3, size = (4000, 32))).astype(np.float32)
+        self.queries = (centers[rng.integers(0, 40, 200)] + rng.normal(scale = .3, size = (200, 32))).astype(np.float32)
+
+    def test_exact_matches_brute_force(self):
+        """Test that the exact index returns the highest cosine similarities in decreasing order."""
+        index = ExactIndex(chunk_size = 64)
+        index.build(self.embeddings)
+        scores, indices = index.query(self.queries, 5)
+        normalized = self.embeddings / np.linalg.norm(self.embeddings, axis = 1, keepdims = True)
+        similarities = (self.queries / np.linalg.norm(self.queries, axis = 1, keepdims = True)) @ normalized.T
+        np.testing.assert_array_equal(indices[:, 0], similarities.argmax(axis = 1))
+        np.testing.assert_allclose(scores[:, 0], similarities.max(axis = 1), rtol = 1e-5)
+        self.assertTrue((np.diff(scores, axis = 1) <= 0).all())
+
+    def test_ivf_probing_every_list_is_exact(self):
+        """Test that probing every inverted list gives the same neighbours as exact search."""
+        report = recall_report(IVFIndex(n_lists = 20, n_probe = 20, min_vectors = 0), self.embeddings, self.queries)
+        self.assertEqual(report["recall@1"], 1.0)
+        self.assertEqual(report["recall@5"], 1.0)
+
+    def test_ivf_recall(self):
+        """Test that probing a few of the lists still finds nearly all true nearest neighbours."""
+        report = recall_report(IVFIndex(n_lists = 64, n_probe = 8, min_vectors = 0), self.embeddings, self.queries)
+        self.assertGreater(report["recall@1"], .9)
+
+    def test_default_recall(self):
+        """Test that the default settings keep recall@1 above .95 on clustered embeddings just above IVF_MIN_VECTORS."""
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size = (1000, 64))
+        embeddings = (centers[rng.integers(0, 1000, IVF_MIN_VECTORS)] + rng.normal(scale = .6, size = (IVF_MIN_VECTORS, 64))).astype(np.float32)
+        queries = (centers[rng.integers(0, 1000, 500)] + rng.normal(scale = .6, size = (500, 64))).astype(np.float32)
+        report = recall_report(IVFIndex(), embeddings, queries)
+        self.assertGreater(report["recall@1"], .95)
+
+    def test_small_index_is_exact(self):
+        """Test that indexes below min_vectors fall back to exact search."""
+        report = recall_report(IVFIndex(n_probe = 1, min_vectors = 10**6), self.embeddings, self.queries)
+        self.assertEqual(report["recall@5"], 1.0)
+
+    def test_k_larger_than_index(self):
+        """Test that asking for more neighbours than indexed items returns every item."""
+        index = IVFIndex(min_vectors = 0, n_lists = 2, n_probe = 1)
+        index.build(self.embeddings[:3])
+        _, indices = index.query(self.queries[:2], 5)
+        self.assertEqual(indices.shape, (2, 3))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import json
+from llm_batches import trim_text, serialize_entry, pack_batches, build_prompt, estimate_tokens
+from constants import LLM_BATCH_BUDGET_FRACTION
+
+def make_entry(id, description_length = 100):
+    return {
+        "id" : id,
+        "market_1_id" : "K" + id,
+        "market_1_question" : "Will it rain in NYC tomorrow?",
+        "market_1_description" : "word " * (description_length // 5),
+        "market_2_id" : "P" + id,
+        "market_2_question" : "NYC rain tomorrow?",
+        "market_2_description" : "term " * (description_length // 5)
+    }
+
+class TestLLMBatches(unittest.TestCase):
+    def test_trim_text(self):
+        """Test that long text is cut at a word boundary within the limit and short text only has whitespace collapsed."""
+        self.assertEqual(trim_text("resolves  yes\nif it rains", 100), "resolves yes if it rains")
+        trimmed = trim_text("resolves yes if it rains", 15)
+        self.assertEqual(trimmed, "resolves yes…")
+        self.assertLessEqual(len(trimmed), 15)
+
+    def test_serialize_entry(self):
+        """Test that entries are sent with a short id, short keys and trimmed descriptions."""
+        line = json.loads(serialize_entry(make_entry("3f2a-uuid", 1000), "7", 50))
+        self.assertEqual(line["id"], "7")
+        self.assertEqual(line["q1"], "Will it rain in NYC tomorrow?")
+        self.assertLessEqual(len(line["d2"]), 50)
+        self.assertNotIn("market_1_id", line)
+
+    def test_estimate_tokens(self):
+        """Test that english text is estimated at four characters per token and digits and non-latin characters at a token each."""
+        self.assertEqual(estimate_tokens("will it rain in nyc"), 5)
+        self.assertEqual(estimate_tokens("2026-03-01"), 9)
+        self.assertEqual(estimate_tokens("明天纽约会下雨吗"), 9)
+
+    def test_pack_within_budget(self):
+        """Test that batches keep every entry in order and stay within the token budget, less the safety margin."""
+        entries = [make_entry(str(i), 100 * (i % 5 + 1)) for i in range(50)]
+        batches = pack_batches(entries, 1000, 600)
+        self.assertEqual([e for batch in batches for e in batch], entries)
+        for batch in batches:
+            prompt, _ = build_prompt("", batch, 600)
+            self.assertLessEqual(estimate_tokens(prompt), 1000 * LLM_BATCH_BUDGET_FRACTION + len(batch))
+
+    def test_oversized_entry_alone(self):
+        """Test that an entry larger than the budget is sent in its own batch."""
+        entries = [make_entry("a"), make_entry("b", 5000), make_entry("c")]
+        self.assertEqual([len(b) for b in pack_batches(entries, 200, 10000)], [1, 1, 1])
+
+    def test_build_prompt_maps_ids(self):
+        """Test that short ids in the prompt map back to the bet opportunity ids."""
+        prompt, short_ids = build_prompt("prefix\n", [make_entry("uuid-a"), make_entry("uuid-b")], 600)
+        self.assertTrue(prompt.startswith("prefix\n"))
+        self.assertEqual(short_ids, {"0" : "uuid-a", "1" : "uuid-b"})
+        self.assertNotIn("uuid-a", prompt)
+
+if __name__ == "__main__":
+    unittest.main()
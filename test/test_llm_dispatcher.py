@@ -0,0 +1,111 @@
+import unittest
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from LLMDispatcher import LLMBatchDispatcher, RateLimiter
+from constants import LLM, LLM_INFO
+
+class StubChatCompletions(BaseHTTPRequestHandler):
+    """OpenAI compatible chat completions endpoint replaying scripted responses per prompt.
+
+    Each script entry is a status code with the content to return, and the last entry repeats once the script runs out.
+    """
+
+    def do_POST(self):
+        server = self.server
+        prompt = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["messages"][0]["content"]
+        with server.lock: #type: ignore
+            server.in_flight += 1 #type: ignore
+            server.max_in_flight = max(server.max_in_flight, server.in_flight) #type: ignore
+            script = server.scripts.get(prompt, [(200, "[]")]) #type: ignore
+            status, content = script.pop(0) if len(script) > 1 else script[0]
+        time.sleep(server.latency) #type: ignore
+        if status == 200:
+            body = {"id" : "stub", "object" : "chat.completion", "created" : 0, "model" : "stub",
+                    "choices" : [{"index" : 0, "message" : {"role" : "assistant", "content" : content}, "finish_reason" : "stop"}],
+                    "usage" : {"prompt_tokens" : 1000, "completion_tokens" : 100, "total_tokens" : 1100}}
+        else:
+            body = {"error" : {"message" : content, "type" : "stub_error"}}
+        data = json.dumps(body).encode("utf-8")
+        with server.lock: #type: ignore
+            server.in_flight -= 1 #type: ignore
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestLLMBatchDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubChatCompletions)
+        self.server.lock = threading.Lock() #type: ignore
+        self.server.scripts = {} #type: ignore
+        self.server.latency = 0.0 #type: ignore
+        self.server.in_flight = 0 #type: ignore
+        self.server.max_in_flight = 0 #type: ignore
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self.completion_cost = (1000 * LLM_INFO[LLM.openai_4o_mini]["cost_per_1m_input_tokens"] + 100 * LLM_INFO[LLM.openai_4o_mini]["cost_per_1m_output_tokens"]) / 10**6
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_dispatcher(self, **kwargs) -> LLMBatchDispatcher:
+        return LLMBatchDispatcher(LLM.openai_4o_mini, api_key="test", base_url=self.base_url, retry_base_delay=0.01, **kwargs)
+
+    def test_retries_rate_limits_and_server_errors(self):
+        """Test that 429 and 5xx responses are retried and only the successful completion is charged."""
+        self.server.scripts["p"] = [(429, "slow down"), (500, "oops"), (200, '["a"]')] #type: ignore
+        [result] = self.make_dispatcher().dispatch(["p"], json.loads)
+        self.assertEqual(result.result, ["a"])
+        self.assertAlmostEqual(result.cost, self.completion_cost)
+
+    def test_gives_up_after_max_retries(self):
+        """Test that a batch that keeps failing is reported as failed without raising."""
+        self.server.scripts["p"] = [(503, "unavailable")] #type: ignore
+        [result] = self.make_dispatcher(max_retries=2).dispatch(["p"], json.loads)
+        self.assertIsNone(result.result)
+        self.assertEqual(result.cost, 0.0)
+
+    def test_resubmits_unparseable_responses(self):
+        """Test that a batch whose response is not valid json is re-submitted and every completion is charged."""
+        self.server.scripts["p"] = [(200, "here are the ids: a"), (200, '["a"]')] #type: ignore
+        [result] = self.make_dispatcher().dispatch(["p"], json.loads)
+        self.assertEqual(result.result, ["a"])
+        self.assertAlmostEqual(result.cost, 2 * self.completion_cost)
+
+    def test_concurrency_limit(self):
+        """Test that batches run concurrently without exceeding the concurrency limit and results keep prompt order."""
+        self.server.latency = 0.05 #type: ignore
+        for i in range(12):
+            self.server.scripts[str(i)] = [(200, json.dumps([str(i)]))] #type: ignore
+        results = self.make_dispatcher(max_concurrency=4).dispatch([str(i) for i in range(12)], json.loads)
+        self.assertEqual([r.result for r in results], [[str(i)] for i in range(12)])
+        self.assertLessEqual(self.server.max_in_flight, 4) #type: ignore
+        self.assertGreater(self.server.max_in_flight, 1) #type: ignore
+
+class TestRateLimiter(unittest.TestCase):
+    def test_requests_per_minute(self):
+        """Test that a request over the requests budget waits for the oldest request to leave the window."""
+        limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=None)
+        limiter.record(1, now=0)
+        limiter.record(1, now=10)
+        self.assertAlmostEqual(limiter.get_delay(1, now=20), 40)
+        self.assertEqual(limiter.get_delay(1, now=61), 0)
+
+    def test_tokens_per_minute(self):
+        """Test that a request over the tokens budget waits until enough tokens are freed."""
+        limiter = RateLimiter(requests_per_minute=None, tokens_per_minute=100)
+        limiter.record(50, now=0)
+        limiter.record(40, now=5)
+        self.assertEqual(limiter.get_delay(10, now=6), 0)
+        self.assertAlmostEqual(limiter.get_delay(20, now=6), 54)
+        self.assertAlmostEqual(limiter.get_delay(70, now=6), 59)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+import threading
+from types import SimpleNamespace
+from MarketEvents import DirtyMarkets, OpportunityIndex
+
+def make_bet_opportunity(id, market_1, market_2):
+    return SimpleNamespace(id = id, market_1 = SimpleNamespace(platform = "Kalshi", id = market_1),
+                           market_2 = SimpleNamespace(platform = "Polymarket", id = market_2))
+
+class TestMarketEvents(unittest.TestCase):
+    def test_affected_bet_opportunities(self):
+        """Test that only bet opportunities with a changed market are found, once each and in index order."""
+        index = OpportunityIndex([make_bet_opportunity("a", "K1", "P1"), make_bet_opportunity("b", "K2", "P1"), make_bet_opportunity("c", "K3", "P3")])
+        affected = index.get_affected({("Polymarket", "P1"), ("Kalshi", "K2"), ("Kalshi", "P3")})
+        self.assertEqual([bo.id for bo in affected], ["a", "b"])
+        self.assertEqual(index.get_affected(set()), [])
+
+    def test_take_batches_marked_markets(self):
+        """Test that marks made during the batch window are taken together and the set is cleared."""
+        dirty = DirtyMarkets()
+        self.assertEqual(dirty.take(timeout = 0, batch_window = 0), set())
+        timer = threading.Timer(.05, dirty.mark, ("Kalshi", "K1"))
+        timer.start()
+        second = threading.Timer(.1, dirty.mark, ("Kalshi", "K2"))
+        second.start()
+        self.assertEqual(dirty.take(timeout = 5, batch_window = .3), {("Kalshi", "K1"), ("Kalshi", "K2")})
+        self.assertEqual(dirty.take(timeout = 0, batch_window = 0), set())
+
+if __name__ == "__main__":
+    unittest.main()
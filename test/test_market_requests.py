@@ -0,0 +1,62 @@
+import unittest
+import threading
+import time
+from types import SimpleNamespace
+from market_requests import iter_market_results
+
+class StubPlatform:
+    """Stands in for the betting platforms, answering orderbook requests after a delay and recording the requests in flight"""
+
+    def __init__(self, failing_ids : set[str] = set()):
+        self.failing_ids = failing_ids
+        self.lock = threading.Lock()
+        self.requests : list[str] = []
+        self.in_flight : dict[str, int] = {}
+        self.max_in_flight : dict[str, int] = {}
+
+    def get_orderbooks(self, market):
+        with self.lock:
+            self.requests.append(market.id)
+            self.in_flight[market.platform] = self.in_flight.get(market.platform, 0) + 1
+            self.max_in_flight[market.platform] = max(self.max_in_flight.get(market.platform, 0), self.in_flight[market.platform])
+        time.sleep(.02)
+        with self.lock:
+            self.in_flight[market.platform] -= 1
+        if market.id in self.failing_ids:
+            raise ConnectionError(market.id)
+        return [market.id + " yes", market.id + " no"]
+
+def make_bet_opportunity(id, kalshi_id, polymarket_id):
+    return SimpleNamespace(id = id, market_1 = SimpleNamespace(platform = "Kalshi", id = kalshi_id),
+                           market_2 = SimpleNamespace(platform = "Polymarket", id = polymarket_id))
+
+class TestIterMarketResults(unittest.TestCase):
+    def setUp(self):
+        # 12 bet opportunities over 4 Kalshi and 6 Polymarket markets
+        self.bet_opportunities = [make_bet_opportunity(str(i), f"K{i % 4}", f"P{i % 6}") for i in range(12)]
+
+    def test_each_bet_opportunity_once_and_each_market_once(self):
+        """Test that every bet opportunity is yielded once with its markets' results and shared markets are requested once."""
+        platform = StubPlatform()
+        results = list(iter_market_results(self.bet_opportunities, platform.get_orderbooks, {"Kalshi" : 2, "Polymarket" : 3}))
+        self.assertEqual(sorted(bo.id for bo, _, _ in results), sorted(bo.id for bo in self.bet_opportunities))
+        for bo, market_1_result, market_2_result in results:
+            self.assertEqual(market_1_result, [bo.market_1.id + " yes", bo.market_1.id + " no"])
+            self.assertEqual(market_2_result, [bo.market_2.id + " yes", bo.market_2.id + " no"])
+        self.assertEqual(sorted(platform.requests), sorted([f"K{i}" for i in range(4)] + [f"P{i}" for i in range(6)]))
+
+    def test_concurrency_per_platform(self):
+        """Test that in-flight requests never exceed each platform's maximum concurrency."""
+        platform = StubPlatform()
+        list(iter_market_results(self.bet_opportunities, platform.get_orderbooks, {"Kalshi" : 2, "Polymarket" : 3}))
+        self.assertLessEqual(platform.max_in_flight["Kalshi"], 2)
+        self.assertLessEqual(platform.max_in_flight["Polymarket"], 3)
+
+    def test_failed_market_skips_its_bet_opportunities(self):
+        """Test that bet opportunities with a market whose request failed are skipped and the rest are still yielded."""
+        platform = StubPlatform(failing_ids = {"P0"})
+        results = list(iter_market_results(self.bet_opportunities, platform.get_orderbooks, {"Kalshi" : 2, "Polymarket" : 3}))
+        self.assertEqual(sorted(bo.id for bo, _, _ in results), sorted(bo.id for bo in self.bet_opportunities if bo.market_2.id != "P0"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import tempfile
+import os
+import time
+import numpy as np
+from datetime import datetime, timezone
+from MarketSnapshot import MarketSnapshot, StringColumn, get_snapshot_path, use_snapshot, to_epoch_microseconds, from_epoch_microseconds
+
+COLUMNS = {
+    "platform" : ["Kalshi", "Polymarket", "Polymarket"],
+    "question" : ["Will it rain?", "Über 2°C warming by 2030? 🌡", ""],
+    "id" : ["K1", "0xabc", "0xdef"],
+    "yes_id" : [None, "111", "333"],
+    "no_id" : [None, "222", "444"],
+    "description" : ["Resolves yes if it rains.", "Résolution: NASA data.", "x" * 1000]
+}
+
+END_DATES = [datetime(2025, 2, 12, 14, 0, tzinfo=timezone.utc), datetime(2030, 12, 31, 23, 59, 59, 123456, tzinfo=timezone.utc),
+             datetime(1969, 7, 20, 20, 17, tzinfo=timezone.utc)]
+
+class TestMarketSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "kalshi.snapshot")
+        MarketSnapshot.write(self.path, COLUMNS, [to_epoch_microseconds(d) for d in END_DATES])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        """Test that string columns with unicode and nulls and microsecond end dates round trip."""
+        snapshot = MarketSnapshot(self.path)
+        self.assertEqual(len(snapshot), 3)
+        for name, values in COLUMNS.items():
+            self.assertEqual(snapshot.column(name).to_list(), values)
+            self.assertEqual([snapshot.column(name)[i] for i in range(3)], values)
+        self.assertEqual([from_epoch_microseconds(x) for x in snapshot.end_dates.tolist()], END_DATES)
+
+    def test_columns_are_memory_mapped(self):
+        """Test that columns are memory-mapped by default and loaded fully when mmap is off."""
+        self.assertIsInstance(MarketSnapshot(self.path).column("description").data, np.memmap)
+        self.assertNotIsInstance(MarketSnapshot(self.path, mmap=False).column("description").data, np.memmap)
+
+    def test_json_export_format(self):
+        """Test that exported rows match the BinaryMarketMetadata json format."""
+        row = MarketSnapshot(self.path).to_json()[1]
+        self.assertEqual(row["end_date"], "2030-12-31T23:59:59.123456Z")
+        self.assertEqual(row["yes_id"], "111")
+        self.assertEqual(MarketSnapshot(self.path).to_json()[0]["no_id"], None)
+
+    def test_overwrite(self):
+        """Test that writing a snapshot again replaces the old one."""
+        MarketSnapshot.write(self.path, {name : values[:1] for name, values in COLUMNS.items()}, [0])
+        snapshot = MarketSnapshot(self.path)
+        self.assertEqual(len(snapshot), 1)
+        self.assertEqual(snapshot.column("yes_id").to_list(), [None])
+
+    def test_empty_column(self):
+        """Test that a column without rows decodes to nothing."""
+        data, offsets, nulls = StringColumn.encode([])
+        self.assertEqual(StringColumn(data, offsets, nulls).to_list(), [])
+
+    def test_use_snapshot(self):
+        """Test that the snapshot is used unless it is missing or older than the json."""
+        json_filepath = os.path.join(self.directory.name, "kalshi.json")
+        self.assertEqual(get_snapshot_path(json_filepath), self.path)
+        self.assertTrue(use_snapshot(json_filepath))
+        with open(json_filepath, "w") as f:
+            f.write("[]")
+        later = time.time() + 10
+        os.utime(json_filepath, (later, later))
+        self.assertFalse(use_snapshot(json_filepath))
+        self.assertFalse(use_snapshot(os.path.join(self.directory.name, "polymarket.json")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+import asyncio
+import json
+import threading
+import time
+from websockets.asyncio.server import serve
+from MarketStream import MarketDataStream, KalshiFeed, PolymarketFeed, SequenceGap
+
+KALSHI_MESSAGES = [
+    {"type" : "subscribed", "id" : 1, "msg" : {"channel" : "orderbook_delta", "sid" : 1}},
+    {"type" : "orderbook_snapshot", "sid" : 1, "seq" : 1, "msg" : {"market_ticker" : "K1", "yes" : [[40, 10], [42, 5]], "no" : [[55, 8]]}},
+    {"type" : "orderbook_delta", "sid" : 1, "seq" : 2, "msg" : {"market_ticker" : "K1", "price" : 42, "delta" : -5, "side" : "yes"}},
+    # seq 3 is missing, so the book is fetched over REST
+    {"type" : "orderbook_delta", "sid" : 1, "seq" : 4, "msg" : {"market_ticker" : "K1", "price" : 44, "delta" : 3, "side" : "yes"}},
+    {"type" : "orderbook_delta", "sid" : 1, "seq" : 5, "msg" : {"market_ticker" : "K1", "price" : 57, "delta" : 2, "side" : "no"}}
+]
+
+KALSHI_REST_ORDERBOOKS = {"K1" : {"yes" : [[40, 10], [44, 3]], "no" : [[55, 8]]}}
+
+POLYMARKET_MESSAGES = [
+    [
+        {"event_type" : "book", "asset_id" : "yes-token", "bids" : [{"price" : ".48", "size" : "100"}], "asks" : [{"price" : ".52", "size" : "50"}]},
+        {"event_type" : "book", "asset_id" : "no-token", "bids" : [{"price" : ".47", "size" : "80"}], "asks" : [{"price" : ".53", "size" : "60"}]}
+    ],
+    {"event_type" : "price_change", "price_changes" : [
+        {"asset_id" : "yes-token", "price" : ".51", "size" : "20", "side" : "SELL"},
+        {"asset_id" : "no-token", "price" : ".47", "size" : "0", "side" : "BUY"}
+    ]}
+]
+
+class ReplayServer:
+    """Local websocket server that records the subscribe message of each connection then replays a fixed list of messages"""
+
+    def __init__(self, messages : list):
+        self.messages = messages
+        self.subscriptions : list = []
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target = lambda: asyncio.run(self.run()), daemon = True)
+        self.thread.start()
+        self.ready.wait(5)
+
+    async def handler(self, websocket):
+        self.subscriptions.append(json.loads(await websocket.recv()))
+        for message in self.messages:
+            await websocket.send(json.dumps(message))
+        await websocket.wait_closed()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        async with serve(self.handler, "localhost", 0) as server:
+            self.url = f"ws://localhost:{server.sockets[0].getsockname()[1]}" #type: ignore
+            self.ready.set()
+            await self.stopped.wait()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.stopped.set)
+        self.thread.join(5)
+
+def wait_for(condition, timeout = 5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(.01)
+    return False
+
+class TestMarketFeeds(unittest.TestCase):
+    def test_kalshi_sequence_gap(self):
+        """Test that a skipped Kalshi sequence number raises a gap for every subscribed market."""
+        feed = KalshiFeed(lambda ticker: KALSHI_REST_ORDERBOOKS[ticker], url = "")
+        feed.set_markets([{"platform" : "Kalshi", "id" : "K1", "yes_id" : None, "no_id" : None}])
+        books = {}
+        self.assertEqual(feed.handle_message(KALSHI_MESSAGES[1], books), {"K1"})
+        self.assertEqual(feed.handle_message(KALSHI_MESSAGES[2], books), {"K1"})
+        self.assertEqual(books["K1"][0].get_top_bids(5), [{"price" : .40, "size" : 10}])
+        with self.assertRaises(SequenceGap) as gap:
+            feed.handle_message(KALSHI_MESSAGES[3], books)
+        self.assertEqual(gap.exception.market_ids, {"K1"})
+
+    def test_polymarket_change_before_book(self):
+        """Test that a Polymarket price change to a book without a snapshot raises a gap."""
+        feed = PolymarketFeed(lambda token: {"bids" : [], "asks" : []}, url = "")
+        feed.set_markets([{"platform" : "Polymarket", "id" : "P1", "yes_id" : "yes-token", "no_id" : "no-token"}])
+        with self.assertRaises(SequenceGap):
+            feed.handle_message(POLYMARKET_MESSAGES[1], {})
+
+    def test_polymarket_synced_after_both_books(self):
+        """Test that a Polymarket market is only synced once both of its tokens sent a book."""
+        feed = PolymarketFeed(lambda token: {"bids" : [], "asks" : []}, url = "")
+        feed.set_markets([{"platform" : "Polymarket", "id" : "P1", "yes_id" : "yes-token", "no_id" : "no-token"}])
+        books = {}
+        yes_book, no_book = POLYMARKET_MESSAGES[0]
+        self.assertEqual(feed.handle_message(yes_book, books), set())
+        self.assertEqual(feed.handle_message({"event_type" : "price_change", "price_changes" : [
+            {"asset_id" : "yes-token", "price" : ".50", "size" : "5", "side" : "SELL"}]}, books), set())
+        self.assertNotIn("P1", books)
+        self.assertEqual(feed.handle_message(no_book, books), {"P1"})
+        self.assertEqual(books["P1"][0].get_best_ask(), {"price" : .50, "size" : 5.0})
+        self.assertEqual(books["P1"][1].get_best_bid(), {"price" : .47, "size" : 80.0})
+
+class TestMarketDataStream(unittest.TestCase):
+    def setUp(self):
+        self.kalshi_server = ReplayServer(KALSHI_MESSAGES)
+        self.polymarket_server = ReplayServer(POLYMARKET_MESSAGES)
+        self.resynced = []
+        def fetch_orderbook(ticker):
+            self.resynced.append((ticker, self.stream.is_synced("Kalshi", ticker)))
+            return KALSHI_REST_ORDERBOOKS[ticker]
+        self.stream = MarketDataStream([
+            KalshiFeed(fetch_orderbook, url = self.kalshi_server.url),
+            PolymarketFeed(lambda token: {"bids" : [], "asks" : []}, url = self.polymarket_server.url)
+        ])
+        self.updates = []
+        self.stream.add_listener(lambda platform, market_id: self.updates.append((platform, market_id)))
+
+    def tearDown(self):
+        self.stream.stop()
+        self.kalshi_server.stop()
+        self.polymarket_server.stop()
+
+    def test_replayed_feeds(self):
+        """Test that replayed snapshots and deltas build the books, with a REST resync after a sequence gap."""
+        self.stream.set_markets([
+            {"platform" : "Kalshi", "id" : "K1", "yes_id" : None, "no_id" : None},
+            {"platform" : "Polymarket", "id" : "P1", "yes_id" : "yes-token", "no_id" : "no-token"}
+        ])
+        self.stream.start()
+        self.assertTrue(wait_for(lambda: self.updates.count(("Kalshi", "K1")) == 4 and self.updates.count(("Polymarket", "P1")) == 2))
+        self.assertEqual(self.kalshi_server.subscriptions[0]["params"], {"channels" : ["orderbook_delta"], "market_tickers" : ["K1"]})
+        self.assertEqual(self.polymarket_server.subscriptions[0], {"assets_ids" : ["yes-token", "no-token"], "type" : "market"})
+        # the book that missed messages is not served while it is fetched again
+        self.assertEqual(self.resynced, [("K1", False)])
+
+        yes_orderbook, no_orderbook = self.stream.get_orderbooks("Kalshi", "K1") #type: ignore
+        self.assertEqual(yes_orderbook.bid_prices.tolist(), [.44, .40])
+        self.assertEqual(yes_orderbook.ask_prices.tolist(), [.43, .45])
+        self.assertEqual(self.stream.get_quote("Kalshi", "K1"), {"yes_ask" : .43, "no_ask" : .56, "yes_bid" : .44, "no_bid" : .57})
+        self.assertEqual(self.stream.get_quote("Polymarket", "P1"), {"yes_ask" : .51, "no_ask" : .53, "yes_bid" : .48, "no_bid" : None})
+        self.assertIsNone(self.stream.get_quote("Kalshi", "K2"))
+
+class TestMarketDataStreamRecovery(unittest.TestCase):
+    def test_reconnects_after_bad_message(self):
+        """Test that a message the feed can't apply drops its books and reconnects instead of ending the feed."""
+        server = ReplayServer([POLYMARKET_MESSAGES[0], {"event_type" : "price_change", "price_changes" : [{"asset_id" : "yes-token", "price" : ".5", "size" : "1"}]}])
+        stream = MarketDataStream([PolymarketFeed(lambda token: {"bids" : [], "asks" : []}, url = server.url)], reconnect_delay = .05)
+        try:
+            stream.set_markets([{"platform" : "Polymarket", "id" : "P1", "yes_id" : "yes-token", "no_id" : "no-token"}])
+            stream.start()
+            self.assertTrue(wait_for(lambda: len(server.subscriptions) >= 2))
+        finally:
+            stream.stop()
+            server.stop()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import numpy as np
+from QuestionMap import QuestionMap
+from test.test_question_map import make_session, make_market, market_ids, build, KALSHI, POLYMARKET
+
+def get_best_match_by_platform_by_encoding(question_map : QuestionMap, nlp) -> dict[str, list[str]]:
+    """Best match selection as it was before matching sessions, encoding each candidate's question for every unique question"""
+    out = {}
+    for question, entry in question_map.items():
+        unique_platforms = {i.platform for i in entry}
+        if len(unique_platforms) > 1:
+            new_entry = []
+            for platform in unique_platforms:
+                platform_questions = [i.question for i in entry if i.platform == platform]
+                platform_ids = [i.id for i in entry if i.platform == platform]
+                _, [(best_id, _)] = nlp.get_k_similar_questions(question, platform_questions, nlp.encode_questions(platform_questions), 1, question_ids = platform_ids)
+                new_entry.append(next(i for i in entry if i.id == best_id))
+            entry = new_entry
+        out[question] = sorted(m.id for m in entry)
+    return out
+
+class TestMatchingSession(unittest.TestCase):
+    def setUp(self):
+        self.session = make_session()
+        self.model = self.session.nlp.model
+
+    def test_best_match(self):
+        """Test that the best match is the candidate market most similar to the unique question."""
+        rain, new_york, nyc, fed = KALSHI[0], POLYMARKET[0], POLYMARKET[1], POLYMARKET[2]
+        question_embedding = self.session.embed_markets([rain])[0]
+        self.assertIs(self.session.best_match(question_embedding, [nyc, fed, new_york]), new_york)
+        self.assertIs(self.session.best_match(question_embedding, [fed, nyc]), nyc)
+
+    def test_embed_markets_encodes_each_market_once(self):
+        """Test that a market's question is only encoded the first time the market is embedded."""
+        first = self.session.embed_markets(KALSHI[:2])
+        second = self.session.embed_markets([KALSHI[1], KALSHI[0], KALSHI[1]])
+        self.assertEqual(self.model.encoded, ["will it rain in nyc tomorrow?", "will the fed cut rates?"])
+        np.testing.assert_array_equal(second, first[[1, 0, 1]])
+        np.testing.assert_allclose(np.linalg.norm(second, axis = 1), 1, rtol = 1e-6)
+
+    def test_embed_unique_questions_reuses_founder(self):
+        """Test that a unique question reuses its founding market's embedding and only questions without a founder are encoded."""
+        founder_embedding = self.session.embed_markets([KALSHI[0]])[0]
+        self.model.encoded.clear()
+        questions = ["will it rain in nyc tomorrow?", "will the fed cut rates?"]
+        # the market that founded the fed question has closed
+        embeddings = self.session.embed_unique_questions(questions, [[POLYMARKET[0], KALSHI[0]], [POLYMARKET[2]]])
+        np.testing.assert_array_equal(embeddings[0], founder_embedding)
+        np.testing.assert_allclose(embeddings[1], [0, 0, 1, 0], atol = 1e-6)
+        self.assertEqual(self.model.encoded, ["will the fed cut rates?"])
+
+    def test_best_match_by_platform_unchanged(self):
+        """Test that best matches picked from session embeddings are the ones picked by encoding each candidate."""
+        candidates = POLYMARKET + [make_market("Polymarket", "P3", "Bitcoin above 100k?")]
+        candidate_map, active_map = build([KALSHI, candidates], self.session)
+        self.assertEqual(market_ids(active_map), get_best_match_by_platform_by_encoding(candidate_map, make_session().nlp))
+
+if __name__ == "__main__":
+    unittest.main()
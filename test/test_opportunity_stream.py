@@ -0,0 +1,75 @@
+import unittest
+import json
+from BetOpportunitySnapshot import BetOpportunitySnapshot
+from OpportunityStream import OpportunityStream, StreamClient, diff_snapshots
+
+def make_bet_opportunity(id, absolute_return, annualized_return):
+    return {
+        "question" : f"question {id}",
+        "id" : id,
+        "market_1" : {"id" : f"K{id}", "platform" : "Kalshi", "end_date" : "2026-01-01T00:00:00.000000Z"},
+        "market_2" : {"id" : f"P{id}", "platform" : "Polymarket", "end_date" : "2026-06-01T00:00:00.000000Z"},
+        "absolute_return" : absolute_return,
+        "annualized_return" : annualized_return,
+        "last_update" : "2025-02-01T00:00:00+00:00"
+    }
+
+OLD = BetOpportunitySnapshot(1, [
+    make_bet_opportunity("a", [-.1, -.1], [-.2, -.2]),
+    make_bet_opportunity("b", [.1, .1], [.2, .2]),
+    make_bet_opportunity("c", [.1, .1], [None, None]),
+    make_bet_opportunity("d", [.1, .1], [.2, .2])
+])
+
+NEW = BetOpportunitySnapshot(2, [
+    make_bet_opportunity("a", [.1, .1], [.3, .3]),
+    make_bet_opportunity("b", [-.1, -.1], [.2, .2]),
+    make_bet_opportunity("c", [.1, .1], [.3, .3]),
+    make_bet_opportunity("e", [0, 0], [0, 0])
+])
+
+THRESHOLDS = {"absolute_return" : 0, "annualized_return" : .5}
+
+class TestOpportunityStream(unittest.TestCase):
+    def test_diff_snapshots(self):
+        """Test that new, removed and threshold crossing bet opportunities are reported, with missing returns below every threshold."""
+        events = diff_snapshots(OLD, NEW, THRESHOLDS) #type: ignore
+        self.assertEqual([event["type"] for event in events], ["new", "removed", "crossed", "crossed", "crossed"])
+        data = [json.loads(event["data"]) for event in events]
+        self.assertEqual(data[0]["bet_opportunity"]["id"], "e")
+        self.assertEqual(data[1], {"version" : 2, "id" : "d"})
+        crossed = {d["bet_opportunity"]["id"] : d["crossed"] for d in data[2:]}
+        self.assertEqual(crossed, {
+            "a" : [{"field" : "absolute_return", "threshold" : 0, "direction" : "above"}, {"field" : "annualized_return", "threshold" : .5, "direction" : "above"}],
+            "b" : [{"field" : "absolute_return", "threshold" : 0, "direction" : "below"}],
+            "c" : [{"field" : "annualized_return", "threshold" : .5, "direction" : "above"}]
+        })
+
+    def test_slow_client_drops_to_snapshot(self):
+        """Test that a full client queue is replaced by one snapshot event and later events queue after it."""
+        client = StreamClient(THRESHOLDS, max_events = 3) #type: ignore
+        client.put([{"type" : "new", "data" : str(i)} for i in range(5)])
+        self.assertEqual(client.get(0)["type"], "snapshot") #type: ignore
+        self.assertIsNone(client.get(0))
+        self.assertEqual(client.dropped, 5)
+        client.put([{"type" : "removed", "data" : "x"}])
+        self.assertEqual(client.get(0)["type"], "removed") #type: ignore
+
+    def test_publish_to_clients(self):
+        """Test that clients start with the snapshot and only get events for newer snapshots."""
+        snapshots = [OLD]
+        stream = OpportunityStream(lambda: snapshots[-1], poll_interval = 60)
+        client = stream.subscribe(THRESHOLDS) #type: ignore
+        first = stream.render(client.get(0)) #type: ignore
+        self.assertTrue(first.startswith("event: snapshot\ndata: "))
+        self.assertEqual(len(json.loads(first.split("data: ", 1)[1])["data"]), 4)
+        stream.publish(OLD)
+        self.assertIsNone(client.get(0))
+        stream.publish(NEW)
+        self.assertEqual(client.events.qsize(), 5)
+        stream.publish(OLD)
+        self.assertEqual(client.events.qsize(), 5)
+        stream.unsubscribe(client)
+
+if __name__ == "__main__":
+    unittest.main()
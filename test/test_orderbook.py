@@ -0,0 +1,80 @@
+import unittest
+from OrderBook import OrderBook, OrderbookData, PriceLevels, get_complementary_orderbooks, copy_orderbooks
+from orderbook_returns import get_effective_price
+
+class TestOrderBook(unittest.TestCase):
+    def setUp(self):
+        data : OrderbookData = {
+            "asks" : [{"price": 0.67, "size": 200.0}, {"price": 0.65, "size": 50.0}, {"price": 0.98, "size": 590.0}],
+            "bids" : [{"price": 0.60, "size": 100.0}, {"price": 0.62, "size": 40.0}]
+        }
+        self.orderbook = OrderBook(data)
+
+    def test_to_json_sorted(self):
+        """Test that to_json returns asks by increasing price and bids by decreasing price."""
+        self.assertEqual(self.orderbook.to_json(), {
+            "asks" : [{"price": 0.65, "size": 50.0}, {"price": 0.67, "size": 200.0}, {"price": 0.98, "size": 590.0}],
+            "bids" : [{"price": 0.62, "size": 40.0}, {"price": 0.60, "size": 100.0}]
+        })
+
+    def test_best_orders(self):
+        """Test that the best ask and bid are the top of each side."""
+        self.assertEqual(self.orderbook.get_best_ask(), {"price": 0.65, "size": 50.0})
+        self.assertEqual(self.orderbook.get_best_bid(), {"price": 0.62, "size": 40.0})
+
+    def test_implied_ask_price_matches_walk(self):
+        """Test that the binary search fill price matches walking the sorted asks."""
+        asks = self.orderbook.get_sorted_asks()
+        for contracts in [1.0, 50.0, 51.0, 250.0, 300.0, 840.0]:
+            self.assertAlmostEqual(self.orderbook.implied_ask_price(contracts), get_effective_price(asks, contracts)) #type: ignore
+
+    def test_implied_bid_price(self):
+        """Test that selling through several bids averages the bid prices.
+
+        Selling 60 contracts: 40 at .62 and 20 at .60
+        Expected price = (40*.62 + 20*.60) / 60
+        """
+        self.assertAlmostEqual(self.orderbook.implied_bid_price(60.0), (40*.62 + 20*.60) / 60) #type: ignore
+
+    def test_insufficient_depth(self):
+        """Test that orders larger than the book return None."""
+        self.assertIsNone(self.orderbook.implied_ask_price(841.0))
+        self.assertIsNone(self.orderbook.implied_bid_price(141.0))
+        self.assertIsNone(OrderBook().implied_ask_price(1.0))
+
+    def test_deep_book(self):
+        """Test that a book deeper than the recursion limit can be walked."""
+        asks = [{"price": 0.5 + i / 10**6, "size": 1.0} for i in range(5000)]
+        self.assertAlmostEqual(get_effective_price(asks, 5000.0), sum(a["price"] for a in asks) / 5000) #type: ignore
+        self.assertAlmostEqual(OrderBook({"asks": asks, "bids": []}).implied_ask_price(5000.0), sum(a["price"] for a in asks) / 5000) #type: ignore
+
+    def test_apply_delta(self):
+        """Test that deltas add, resize and remove levels and depth queries see them."""
+        self.orderbook.implied_ask_price(1.0)
+        self.orderbook.apply_delta("asks", .60, 10.0)
+        self.orderbook.apply_delta("asks", .67, 0.0)
+        self.orderbook.apply_delta("bids", .62, 5.0)
+        self.assertEqual(self.orderbook.get_top_asks(2), [{"price": 0.60, "size": 10.0}, {"price": 0.65, "size": 50.0}])
+        self.assertEqual(self.orderbook.get_best_bid(), {"price": 0.62, "size": 5.0})
+        self.assertEqual(self.orderbook.ask_prices.tolist(), [.60, .65, .98])
+        self.assertAlmostEqual(self.orderbook.implied_ask_price(20.0), (10*.60 + 10*.65) / 20) #type: ignore
+        with self.assertRaises(ValueError):
+            self.orderbook.apply_delta("buys", .5, 1.0)
+
+    def test_complementary_orderbooks(self):
+        """Test that Kalshi yes and no orderbooks share one set of bids, with each side's asks at the other side's complement."""
+        yes_bids = PriceLevels([(40, 10.0), (42, 5.0)], descending = True, units = 100)
+        no_bids = PriceLevels([(55, 8.0)], descending = True, units = 100)
+        yes_orderbook, no_orderbook = get_complementary_orderbooks(yes_bids, no_bids)
+        self.assertEqual(yes_orderbook.to_json(), {"asks" : [{"price": .45, "size": 8.0}], "bids" : [{"price": .42, "size": 5.0}, {"price": .40, "size": 10.0}]})
+        self.assertEqual(no_orderbook.get_top_asks(5), [{"price": .58, "size": 5.0}, {"price": .60, "size": 10.0}])
+        copies = copy_orderbooks([yes_orderbook, no_orderbook])
+        # buying yes at .43 is a no bid at 57 cents
+        yes_orderbook.apply_delta("asks", .43, 2.0)
+        self.assertEqual(no_orderbook.get_best_bid(), {"price": .57, "size": 2.0})
+        self.assertEqual(yes_orderbook.ask_prices.tolist(), [.43, .45])
+        self.assertEqual(copies[0].ask_prices.tolist(), [.45])
+        self.assertIs(copies[0].asks.underlying, copies[1].bids) #type: ignore
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,8 @@
 import unittest
 from typing import TypedDict
-from OrderBook import Order
-from orderbook_returns import get_effective_price
+import random
+from OrderBook import Order, OrderBook
+from orderbook_returns import get_effective_price, get_optimal_trade
 
 class TestEffectivePrice(unittest.TestCase):
     def test_empty_orderbook(self):
@@ -54,5 +55,75 @@ class TestEffectivePrice(unittest.TestCase):
         ]
         self.assertEqual(get_effective_price(asks, 50), 10.8)
 
+class TestOptimalTrade(unittest.TestCase):
+    def brute_force_profit(self, yes_orderbook : OrderBook, no_orderbook : OrderBook, contracts : float) -> float:
+        yes_price = yes_orderbook.implied_ask_price(contracts)
+        no_price = no_orderbook.implied_ask_price(contracts)
+        if yes_price is None or no_price is None:
+            return float("-inf")
+        return contracts * (1 - yes_price - no_price)
+
+    def test_no_arbitrage(self):
+        """Test that books whose cheapest pair costs more than 1 return None."""
+        yes : OrderBook = OrderBook({"asks": [{"price": .6, "size": 10}], "bids": []})
+        no : OrderBook = OrderBook({"asks": [{"price": .5, "size": 10}], "bids": []})
+        self.assertIsNone(get_optimal_trade(yes, no, yes, no))
+
+    def test_stops_at_break_even(self):
+        """Test that the solver buys every pair priced under 1 and no more.
+
+        Yes asks: 10 @ .40, 10 @ .55
+        No asks: 15 @ .50, 10 @ .70
+        Pairs 0-10 cost .90, 10-15 cost 1.05, so the best size is 10 contracts.
+        """
+        m1_yes = OrderBook({"asks": [{"price": .40, "size": 10}, {"price": .55, "size": 10}], "bids": []})
+        m2_no = OrderBook({"asks": [{"price": .50, "size": 15}, {"price": .70, "size": 10}], "bids": []})
+        trade = get_optimal_trade(m1_yes, OrderBook(), OrderBook(), m2_no)
+        self.assertIsNotNone(trade)
+        self.assertEqual(trade["yes_market"], 1) #type: ignore
+        self.assertEqual(trade["contracts"], 10) #type: ignore
+        self.assertAlmostEqual(trade["profit"], 1.0) #type: ignore
+
+    def test_picks_better_direction(self):
+        """Test that the direction buying yes on market 2 is chosen when it is more profitable."""
+        expensive = OrderBook({"asks": [{"price": .60, "size": 100}], "bids": []})
+        cheap = OrderBook({"asks": [{"price": .30, "size": 100}], "bids": []})
+        trade = get_optimal_trade(expensive, cheap, cheap, expensive)
+        self.assertEqual(trade["yes_market"], 2) #type: ignore
+
+    def test_capital_cap(self):
+        """Test that a capital cap limits the size to what the capital can buy."""
+        yes = OrderBook({"asks": [{"price": .40, "size": 100}], "bids": []})
+        no = OrderBook({"asks": [{"price": .50, "size": 100}], "bids": []})
+        trade = get_optimal_trade(yes, OrderBook(), OrderBook(), no, max_capital = 45.0)
+        self.assertEqual(trade["contracts"], 50) #type: ignore
+
+    def test_hurdle_rate(self):
+        """Test that pairs returning less than the annualized hurdle are not bought.
+
+        Pairs at .90 return 11% over one year, pairs at .97 return 3%, so a 5% hurdle stops after the first level.
+        """
+        yes = OrderBook({"asks": [{"price": .40, "size": 10}, {"price": .47, "size": 10}], "bids": []})
+        no = OrderBook({"asks": [{"price": .50, "size": 20}], "bids": []})
+        trade = get_optimal_trade(yes, OrderBook(), OrderBook(), no, years_to_close = 1.0, min_annualized_return = .05)
+        self.assertEqual(trade["contracts"], 10) #type: ignore
+        self.assertAlmostEqual(trade["annualized_return"], 1 / .9 - 1) #type: ignore
+
+    def test_matches_brute_force(self):
+        """Test that the solver finds the same maximum profit as trying every whole contract size on random books."""
+        rng = random.Random(7)
+        for _ in range(50):
+            books = [OrderBook({
+                "asks": [{"price": round(rng.uniform(.2, .8), 2), "size": float(rng.randint(1, 30))} for _ in range(rng.randint(1, 6))],
+                "bids": []
+            }) for _ in range(4)]
+            m1_yes, m1_no, m2_yes, m2_no = books
+            trade = get_optimal_trade(m1_yes, m1_no, m2_yes, m2_no)
+            best = 0.0
+            for yes, no in [(m1_yes, m2_no), (m2_yes, m1_no)]:
+                for contracts in range(1, 200):
+                    best = max(best, self.brute_force_profit(yes, no, contracts))
+            self.assertAlmostEqual(trade["profit"] if trade else 0.0, best)
+
 if __name__ == "__main__":
     unittest.main()
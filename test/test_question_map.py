@@ -0,0 +1,165 @@
+import unittest
+import numpy as np
+import torch # type: ignore
+from datetime import datetime, timezone, timedelta
+from unittest.mock import patch
+from BinaryMarketMetadata import BinaryMarketMetadata
+from SemanticEquivalence import SemanticEquivalence
+from MatchingSession import MatchingSession
+from QuestionMap import QuestionMap
+from constants import IVF_MIN_VECTORS
+
+NOW = datetime(2026, 3, 1, tzinfo = timezone.utc)
+
+# embedding of each question, questions on the same topic have cosine similarity above the cutoff
+EMBEDDINGS = {
+    "will it rain in nyc tomorrow?" : [1, 0, 0, 0],
+    "rain in new york tomorrow?" : [.95, .3, 0, 0],
+    "will nyc see rain tomorrow?" : [.9, .43, 0, 0],
+    "will the fed cut rates?" : [0, 0, 1, 0],
+    "fed rate cut in march?" : [0, 0, .9, .43],
+    "will btc hit 100k?" : [0, 1, 0, 0],
+    "bitcoin above 100k?" : [0, .95, 0, .3],
+}
+
+class ScriptedSentenceTransformer:
+    """Stands in for a sentence transformer, embedding each question from a table by its normalized text and recording what it encoded"""
+
+    device = "cpu"
+
+    def __init__(self, embeddings : dict[str, list[float]] = EMBEDDINGS):
+        self.embeddings = embeddings
+        self.dimension = len(next(iter(embeddings.values())))
+        self.encoded : list[str] = []
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, questions, batch_size = 32, convert_to_tensor = False, convert_to_numpy = True):
+        self.encoded.extend(questions)
+        embeddings = np.array([self.embeddings[q.lower().strip()] for q in questions], dtype = np.float32).reshape(len(questions), self.dimension)
+        return torch.from_numpy(embeddings) if convert_to_tensor else embeddings
+
+def make_session(embeddings : dict[str, list[float]] = EMBEDDINGS) -> MatchingSession:
+    """Makes a matching session with the production defaults, embedding questions from a table"""
+    with patch("SemanticEquivalence.SentenceTransformer", lambda model_name: ScriptedSentenceTransformer(embeddings)):
+        return MatchingSession(SemanticEquivalence(use_embedding_cache = False))
+
+def make_market(platform, id, question, end_date = NOW + timedelta(days = 30)):
+    return BinaryMarketMetadata(platform, question, id, None, None, "", end_date)
+
+def build(questions_by_platform, session = None) -> tuple[QuestionMap, QuestionMap]:
+    """Builds the candidate map and the active map the way a full question map build does"""
+    session = session or make_session()
+    candidate_map = QuestionMap()
+    candidate_map.map_questions_across_platforms(questions_by_platform, session = session)
+    active_map = QuestionMap.from_json(candidate_map.to_json())
+    active_map.get_best_match_by_platform(session)
+    return candidate_map, active_map
+
+def market_ids(question_map : QuestionMap) -> dict[str, list[str]]:
+    return {question : sorted(m.id for m in entry) for question, entry in question_map.items()}
+
+KALSHI = [
+    make_market("Kalshi", "K1", "Will it rain in NYC tomorrow?"),
+    make_market("Kalshi", "K2", "Will the Fed cut rates?"),
+    make_market("Kalshi", "K3", "Will BTC hit 100k?")
+]
+POLYMARKET = [
+    make_market("Polymarket", "P1", "Rain in New York tomorrow?"),
+    make_market("Polymarket", "P1b", "Will NYC see rain tomorrow?"),
+    make_market("Polymarket", "P2", "Fed rate cut in March?")
+]
+# K2 expired, P2 closed and P3 was listed since the first build
+LATEST_KALSHI = [KALSHI[0], make_market("Kalshi", "K2", "Will the Fed cut rates?", NOW - timedelta(hours = 1)), KALSHI[2]]
+LATEST_POLYMARKET = POLYMARKET[:2] + [make_market("Polymarket", "P3", "Bitcoin above 100k?")]
+
+class TestQuestionMap(unittest.TestCase):
+    def test_build(self):
+        """Test that markets are mapped to the unique question of the most similar market on another platform."""
+        candidate_map, active_map = build([KALSHI, POLYMARKET])
+        self.assertEqual(market_ids(candidate_map), {
+            "will it rain in nyc tomorrow?" : ["K1", "P1", "P1b"],
+            "will the fed cut rates?" : ["K2", "P2"],
+            "will btc hit 100k?" : ["K3"]
+        })
+        self.assertEqual(market_ids(active_map)["will it rain in nyc tomorrow?"], ["K1", "P1"])
+
+    def test_batched_matches_per_question(self):
+        """Test that matching questions in batches gives the same map as matching them one at a time."""
+        questions_by_platform = [KALSHI, POLYMARKET + LATEST_POLYMARKET[2:]]
+        batched_map = QuestionMap()
+        batched_map.map_questions_across_platforms(questions_by_platform, batched = True, session = make_session())
+        per_question_map = QuestionMap()
+        per_question_map.map_questions_across_platforms(questions_by_platform, batched = False, session = make_session())
+        self.assertEqual(market_ids(batched_map), market_ids(per_question_map))
+        self.assertEqual(market_ids(batched_map)["will btc hit 100k?"], ["K3", "P3"])
+
+    def test_batched_matches_per_question_at_scale(self):
+        """Test that batched matching still gives the per-question map once there are more unique questions than IVF_MIN_VECTORS."""
+        rng = np.random.default_rng(0)
+        existing = rng.normal(size = (IVF_MIN_VECTORS + 2000, 16))
+        # each new question is a noisy copy of an existing one, so its true match is near the similarity cutoff
+        new = existing[rng.choice(len(existing), 300, replace = False)] + rng.normal(scale = .6, size = (300, 16))
+        embeddings = {f"kalshi {i}" : e.tolist() for i, e in enumerate(existing)} | {f"polymarket {i}" : e.tolist() for i, e in enumerate(new)}
+        questions_by_platform = [[make_market("Kalshi", f"K{i}", f"kalshi {i}") for i in range(len(existing))],
+                                 [make_market("Polymarket", f"P{i}", f"polymarket {i}") for i in range(len(new))]]
+        batched_map = QuestionMap()
+        batched_map.map_questions_across_platforms(questions_by_platform, batched = True, session = make_session(embeddings))
+        per_question_map = QuestionMap()
+        per_question_map.map_questions_across_platforms(questions_by_platform, batched = False, session = make_session(embeddings))
+        self.assertEqual(market_ids(batched_map), market_ids(per_question_map))
+
+    def test_remove_markets(self):
+        """Test that removing markets drops unique questions left without markets and reports every changed question."""
+        candidate_map, _ = build([KALSHI, POLYMARKET])
+        self.assertEqual(candidate_map.remove_markets({"K2", "P2", "P1b"}), {"will the fed cut rates?", "will it rain in nyc tomorrow?"})
+        self.assertEqual(candidate_map.market_ids(), {"K1", "P1", "K3"})
+        self.assertNotIn("will the fed cut rates?", candidate_map.keys())
+
+    def test_subset_copies_entries(self):
+        """Test that a subset only has the given questions that exist and does not share entry lists with the map."""
+        candidate_map, _ = build([KALSHI, POLYMARKET])
+        subset = candidate_map.subset(["will btc hit 100k?", "missing question"])
+        self.assertEqual(list(subset.keys()), ["will btc hit 100k?"])
+        subset["will btc hit 100k?"].append(POLYMARKET[0])
+        self.assertEqual(len(candidate_map["will btc hit 100k?"]), 1)
+
+    def test_new_markets_only_match_other_platforms(self):
+        """Test that new markets are only matched against unique questions without a market from their platform."""
+        candidate_map, _ = build([KALSHI, POLYMARKET])
+        new_market = make_market("Polymarket", "P4", "Will NYC see rain tomorrow?")
+        changed = candidate_map.map_questions_across_platforms([[], [new_market]], session = make_session())
+        # the rain question already has polymarket markets, so the new market founds its own unique question
+        self.assertEqual(changed, {"will nyc see rain tomorrow?"})
+        self.assertEqual(market_ids(candidate_map)["will nyc see rain tomorrow?"], ["P4"])
+
+    def test_update(self):
+        """Test that an update drops closed and expired markets, matches new ones and only re-selects best matches for changed questions."""
+        candidate_map, active_map = build([KALSHI, POLYMARKET])
+        unchanged_entry = active_map["will it rain in nyc tomorrow?"]
+        changed = candidate_map.update(active_map, [LATEST_KALSHI, LATEST_POLYMARKET], NOW, make_session())
+        self.assertEqual(changed, {"will the fed cut rates?", "will btc hit 100k?"})
+        self.assertEqual(market_ids(active_map), {"will it rain in nyc tomorrow?" : ["K1", "P1"], "will btc hit 100k?" : ["K3", "P3"]})
+        self.assertIs(active_map["will it rain in nyc tomorrow?"], unchanged_entry)
+
+    def test_update_matches_full_build(self):
+        """Test that updating a map gives the same candidate and active maps as building one from the latest markets."""
+        candidate_map, active_map = build([KALSHI, POLYMARKET])
+        candidate_map.update(active_map, [LATEST_KALSHI, LATEST_POLYMARKET], NOW, make_session())
+        open_markets = [[m for m in markets if m.end_date > NOW] for markets in [LATEST_KALSHI, LATEST_POLYMARKET]]
+        rebuilt_candidate_map, rebuilt_active_map = build(open_markets)
+        self.assertEqual(market_ids(candidate_map), market_ids(rebuilt_candidate_map))
+        self.assertEqual(market_ids(active_map), market_ids(rebuilt_active_map))
+
+    def test_update_without_changes(self):
+        """Test that an update with the same markets changes nothing and encodes nothing."""
+        candidate_map, active_map = build([KALSHI, POLYMARKET])
+        expected = market_ids(active_map)
+        session = make_session()
+        self.assertEqual(candidate_map.update(active_map, [KALSHI, POLYMARKET], NOW, session), set())
+        self.assertEqual(market_ids(active_map), expected)
+        self.assertEqual(session.nlp.model.encoded, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import threading
+from RefreshJobs import RefreshJobRunner, RefreshProgress
+from constants import RefreshStage, RefreshJobStatus
+
+class BlockingRefresh:
+    """Refresh that reports some progress then waits until released"""
+
+    def __init__(self, fail = False):
+        self.release = threading.Event()
+        self.calls = 0
+        self.fail = fail
+
+    def __call__(self, progress : RefreshProgress) -> int:
+        self.calls += 1
+        progress.start_stage(RefreshStage.load)
+        progress.finish_stage(RefreshStage.load)
+        progress.start_stage(RefreshStage.fetch_market_data)
+        progress.update_platform("Kalshi", 100, 250)
+        self.release.wait(5)
+        if self.fail:
+            raise ConnectionError("Kalshi unavailable")
+        return 42
+
+def wait_until_finished(job):
+    for thread in threading.enumerate():
+        if thread.name == f"refresh-{job.id}":
+            thread.join(5)
+
+class TestRefreshJobRunner(unittest.TestCase):
+    def test_submissions_coalesce_while_in_flight(self):
+        """Test that submitting during a refresh returns the in flight job and a new job starts once it finished."""
+        refresh = BlockingRefresh()
+        runner = RefreshJobRunner(refresh)
+        job, coalesced = runner.submit()
+        self.assertFalse(coalesced)
+        self.assertEqual(runner.submit(), (job, True))
+        refresh.release.set()
+        wait_until_finished(job)
+        self.assertEqual(job.status, RefreshJobStatus.succeeded)
+        self.assertEqual(job.total_opportunities, 42)
+        next_job, coalesced = runner.submit()
+        self.assertFalse(coalesced)
+        self.assertNotEqual(next_job.id, job.id)
+        wait_until_finished(next_job)
+        self.assertEqual(refresh.calls, 2)
+
+    def test_progress_reported_while_running(self):
+        """Test that the status of a running job shows its progress per stage and per platform."""
+        refresh = BlockingRefresh()
+        runner = RefreshJobRunner(refresh)
+        job, _ = runner.submit()
+        for _ in range(500):
+            if job.to_json()["platforms"]:
+                break
+            threading.Event().wait(.01)
+        status = runner.get(job.id).to_json() #type: ignore
+        self.assertEqual(status["status"], "running")
+        self.assertEqual(status["stages"]["load"], "done")
+        self.assertEqual(status["stages"]["fetch market data"], "running")
+        self.assertEqual(status["stages"]["publish"], "pending")
+        self.assertEqual(status["platforms"], {"Kalshi" : {"done" : 100, "total" : 250}})
+        refresh.release.set()
+        wait_until_finished(job)
+
+    def test_failed_job(self):
+        """Test that a refresh that raises marks its job and the stage it was in failed with the error."""
+        refresh = BlockingRefresh(fail = True)
+        refresh.release.set()
+        runner = RefreshJobRunner(refresh)
+        job, _ = runner.submit()
+        wait_until_finished(job)
+        self.assertEqual(job.status, RefreshJobStatus.failed)
+        self.assertEqual(job.error, "Kalshi unavailable")
+        self.assertIsNotNone(job.finished)
+        stages = job.to_json()["stages"]
+        self.assertEqual(stages["load"], "done")
+        self.assertEqual(stages["fetch market data"], "failed")
+        self.assertEqual(stages["publish"], "pending")
+
+    def test_finished_jobs_are_bounded(self):
+        """Test that only the most recent finished jobs are kept."""
+        refresh = BlockingRefresh()
+        refresh.release.set()
+        runner = RefreshJobRunner(refresh, max_finished_jobs = 2)
+        jobs = []
+        for _ in range(4):
+            job, _ = runner.submit()
+            wait_until_finished(job)
+            jobs.append(job)
+        runner.submit()
+        self.assertIsNone(runner.get(jobs[0].id))
+        self.assertIsNone(runner.get(jobs[1].id))
+        self.assertIsNotNone(runner.get(jobs[3].id))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from RefreshPlanner import RefreshPlanner, get_percentile_ranks
+import numpy as np
+
+NOW = datetime(2025, 2, 1, tzinfo = timezone.utc)
+
+def make_market(platform, id, days_to_close = 30):
+    return SimpleNamespace(platform = platform, id = id, end_date = NOW + timedelta(days = days_to_close))
+
+def make_bet_opportunity(market_1, market_2, absolute_return, minutes_old = 5):
+    return SimpleNamespace(market_1 = market_1, market_2 = market_2, absolute_return = absolute_return,
+                           last_update = NOW - timedelta(minutes = minutes_old))
+
+WEIGHTS = {"staleness" : .5, "closeness" : .3, "expiry" : .2}
+
+class TestRefreshPlanner(unittest.TestCase):
+    def test_markets_deduplicated(self):
+        """Test that a market shared by several bet opportunities is planned once."""
+        shared = make_market("Kalshi", "K1")
+        bet_opportunities = [make_bet_opportunity(shared, make_market("Polymarket", f"P{i}"), [0, 0]) for i in range(3)]
+        plan = RefreshPlanner(request_budget = {}).plan(bet_opportunities, {}, NOW)
+        self.assertEqual([m.id for m in plan["markets"]["Kalshi"]], ["K1"])
+        self.assertEqual(sorted(m.id for m in plan["markets"]["Polymarket"]), ["P0", "P1", "P2"])
+        self.assertEqual(plan["skipped"], {"Kalshi" : 0, "Polymarket" : 0})
+
+    def test_budget_keeps_highest_priority(self):
+        """Test that the budget keeps the stalest, closest to arbitrage and soonest closing markets, overdue markets first."""
+        polymarket = make_market("Polymarket", "P")
+        bet_opportunities = [
+            make_bet_opportunity(make_market("Kalshi", "near arbitrage"), polymarket, [-.01, -.5]),
+            make_bet_opportunity(make_market("Kalshi", "far from arbitrage"), polymarket, [-.4, -.5]),
+            make_bet_opportunity(make_market("Kalshi", "closes soon"), polymarket, [-.4, -.5]),
+            make_bet_opportunity(make_market("Kalshi", "overdue", days_to_close = 300), polymarket, [-.9, -.9])
+        ]
+        bet_opportunities[2].market_1.end_date = NOW + timedelta(days = 1)
+        last_refreshed = {("Kalshi", "overdue") : NOW - timedelta(hours = 2)}
+        planner = RefreshPlanner(request_budget = {"Kalshi" : 3}, markets_per_request = {"Kalshi" : 1}, weights = WEIGHTS, max_staleness = 3600) #type: ignore
+        plan = planner.plan(bet_opportunities, last_refreshed, NOW)
+        self.assertEqual([m.id for m in plan["markets"]["Kalshi"]], ["overdue", "near arbitrage", "closes soon"])
+        self.assertEqual(plan["skipped"]["Kalshi"], 1)
+
+    def test_percentile_ranks(self):
+        """Test that ranks scale from 0 for the smallest value to 1 for the largest, with missing returns lowest and ties averaged."""
+        self.assertEqual(get_percentile_ranks(np.array([3.0, -np.inf, 1.0])).tolist(), [1.0, 0.0, .5])
+        self.assertEqual(get_percentile_ranks(np.array([2.0, 1.0, 2.0])).tolist(), [.75, 0.0, .75])
+        self.assertEqual(get_percentile_ranks(np.array([7.0])).tolist(), [1.0])
+
+if __name__ == "__main__":
+    unittest.main()
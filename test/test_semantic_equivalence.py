@@ -0,0 +1,35 @@
+import unittest
+import tempfile
+import os
+from unittest.mock import patch
+from VerdictCache import VerdictCache
+from CrossEncoderReranker import CrossEncoderReranker
+from SemanticEquivalence import filter_bet_opportunities_with_llm_semantic_equivalence
+from constants import LLM, LLM_INFO
+from test.test_cross_encoder_reranker import ScriptedCrossEncoder, make_entry
+
+class TestLLMSemanticEquivalenceFilter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.directory.name, "verdicts.jsonl")
+        self.patcher = patch("SemanticEquivalence.VerdictCache", lambda model_name: VerdictCache(model_name, self.filepath))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.directory.cleanup()
+
+    def test_cached_verdicts_win_over_reranker(self):
+        """Test that cached verdicts are kept and only pairs without one are scored by the reranker."""
+        entries = [make_entry("a", "different"), make_entry("b", "same"), make_entry("c", "same")]
+        model_name = LLM_INFO[LLM.deepseek_v2]["model_name"]
+        VerdictCache(model_name, self.filepath).add(entries[:2], {"a"}, .02)
+        scripted = ScriptedCrossEncoder({"same" : .99, "different" : .01})
+        reranker = CrossEncoderReranker(scripted, accept_score = .9, reject_score = .1) #type: ignore
+        valid_ids, cost = filter_bet_opportunities_with_llm_semantic_equivalence(entries, LLM.deepseek_v2, reranker = reranker) #type: ignore
+        self.assertEqual(valid_ids, {"a", "c"})
+        self.assertEqual(cost, 0)
+        self.assertEqual(len(scripted.pairs), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from datetime import datetime, timezone, timedelta
+from dateutil import parser #type: ignore
+from utils import parse_timestamp, parse_canonical_timestamp, CANONICAL_TIMESTAMP_FORMAT
+
+class TestParseTimestamp(unittest.TestCase):
+    def setUp(self):
+        parse_timestamp.cache_clear()
+
+    def test_canonical_format_round_trips(self):
+        """Test that timestamps written in the canonical format parse back to the same utc datetime."""
+        end_date = datetime(2030, 12, 31, 23, 59, 59, 123456, tzinfo=timezone.utc)
+        self.assertEqual(parse_canonical_timestamp(end_date.strftime(CANONICAL_TIMESTAMP_FORMAT)), end_date)
+        self.assertEqual(parse_timestamp("2026-03-01T15:00:00.000000Z").tzinfo, timezone.utc)
+
+    def test_matches_dateutil(self):
+        """Test that canonical, isoformat and other timestamps parse to the same instant as dateutil."""
+        for value in ["2026-03-01T15:00:00.000000Z", "2025-02-12T01:35:52.686083+00:00", "2025-02-12T01:35:52-05:00",
+                      "2025-12-31T00:00:00Z", "Feb 12 2025 14:00 UTC"]:
+            self.assertEqual(parse_timestamp(value), parser.parse(value).astimezone(timezone.utc), value)
+            self.assertEqual(parse_timestamp(value).utcoffset(), timedelta(0))
+
+    def test_non_canonical_formats_skip_fast_path(self):
+        """Test that the fixed-width parser rejects anything that is not exactly the canonical format."""
+        for value in ["2025-12-31T00:00:00Z", "2025-02-12T01:35:52.686083+00:00", "2025-13-01T00:00:00.000000Z", "x" * 27]:
+            self.assertIsNone(parse_canonical_timestamp(value), value)
+
+    def test_repeated_strings_are_memoized(self):
+        """Test that a repeated timestamp is only parsed once."""
+        for _ in range(3):
+            parse_timestamp("2026-03-01T15:00:00.000000Z")
+        info = parse_timestamp.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 2))
+
+if __name__ == "__main__":
+    unittest.main()
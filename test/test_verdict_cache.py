@@ -0,0 +1,60 @@
+import unittest
+import tempfile
+import os
+from VerdictCache import VerdictCache
+
+def make_entry(id, market_1_description = "resolves yes if it rains", market_2_description = "resolves yes on rain"):
+    return {
+        "id" : id,
+        "market_1_id" : "K1",
+        "market_1_question" : "will it rain?",
+        "market_1_description" : market_1_description,
+        "market_2_id" : "P1",
+        "market_2_question" : "rain tomorrow?",
+        "market_2_description" : market_2_description
+    }
+
+class TestVerdictCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.directory.name, "verdicts.jsonl")
+        self.cache = VerdictCache("test-model", self.filepath)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_reused_across_bet_opportunity_ids(self):
+        """Test that a verdict persists and is found for a new bet opportunity id over the same markets."""
+        self.cache.add([make_entry("a")], {"a"}, .02)
+        reloaded = VerdictCache("test-model", self.filepath)
+        self.assertTrue(reloaded.get(make_entry("b")))
+        self.assertAlmostEqual(reloaded.get_cost(make_entry("b")), .02)
+
+    def test_negative_verdicts_and_cost_split(self):
+        """Test that entries missing from the equivalent ids are cached as not equivalent and the request cost is split across entries."""
+        second = make_entry("b")
+        second["market_2_id"] = "P2"
+        self.cache.add([make_entry("a"), second], {"a"}, .02)
+        self.assertTrue(self.cache.get(make_entry("a")))
+        self.assertFalse(self.cache.get(second))
+        self.assertAlmostEqual(self.cache.get_cost(second), .01)
+
+    def test_description_change_invalidates(self):
+        """Test that changing either market's rules text misses the cache."""
+        self.cache.add([make_entry("a")], {"a"}, .01)
+        self.assertIsNone(self.cache.get(make_entry("a", market_1_description = "resolves yes if it rains in NYC")))
+        self.assertIsNone(self.cache.get(make_entry("a", market_2_description = "resolves yes on snow")))
+
+    def test_market_order_and_model(self):
+        """Test that swapping the markets shares a verdict while another model does not."""
+        self.cache.add([make_entry("a")], {"a"}, .01)
+        entry = make_entry("a")
+        swapped = {"id" : "a"}
+        for field in ["id", "question", "description"]:
+            swapped[f"market_1_{field}"] = entry[f"market_2_{field}"]
+            swapped[f"market_2_{field}"] = entry[f"market_1_{field}"]
+        self.assertTrue(self.cache.get(swapped))
+        self.assertIsNone(VerdictCache("other-model", self.filepath).get(entry))
+
+if __name__ == "__main__":
+    unittest.main()